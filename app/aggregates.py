@@ -0,0 +1,286 @@
+"""
+Incrementally maintained expense aggregates
+
+Count, sum, sum of squares, min and max are kept per category (plus one
+global row) in the expense_aggregates table, and count and total per day
+and per ISO week in the daily_rollups and weekly_rollups tables. All of
+them are updated in the same transaction as every expense write, so
+summary statistics and budget queries never need a full table scan. The
+same calls bump the data version used for ETags (app.caching) and stage
+the rows for the in-memory structures fed by app.changes.
+
+Recompute or check them from the command line:
+
+    python -m app.aggregates rebuild
+    python -m app.aggregates verify
+"""
+import argparse
+import math
+import sys
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, func, literal, or_, select, true, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app.models import Expense, ExpenseAggregate, DailyRollup, WeeklyRollup
+from app import changes
+from app.caching import bump_data_version
+from app.changes import ExpenseRow
+
+# Category key of the row holding the totals over all expenses
+GLOBAL_KEY = ""
+
+_table = ExpenseAggregate.__table__
+
+def week_start(day: date) -> date:
+    """Monday of the ISO week containing day"""
+    return day - timedelta(days=day.weekday())
+
+def _group(rows: Iterable[ExpenseRow]) -> Dict[str, List[float]]:
+    """Fold expense rows into [count, sum, squares, min, max] per category key"""
+    groups = {}
+    for _, category, amount, _ in rows:
+        for key in (category, GLOBAL_KEY):
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [1, amount, amount * amount, amount, amount]
+            else:
+                group[0] += 1
+                group[1] += amount
+                group[2] += amount * amount
+                group[3] = min(group[3], amount)
+                group[4] = max(group[4], amount)
+    return groups
+
+def _group_by_period(rows: Iterable[ExpenseRow]) -> Tuple[Dict[date, List[float]], Dict[date, List[float]]]:
+    """Fold expense rows into [count, sum] per day and per week start"""
+    days = {}
+    weeks = {}
+    for _, _, amount, when in rows:
+        day = when.date()
+        for groups, key in ((days, day), (weeks, week_start(day))):
+            group = groups.setdefault(key, [0, 0.0])
+            group[0] += 1
+            group[1] += amount
+    return days, weeks
+
+def _rollup_upsert(model, key_column: str):
+    """Insert a (key, count, total) rollup row or add it to the existing one"""
+    table = model.__table__
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[key_column]],
+        set_={
+            "count": table.c.count + stmt.excluded.count,
+            "total": table.c.total + stmt.excluded.total,
+        }
+    )
+
+# Built once and run with one parameter set per period (executemany)
+_ROLLUPS = (
+    (DailyRollup.__table__, "day", _rollup_upsert(DailyRollup, "day")),
+    (WeeklyRollup.__table__, "week_start", _rollup_upsert(WeeklyRollup, "week_start")),
+)
+
+def _record_rollups(db: Session, rows: Iterable[ExpenseRow], sign: int):
+    days, weeks = _group_by_period(rows)
+    for (table, key_column, upsert), groups in zip(_ROLLUPS, (days, weeks)):
+        if not groups:
+            continue
+        db.execute(upsert, [
+            {key_column: key, "count": sign * count, "total": sign * total}
+            for key, (count, total) in groups.items()
+        ])
+        if sign < 0:
+            db.execute(delete(table).where(table.c.count <= 0))
+
+def record_added(db: Session, rows: Iterable[ExpenseRow]):
+    """Add newly written (id, category, amount, date) rows to the aggregates"""
+    rows = list(rows)
+    for key, (count, total, squares, low, high) in _group(rows).items():
+        stmt = insert(_table).values(
+            category=key,
+            count=count,
+            total=total,
+            total_squares=squares,
+            min_amount=low,
+            max_amount=high
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[_table.c.category],
+            set_={
+                "count": _table.c.count + stmt.excluded.count,
+                "total": _table.c.total + stmt.excluded.total,
+                "total_squares": _table.c.total_squares + stmt.excluded.total_squares,
+                "min_amount": func.coalesce(func.min(_table.c.min_amount, stmt.excluded.min_amount), stmt.excluded.min_amount),
+                "max_amount": func.coalesce(func.max(_table.c.max_amount, stmt.excluded.max_amount), stmt.excluded.max_amount),
+            }
+        )
+        db.execute(stmt)
+    _record_rollups(db, rows, 1)
+    changes.stage(db, added=rows, version=bump_data_version(db))
+
+def record_removed(db: Session, rows: Iterable[ExpenseRow]):
+    """Remove deleted (id, category, amount, date) rows from the aggregates.
+
+    Must run after the deletion has been flushed: when a removed amount was
+    the current min or max, the bound is recomputed from the expenses table.
+    """
+    rows = list(rows)
+    for key, (count, total, squares, low, high) in _group(rows).items():
+        db.execute(
+            update(_table)
+            .where(_table.c.category == key)
+            .values(
+                count=_table.c.count - count,
+                total=_table.c.total - total,
+                total_squares=_table.c.total_squares - squares
+            )
+        )
+        scope = Expense.category == key if key != GLOBAL_KEY else true()
+        db.execute(
+            update(_table)
+            .where(_table.c.category == key)
+            .where(or_(_table.c.min_amount >= low, _table.c.max_amount <= high))
+            .values(
+                min_amount=select(func.min(Expense.amount)).where(scope).scalar_subquery(),
+                max_amount=select(func.max(Expense.amount)).where(scope).scalar_subquery()
+            )
+        )
+    # Reset emptied rows exactly so float drift does not linger
+    db.execute(
+        update(_table)
+        .where(_table.c.count <= 0)
+        .values(count=0, total=0.0, total_squares=0.0, min_amount=None, max_amount=None)
+    )
+    db.execute(delete(_table).where(_table.c.category != GLOBAL_KEY, _table.c.count <= 0))
+    _record_rollups(db, rows, -1)
+    changes.stage(db, removed=rows, version=bump_data_version(db))
+
+def record_modified(db: Session):
+    """Bump the data version for a write that leaves the aggregates as they were (a description edit)"""
+    changes.stage(db, version=bump_data_version(db))
+
+def _expected_query():
+    """Aggregates computed directly from the expenses table"""
+    columns = (
+        func.count(Expense.id),
+        func.coalesce(func.sum(Expense.amount), 0.0),
+        func.coalesce(func.sum(Expense.amount * Expense.amount), 0.0),
+        func.min(Expense.amount),
+        func.max(Expense.amount)
+    )
+    per_category = select(Expense.category, *columns).group_by(Expense.category)
+    overall = select(literal(GLOBAL_KEY), *columns)
+    return per_category.union_all(overall)
+
+def _expected_rollup_queries():
+    """Daily and weekly rollups computed directly from the expenses table"""
+    day = func.date(Expense.date)
+    monday = func.date(Expense.date, "weekday 0", "-6 days")
+    return (
+        (DailyRollup, select(day, func.count(Expense.id), func.sum(Expense.amount)).group_by(day)),
+        (WeeklyRollup, select(monday, func.count(Expense.id), func.sum(Expense.amount)).group_by(monday)),
+    )
+
+def rebuild(db: Session):
+    """Recompute every aggregate and rollup row from the expenses table"""
+    db.execute(delete(_table))
+    db.execute(
+        insert(_table).from_select(
+            ["category", "count", "total", "total_squares", "min_amount", "max_amount"],
+            _expected_query()
+        )
+    )
+    for model, query in _expected_rollup_queries():
+        table = model.__table__
+        db.execute(delete(table))
+        db.execute(insert(table).from_select([table.c[0].name, "count", "total"], query))
+    bump_data_version(db)
+    changes.invalidate()
+
+def _compare(label: str, names: Tuple[str, ...], want: tuple, have: tuple) -> List[str]:
+    problems = []
+    for name, expected, stored in zip(names, want, have):
+        if expected is None or stored is None:
+            ok = expected == stored
+        else:
+            ok = math.isclose(expected, stored, rel_tol=1e-9, abs_tol=1e-6)
+        if not ok:
+            problems.append(f"{label}: {name} is {stored}, expected {expected}")
+    return problems
+
+def verify(db: Session) -> List[str]:
+    """Compare stored aggregates and rollups with the expenses table, returning mismatches"""
+    expected = {row[0]: row[1:] for row in db.execute(_expected_query())}
+    stored = {
+        row.category: (row.count, row.total, row.total_squares, row.min_amount, row.max_amount)
+        for row in db.query(ExpenseAggregate).all()
+    }
+
+    problems = []
+    for key in sorted(set(expected) | set(stored)):
+        label = key or "<global>"
+        if key not in stored:
+            problems.append(f"{label}: missing aggregate row")
+        elif key not in expected:
+            problems.append(f"{label}: aggregate row for category without expenses")
+        else:
+            names = ("count", "total", "total_squares", "min_amount", "max_amount")
+            problems.extend(_compare(label, names, expected[key], stored[key]))
+
+    for model, query in _expected_rollup_queries():
+        table = model.__table__
+        expected = {str(row[0]): row[1:] for row in db.execute(query)}
+        stored = {str(row[0]): row[1:] for row in db.execute(select(table.c[0], table.c.count, table.c.total))}
+        for key in sorted(set(expected) | set(stored)):
+            label = f"{table.name} {key}"
+            if key not in stored:
+                problems.append(f"{label}: missing rollup row")
+            elif key not in expected:
+                problems.append(f"{label}: rollup row without expenses")
+            else:
+                problems.extend(_compare(label, ("count", "total"), expected[key], stored[key]))
+    return problems
+
+def ensure_aggregates(db: Session):
+    """Build the aggregates once for databases created before they existed"""
+    overall = db.get(ExpenseAggregate, GLOBAL_KEY)
+    missing_rollups = overall is not None and overall.count > 0 and db.query(DailyRollup.day).first() is None
+    if overall is None or missing_rollups:
+        rebuild(db)
+        db.commit()
+
+def load_aggregates(db: Session) -> Tuple[ExpenseAggregate, List[ExpenseAggregate]]:
+    """Return the global aggregate row and the per-category rows"""
+    rows = db.query(ExpenseAggregate).order_by(ExpenseAggregate.category).all()
+    overall = next((row for row in rows if row.category == GLOBAL_KEY), None)
+    return overall, [row for row in rows if row.category != GLOBAL_KEY and row.count > 0]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the expense aggregate and rollup tables")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args(argv)
+
+    from app.database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rebuild(db)
+            db.commit()
+            print("Aggregates rebuilt")
+            return 0
+
+        problems = verify(db)
+        for problem in problems:
+            print(problem)
+        print("Aggregates OK" if not problems else f"{len(problems)} mismatch(es) found")
+        return 1 if problems else 0
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Set-based bulk update and delete of expenses
+
+Expenses are selected by an id list, a filter (categories, date range,
+amount range) or both, and changed with one UPDATE or DELETE statement in
+a single transaction instead of a load, change and commit per expense.
+The transaction takes the write lock up front (BEGIN IMMEDIATE), so the
+rows read back for the derived data are exactly the rows the statement
+changes. They go through record_removed/record_added and the change log
+like any other write, which keeps the aggregates, rollups, data version
+(and with it cached responses and exports), in-memory structures and
+change feed consistent; the search index follows through its triggers.
+
+A dry run counts the matching expenses, and how many would change,
+without writing anything.
+"""
+import time
+from typing import Dict, List
+
+from sqlalchemy import delete, func, or_, select, text, update
+from sqlalchemy.orm import Session
+
+from app.models import Expense
+from app.schemas import BulkExpenseUpdate, ExpenseSelection
+from app.aggregates import record_added, record_modified, record_removed
+from app.change_log import DELETE, UPDATE, log_changes
+
+_table = Expense.__table__
+# (id, category, amount, date): the fields the derived data is built from
+_ROW = (_table.c.id, _table.c.category, _table.c.amount, _table.c.date)
+
+def _criteria(selection: ExpenseSelection) -> List:
+    criteria = []
+    if selection.ids is not None:
+        criteria.append(_table.c.id.in_(selection.ids))
+    if selection.categories is not None:
+        criteria.append(_table.c.category.in_(selection.categories))
+    if selection.start is not None:
+        criteria.append(_table.c.date >= selection.start)
+    if selection.end is not None:
+        criteria.append(_table.c.date < selection.end)
+    if selection.min_amount is not None:
+        criteria.append(_table.c.amount >= selection.min_amount)
+    if selection.max_amount is not None:
+        criteria.append(_table.c.amount <= selection.max_amount)
+    return criteria
+
+def _begin(db: Session):
+    # The sqlite3 driver only begins on the first write, after the rows were read
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("BEGIN IMMEDIATE"))
+
+def _result(matched: int, changed: int, dry_run: bool, started: float) -> Dict:
+    return {
+        "matched": matched,
+        "changed": changed,
+        "dry_run": dry_run,
+        "elapsed_seconds": time.perf_counter() - started
+    }
+
+def update_expenses(db: Session, request: BulkExpenseUpdate, dry_run: bool = False) -> Dict:
+    """Write the fields set on request.set to every selected expense, returning counts.
+
+    Expenses that already hold those values are matched but not changed.
+    """
+    started = time.perf_counter()
+    criteria = _criteria(request)
+    values = request.set.model_dump(exclude_unset=True)
+    differs = or_(*(_table.c[field].is_distinct_from(value) for field, value in values.items()))
+    if dry_run:
+        matched, changed = db.execute(
+            select(func.count(), func.count().filter(differs)).select_from(_table).where(*criteria)
+        ).one()
+        return _result(matched, changed, True, started)
+
+    _begin(db)
+    connection = db.connection()
+    matched = connection.execute(select(func.count()).select_from(_table).where(*criteria)).scalar()
+    previous = {row[0]: tuple(row) for row in connection.execute(select(*_ROW).where(*criteria, differs))}
+    current = [tuple(row) for row in connection.execute(
+        update(_table).where(*criteria, differs).values(**values).returning(*_ROW)
+    )]
+
+    # Rows whose description alone changed leave the aggregates as they were
+    moved = [row for row in current if row != previous[row[0]]]
+    if moved:
+        record_removed(db, [previous[row[0]] for row in moved])
+        record_added(db, moved)
+    elif current:
+        record_modified(db)
+    log_changes(db, UPDATE, previous.values())
+    db.commit()
+    return _result(matched, len(current), False, started)
+
+def delete_expenses(db: Session, selection: ExpenseSelection, dry_run: bool = False) -> Dict:
+    """Delete every selected expense, returning counts"""
+    started = time.perf_counter()
+    criteria = _criteria(selection)
+    if dry_run:
+        matched = db.execute(select(func.count()).select_from(_table).where(*criteria)).scalar()
+        return _result(matched, matched, True, started)
+
+    _begin(db)
+    removed = [tuple(row) for row in db.connection().execute(delete(_table).where(*criteria).returning(*_ROW))]
+    if removed:
+        record_removed(db, removed)
+        log_changes(db, DELETE, removed)
+    db.commit()
+    return _result(len(removed), len(removed), False, started)
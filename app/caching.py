@@ -0,0 +1,120 @@
+"""
+Data-version ETags and an in-process response cache
+
+Every expense write bumps a single-row counter in the same transaction
+(see app.aggregates), so the counter changes exactly when the data does.
+Read endpoints derive a strong ETag from it and their query parameters:
+a matching If-None-Match is answered with 304 and a repeat request is
+served from an LRU cache of response bodies, both after a single
+primary-key read instead of the endpoint's queries. The counter lives in
+the database rather than in memory so that every worker process sees
+writes made by the others.
+
+Responses carry "Cache-Control: private, no-cache", which makes browsers
+revalidate with If-None-Match on every fetch.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import DataVersion
+
+# Responses kept by the in-process cache (0 disables it)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Larger bodies are answered with an ETag but not kept in memory
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(1024 * 1024)))
+# Bodies kept in total per process; least recently used ones go first
+RESPONSE_CACHE_TOTAL_BYTES = int(os.getenv("RESPONSE_CACHE_TOTAL_BYTES", str(32 * 1024 * 1024)))
+
+CACHE_CONTROL = "private, no-cache"
+
+def ensure_data_version(db: Session):
+    """Create the counter row for databases that do not have it yet"""
+    if db.get(DataVersion, 1) is None:
+        db.add(DataVersion(id=1, version=0))
+        db.commit()
+
+def bump_data_version(db: Session) -> int:
+    """Advance the data version and return it; call inside the transaction making the change"""
+    return db.execute(
+        update(DataVersion)
+        .where(DataVersion.id == 1)
+        .values(version=DataVersion.version + 1)
+        .returning(DataVersion.version)
+    ).scalar() or 0
+
+async def get_data_version(db: AsyncSession) -> int:
+    """Current data version (one primary-key read)"""
+    version = await db.scalar(select(DataVersion.version).where(DataVersion.id == 1))
+    return version or 0
+
+def make_etag(version: int, endpoint: str, **params) -> str:
+    """Strong ETag for endpoint with params at version"""
+    key = repr((endpoint, sorted(params.items())))
+    return f'"{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match lists etag (weak comparison, as RFC 9110 requires)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+class ResponseCache:
+    """LRU of response bodies keyed by ETag, bounded by entries and total bytes; entries of older versions simply age out"""
+
+    def __init__(self, max_entries: int, max_body_bytes: int, max_total_bytes: int):
+        self.max_entries = max_entries
+        self.max_body_bytes = min(max_body_bytes, max_total_bytes)
+        self.max_total_bytes = max_total_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+
+    def lookup(self, request: Request, etag: str) -> Optional[Response]:
+        """304 if the client has etag, the cached response if this process has it, else None"""
+        entry = self._entries.get(etag)
+        if entry is not None:
+            self._entries.move_to_end(etag)
+        headers = entry[2] if entry is not None else None
+        if etag_matches(request, etag):
+            return not_modified(etag, headers)
+        if entry is None:
+            return None
+        body, media_type, headers = entry
+        return Response(content=body, media_type=media_type, headers=self._headers(etag, headers))
+
+    def store(self, etag: str, body: bytes, headers: Optional[Dict[str, str]] = None,
+              media_type: str = "application/json") -> Response:
+        """Keep a freshly built body and return it as a response"""
+        headers = headers or {}
+        if self.max_entries > 0 and len(body) <= self.max_body_bytes:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[etag] = (body, media_type, headers)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_total_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return Response(content=body, media_type=media_type, headers=self._headers(etag, headers))
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    @staticmethod
+    def _headers(etag: str, headers: Dict[str, str]) -> Dict[str, str]:
+        return {**headers, "ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TOTAL_BYTES)
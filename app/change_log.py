@@ -0,0 +1,208 @@
+"""
+Change log of expense writes for delta sync
+
+Every insert, update and delete of an expense appends an entry to the
+expense_changes table in the same transaction, numbered by a sequence that
+only grows (an AUTOINCREMENT key, so numbers are never reused). Updates and
+deletes also keep the category, amount and date the expense had before, so
+a client can patch totals it derived from the old row without re-reading
+them. SQLite runs one write transaction at a time, so entries become
+visible in sequence order and a reader polling "after seq" never misses
+one that commits later with a lower number.
+
+read_changes() answers "what changed after seq" with one entry per expense:
+its current row, or a tombstone if it is gone, and its state at seq. Pages
+are whole stretches of the log, so a client applying them in turn never
+skips or repeats a change. The work is proportional to the entries after
+seq, not to the table.
+
+Only the newest CHANGE_LOG_SIZE entries are kept. A client further behind
+than that gets ChangeLogExpired and has to reload everything.
+
+listen() wakes change streams when a commit of this process is published
+(app.changes); commits of other worker processes are picked up by polling
+every CHANGE_STREAM_POLL_SECONDS.
+"""
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from sqlalchemy import bindparam, delete, func, insert, select
+from sqlalchemy.orm import Session, aliased
+
+from app import changes
+from app.changes import ExpenseRow
+from app.database import read_transaction
+from app.models import Expense, ExpenseChange
+from app.serialization import EXPENSE_COLUMNS, EXPENSE_FIELDS
+
+# Entries kept; older ones are pruned as new ones are written
+CHANGE_LOG_SIZE = int(os.getenv("CHANGE_LOG_SIZE", "100000"))
+# How often change streams look for commits made by other processes
+CHANGE_STREAM_POLL_SECONDS = float(os.getenv("CHANGE_STREAM_POLL_SECONDS", "1.0"))
+
+# Operations of log entries
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+# Operation of a read_changes() entry for an expense that still exists
+UPSERT = "upsert"
+
+# Prune once per this many entries rather than on every write
+_PRUNE_EVERY = 1000
+
+_table = ExpenseChange.__table__
+
+class ChangeLogExpired(Exception):
+    """The entries after the requested sequence number are no longer all kept"""
+
+def log_changes(db: Session, op: str, rows: Iterable[ExpenseRow]):
+    """Append an entry per (id, category, amount, date) row; for updates and deletes, the row before the change"""
+    keep_previous = op != INSERT
+    entries = [
+        {
+            "expense_id": expense_id,
+            "op": op,
+            "category": category if keep_previous else None,
+            "amount": amount if keep_previous else None,
+            "date": when if keep_previous else None,
+        }
+        for expense_id, category, amount, when in rows
+    ]
+    if not entries:
+        return
+    connection = db.connection()
+    connection.execute(insert(_table), entries)
+    last = connection.execute(select(func.max(_table.c.seq))).scalar()
+    if last // _PRUNE_EVERY != (last - len(entries)) // _PRUNE_EVERY:
+        connection.execute(delete(_table).where(_table.c.seq <= last - CHANGE_LOG_SIZE))
+
+# The statements below are built once; composing them costs more than running them.
+# min() and max() are separate subqueries: SQLite reads either alone off the
+# key but scans the table for both in one select
+_bounds = select(
+    select(func.min(ExpenseChange.seq)).scalar_subquery(),
+    select(func.max(ExpenseChange.seq)).scalar_subquery(),
+)
+# The entry limit entries after :since, where a page ends at the latest
+_cut = (
+    select(ExpenseChange.seq)
+    .where(ExpenseChange.seq > bindparam("since"))
+    .order_by(ExpenseChange.seq)
+    .offset(bindparam("skip"))
+    .limit(1)
+)
+# The newest entry after :upto of an expense with an entry in (:since, :upto]
+_later = select(func.max(ExpenseChange.seq)).where(
+    ExpenseChange.seq > bindparam("upto"),
+    ExpenseChange.expense_id.in_(
+        select(ExpenseChange.expense_id).where(
+            ExpenseChange.seq > bindparam("since"), ExpenseChange.seq <= bindparam("upto")
+        )
+    ),
+)
+# The first and last entry in (:since, :upto] of each expense, in order of the last
+_window = (
+    select(
+        ExpenseChange.expense_id,
+        func.min(ExpenseChange.seq).label("first"),
+        func.max(ExpenseChange.seq).label("last"),
+    )
+    .where(ExpenseChange.seq > bindparam("since"), ExpenseChange.seq <= bindparam("upto"))
+    .group_by(ExpenseChange.expense_id)
+    .subquery()
+)
+_first = aliased(ExpenseChange)
+_changes_in = (
+    select(_window.c.last, _window.c.expense_id, _first.op, _first.category, _first.amount, _first.date, *EXPENSE_COLUMNS)
+    .join(_first, _first.seq == _window.c.first)
+    .outerjoin(Expense, Expense.id == _window.c.expense_id)
+    .order_by(_window.c.last)
+)
+
+def latest_seq(db: Session) -> int:
+    """Sequence number of the newest entry (0 before the first write)"""
+    return db.scalar(select(func.max(ExpenseChange.seq))) or 0
+
+def _page_end(db: Session, since: int, limit: int, newest: int) -> int:
+    """Sequence number a page of changes after since ends at.
+
+    A page is every entry in (since, end]: it ends limit entries after since,
+    or later when an expense on it changed again after that, so no expense
+    on the page has changes left for a later one.
+    """
+    end = db.scalar(_cut, {"since": since, "skip": limit - 1})
+    if end is None:
+        return newest
+    while True:
+        later = db.scalar(_later, {"since": since, "upto": end})
+        if later is None:
+            return end
+        end = later
+
+def read_changes(db: Session, since: int, limit: int) -> Tuple[List[Dict], int, bool]:
+    """Changes after since: (entries, sequence number to pass next, whether more remain).
+
+    Each entry is the latest change of one expense, oldest first: its seq,
+    "upsert" with the current row or "delete", and the category, amount and
+    date it had at since (None if it was inserted after since). Expenses
+    inserted and deleted after since are left out. Each page covers every
+    log entry up to the returned sequence number, usually limit of them and
+    more when an expense on the page changed again later, so applying pages
+    in turn never skips or repeats a change. Raises ChangeLogExpired when
+    entries after since have been pruned, or since is ahead of the log.
+    """
+    with read_transaction(db):
+        oldest, newest = db.execute(_bounds).one()
+        newest = newest or 0
+        if since > newest or (oldest is not None and since < oldest - 1):
+            raise ChangeLogExpired(since)
+
+        end = _page_end(db, since, limit, newest)
+        rows = db.execute(_changes_in, {"since": since, "upto": end}).all()
+
+    entries = []
+    for last, expense_id, op, category, amount, when, *expense in rows:
+        previous = None if op == INSERT else {"category": category, "amount": amount, "date": when}
+        current = dict(zip(EXPENSE_FIELDS, expense)) if expense[0] is not None else None
+        if previous is None and current is None:
+            continue
+        entries.append({
+            "seq": last,
+            "id": expense_id,
+            "op": UPSERT if current is not None else DELETE,
+            "expense": current,
+            "previous": previous,
+        })
+    return entries, end, end < newest
+
+# Events of the change streams listening in this process, with their loops
+_listeners: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+_listeners_lock = threading.Lock()
+
+def _wake(published):
+    # Called from whichever thread committed; hand over to each stream's loop
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for loop, event in listeners:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # The loop has closed; its stream is gone
+            pass
+
+changes.subscribe(_wake)
+
+@contextmanager
+def listen() -> Iterator[asyncio.Event]:
+    """An event set whenever this process publishes a commit; clear it before reading"""
+    listener = (asyncio.get_running_loop(), asyncio.Event())
+    with _listeners_lock:
+        _listeners.add(listener)
+    try:
+        yield listener[1]
+    finally:
+        with _listeners_lock:
+            _listeners.discard(listener)
@@ -0,0 +1,138 @@
+"""
+Committed expense changes for in-memory derived structures
+
+record_added and record_removed (app.aggregates) stage the rows they fold
+into the derived tables on the session, tagged with the data version of
+the write. Once the outermost transaction commits, every subscriber
+receives the staged changes in order. Rolled back savepoints and
+transactions drop theirs, so in-memory structures such as the percentile
+index and the columnar snapshot only ever see committed data.
+
+Commits from different threads are published in version order: a commit
+that finishes while an earlier one is still between COMMIT and publication
+is held back until that one is published. publishing() tells readers when
+a commit is in that window, i.e. when the database may be a few versions
+ahead of the in-memory structures for no reason other than timing.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# (id, category, amount, date) of an expense as it was written or removed
+ExpenseRow = Tuple[int, str, float, datetime]
+# Rows added, rows removed, and the data version after the write
+Change = Tuple[List[ExpenseRow], List[ExpenseRow], int]
+
+Listener = Callable[[List[Change]], None]
+
+_PENDING = "expense_changes"
+_SAVEPOINTS = "expense_change_savepoints"
+
+_subscribers: List[Tuple[Listener, Optional[Callable[[], None]]]] = []
+
+# Guards the two below and serializes delivery to subscribers
+_lock = threading.Lock()
+# Lowest staged version of each session between commit and publication
+_committing: Dict[int, int] = {}
+# Committed changes waiting for an earlier commit to be published first
+_held: List[Change] = []
+
+def subscribe(apply: Listener, invalidate: Optional[Callable[[], None]] = None):
+    """Call apply(changes) after every commit, and invalidate() when derived data is rebuilt.
+
+    If apply raises, invalidate is called so the structure reloads itself.
+    """
+    _subscribers.append((apply, invalidate))
+
+def stage(db: Session, added: Iterable[ExpenseRow] = (), removed: Iterable[ExpenseRow] = (), version: int = 0):
+    """Queue a change to publish once db commits"""
+    if _subscribers:
+        db.info.setdefault(_PENDING, []).append((list(added), list(removed), version))
+
+def invalidate():
+    """Tell every subscriber its in-memory state is out of date"""
+    for _, drop in _subscribers:
+        if drop is not None:
+            drop()
+
+def publishing() -> bool:
+    """Whether commits of this process are not yet fully published to subscribers"""
+    return bool(_committing or _held)
+
+def _release(session, committed: List[Change]):
+    """Publish committed, and any held changes no longer waiting for an earlier commit"""
+    # Only this session's own thread adds or removes its entry
+    if not committed and session.hash_key not in _committing:
+        return
+    with _lock:
+        if _committing.pop(session.hash_key, None) is None and not committed:
+            return
+        _held.extend(committed)
+        if not _held:
+            return
+        earliest = min(_committing.values(), default=None)
+        ready = [change for change in _held if earliest is None or change[2] < earliest]
+        if not ready:
+            return
+        _held[:] = [change for change in _held if not (earliest is None or change[2] < earliest)]
+        # Stable, so the changes of one write keep their order
+        ready.sort(key=lambda change: change[2])
+        _publish(ready)
+
+def _publish(changes: List[Change]):
+    for apply, drop in _subscribers:
+        try:
+            apply(changes)
+        except Exception:
+            # The write is already committed; never fail it over a cache
+            logger.exception("Applying committed changes failed")
+            if drop is not None:
+                drop()
+
+@event.listens_for(Session, "after_transaction_create")
+def _mark_savepoint(session, transaction):
+    if transaction.nested:
+        session.info.setdefault(_SAVEPOINTS, []).append(len(session.info.get(_PENDING, ())))
+
+@event.listens_for(Session, "before_commit")
+def _mark_committing(session):
+    if session.in_nested_transaction():
+        return
+    pending = session.info.get(_PENDING)
+    if pending:
+        with _lock:
+            _committing[session.hash_key] = min(version for _, _, version in pending)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    pending = session.info.get(_PENDING)
+    if not pending:
+        return
+    savepoints = session.info.get(_SAVEPOINTS)
+    if session.in_nested_transaction() and savepoints:
+        del pending[savepoints[-1]:]
+    else:
+        pending.clear()
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    if not session.in_nested_transaction():
+        _release(session, session.info.pop(_PENDING, None) or [])
+
+@event.listens_for(Session, "after_transaction_end")
+def _end_transaction(session, transaction):
+    if transaction.nested:
+        savepoints = session.info.get(_SAVEPOINTS)
+        if savepoints:
+            savepoints.pop()
+    elif transaction.parent is None:
+        # Closed without committing: nothing staged reached the database
+        session.info.pop(_PENDING, None)
+        # A failed commit no longer holds back later ones
+        _release(session, [])
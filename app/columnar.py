@@ -0,0 +1,400 @@
+"""
+In-process columnar snapshot of the expense table for analytics
+
+The snapshot holds the analytic columns of every expense as NumPy arrays
+sorted by date: int64 ids, int64 epoch seconds, float64 amounts and int32
+category codes (names in a code -> name list). Date ranges are sliced with
+searchsorted and categories grouped with bincount, so filtered statistics
+and breakdowns never go back to SQLite or build Python objects per row.
+
+It is loaded once (in the background at startup) and then patched from the
+committed changes published by app.changes: inserts go to a small delta
+buffer, deletes mark rows dead, and the arrays are compacted on a read
+once either grows past COLUMNAR_DELTA_LIMIT. Every change carries the data
+version of its write; a gap (another process wrote, or the aggregates were
+rebuilt) drops the snapshot, and ensure() reloads it when the database
+version moves on without it.
+
+That reload reads the whole table, synchronously, in the request that
+notices it. Every worker process keeps its own snapshot, so with several
+workers each write by one of them costs the others a full reload; run.py
+--prod therefore leaves the snapshot off when it starts more than one
+worker.
+
+Dates have second resolution. Set COLUMNAR_SNAPSHOT=0 to keep nothing in
+memory and answer everything from SQL.
+"""
+import calendar
+import os
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import changes
+from app.changes import Change
+from app.metrics import phase
+from app.models import DataVersion
+
+if TYPE_CHECKING:
+    import numpy as np
+
+COLUMNAR_SNAPSHOT = os.getenv("COLUMNAR_SNAPSHOT", "1") == "1"
+# Buffered inserts or dead rows that trigger a compaction of the arrays
+COLUMNAR_DELTA_LIMIT = int(os.getenv("COLUMNAR_DELTA_LIMIT", "4096"))
+
+# Rows fetched per round trip while loading
+LOAD_CHUNK_SIZE = 50_000
+
+_LOAD_QUERY = text(
+    "SELECT id, CAST(strftime('%s', date) AS INTEGER), amount, category, "
+    "(SELECT version FROM data_version WHERE id = 1) "
+    "FROM expenses"
+)
+_CATEGORIES_QUERY = text("SELECT DISTINCT category FROM expenses ORDER BY category")
+
+def epoch_seconds(value: datetime) -> int:
+    """Seconds since the epoch of a naive UTC datetime, truncated like SQLite's strftime('%s').
+
+    Any offset is ignored, as it is when SQLite stores the datetime as text;
+    the schemas convert client dates to naive UTC before they get this far.
+    """
+    return calendar.timegm(value.replace(tzinfo=None).timetuple())
+
+class Columns(NamedTuple):
+    """Matching expenses as arrays, plus the code -> name list their codes index"""
+    dates: "np.ndarray"
+    amounts: "np.ndarray"
+    codes: "np.ndarray"
+    names: List[str]
+
+    def breakdown(self) -> Dict[str, Dict]:
+        """Count and total per category name, via bincount over the codes"""
+        import numpy as np
+        size = len(self.names)
+        counts = np.bincount(self.codes, minlength=size)
+        totals = np.bincount(self.codes, weights=self.amounts, minlength=size)
+        return {
+            self.names[code]: {"count": int(counts[code]), "total": float(totals[code])}
+            for code in sorted(np.flatnonzero(counts), key=lambda code: self.names[code])
+        }
+
+class StaleSnapshot(Exception):
+    """A change did not match the snapshot"""
+
+class ExpenseSnapshot:
+    """Columnar copy of the expenses, kept in step with commits"""
+
+    def __init__(self, delta_limit: int):
+        self.delta_limit = delta_limit
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._loading = False
+        self._backlog: Optional[List[Change]] = []
+        # Bumped whenever the arrays are dropped or reloaded
+        self._generation = 0
+        self._compaction_log: Optional[List[Change]] = None
+        self._names: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._clear()
+
+    def _clear(self):
+        # Arrays are only read while ready; _install replaces them all
+        self._ids = self._dates = self._amounts = self._categories = None
+        self._alive = None
+        self._dead = 0
+        # Row positions in id order, for finding rows to remove
+        self._id_order = self._sorted_ids = None
+        # Inserts since the last compaction: id -> (seconds, amount, code)
+        self._delta: Dict[int, tuple] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self._version is not None
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def invalidate(self):
+        """Drop the snapshot; it is reloaded on next use"""
+        with self._lock:
+            self._drop()
+            # A load in progress read rows that are now out of date
+            self._backlog = None if self._loading else []
+
+    def apply(self, changes: Iterable[Change]):
+        """Apply committed changes; they are replayed after a load in progress"""
+        with self._lock:
+            if not self.ready:
+                if self._loading and self._backlog is not None:
+                    self._backlog.extend(changes)
+                return
+            self._replay(changes)
+
+    def _apply(self, changes: Iterable[Change]):
+        for added, removed, version in changes:
+            if version <= self._version:
+                # Already part of the loaded rows
+                continue
+            if version != self._version + 1:
+                raise StaleSnapshot(version)
+            for expense_id, _, _, _ in removed:
+                self._remove(expense_id)
+            for expense_id, category, amount, when in added:
+                self._delta[expense_id] = (epoch_seconds(when), amount, self._code(category))
+            self._version = version
+            if self._compaction_log is not None:
+                self._compaction_log.append((added, removed, version))
+
+    def _code(self, category: str) -> int:
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self._names)
+            self._names.append(category)
+        return code
+
+    def _remove(self, expense_id: int):
+        import numpy as np
+        if self._delta.pop(expense_id, None) is not None:
+            return
+        slot = np.searchsorted(self._sorted_ids, expense_id)
+        if slot == len(self._sorted_ids) or self._sorted_ids[slot] != expense_id:
+            raise StaleSnapshot(expense_id)
+        position = self._id_order[slot]
+        if not self._alive[position]:
+            raise StaleSnapshot(expense_id)
+        self._alive[position] = False
+        self._dead += 1
+
+    def _install(self, ids, dates, amounts, categories, id_order):
+        import numpy as np
+        self._ids = ids
+        self._dates = dates
+        self._amounts = amounts
+        self._categories = categories
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._dead = 0
+        self._id_order = id_order
+        self._sorted_ids = ids[id_order]
+        self._delta = {}
+
+    def _compact(self):
+        """Fold the delta into the arrays and drop dead rows.
+
+        The arrays are merged outside the lock so commits are not held up;
+        changes that arrive meanwhile are logged and replayed on the result.
+        """
+        import numpy as np
+        with self._lock:
+            if not self.ready or self._compaction_log is not None:
+                return
+            generation = self._generation
+            version = self._version
+            alive = self._alive.copy()
+            old_ids, old_dates, old_amounts, old_categories = self._ids, self._dates, self._amounts, self._categories
+            delta_ids = np.fromiter(self._delta.keys(), dtype=np.int64, count=len(self._delta))
+            delta = np.array(list(self._delta.values()), dtype=np.float64).reshape(-1, 3)
+            self._compaction_log = []
+
+        try:
+            dates = np.concatenate([old_dates[alive], delta[:, 0].astype(np.int64)])
+            # Stable, so rows already in date order keep their relative order
+            order = np.argsort(dates, kind="stable")
+            ids = np.concatenate([old_ids[alive], delta_ids])[order]
+            amounts = np.concatenate([old_amounts[alive], delta[:, 1]])[order]
+            categories = np.concatenate([old_categories[alive], delta[:, 2].astype(np.int32)])[order]
+            id_order = np.argsort(ids, kind="stable")
+        except BaseException:
+            with self._lock:
+                self._compaction_log = None
+            raise
+
+        with self._lock:
+            log = self._compaction_log
+            self._compaction_log = None
+            if self._generation != generation:
+                return
+            self._install(ids, dates[order], amounts, categories, id_order)
+            self._version = version
+            self._replay(log)
+
+    def _replay(self, changes: List[Change]):
+        try:
+            self._apply(changes)
+        except StaleSnapshot:
+            self._drop()
+
+    def _drop(self):
+        self._version = None
+        self._generation += 1
+        self._clear()
+
+    def load(self, db: Session, min_version: int = 0):
+        """Read the analytic columns of every expense and sort them by date.
+
+        Skipped when a load that finished while waiting for the lock already
+        reached min_version.
+        """
+        import numpy as np
+        with self._load_lock:
+            with self._lock:
+                if self._version is not None and min_version and self._version >= min_version:
+                    return
+                self._loading = True
+                self._backlog = []
+            try:
+                id_chunks, date_chunks, amount_chunks, code_chunks = [], [], [], []
+                # Code the known categories up front (an index-only DISTINCT) so
+                # rows are coded with a C-level map instead of a Python loop
+                names = list(db.connection().execute(_CATEGORIES_QUERY).scalars())
+                codes = {name: code for code, name in enumerate(names)}
+                version = None
+                result = db.connection().execute(_LOAD_QUERY)
+                try:
+                    while True:
+                        chunk = result.cursor.fetchmany(LOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        ids, dates, amounts, categories, versions = zip(*chunk)
+                        version = versions[0]
+                        id_chunks.append(np.array(ids, dtype=np.int64))
+                        date_chunks.append(np.array(dates, dtype=np.int64))
+                        amount_chunks.append(np.array(amounts, dtype=np.float64))
+                        try:
+                            chunk_codes = list(map(codes.__getitem__, categories))
+                        except KeyError:
+                            # A category added since the DISTINCT read
+                            chunk_codes = []
+                            for category in categories:
+                                code = codes.get(category)
+                                if code is None:
+                                    code = codes[category] = len(names)
+                                    names.append(category)
+                                chunk_codes.append(code)
+                        code_chunks.append(np.array(chunk_codes, dtype=np.int32))
+                finally:
+                    result.close()
+                if version is None:
+                    # No expenses: the version still has to come from this read
+                    version = db.connection().execute(
+                        text("SELECT version FROM data_version WHERE id = 1")
+                    ).scalar()
+
+                if id_chunks:
+                    # A sequential scan in id order is much cheaper than walking the
+                    # date index; a stable sort then orders rows by (date, id)
+                    dates = np.concatenate(date_chunks)
+                    order = np.argsort(dates, kind="stable")
+                    dates = dates[order]
+                    ids = np.concatenate(id_chunks)[order]
+                    amounts = np.concatenate(amount_chunks)[order]
+                    categories = np.concatenate(code_chunks)[order]
+                else:
+                    ids = dates = np.empty(0, dtype=np.int64)
+                    amounts = np.empty(0, dtype=np.float64)
+                    categories = np.empty(0, dtype=np.int32)
+                id_order = np.argsort(ids, kind="stable")
+            finally:
+                with self._lock:
+                    backlog = self._backlog
+                    self._loading = False
+                    self._backlog = []
+
+            with self._lock:
+                if backlog is None:
+                    return
+                self._generation += 1
+                self._install(ids, dates, amounts, categories, id_order)
+                self._names = names
+                self._codes = codes
+                self._version = version or 0
+                self._replay(backlog)
+
+    def ensure(self, db: Session, wait: bool = True) -> bool:
+        """Load the snapshot if it is missing or behind the database; returns whether it is usable.
+
+        A snapshot that is behind while commits of this process are still
+        being published is used as it is. With wait=False a load already
+        under way in another thread is not waited for and False is
+        returned instead.
+        """
+        current = db.get(DataVersion, 1)
+        current = current.version if current is not None else 0
+        if self._version is not None and self._version >= current:
+            return True
+        if self._version is not None and changes.publishing():
+            # Most likely those commits; a later check catches anything else
+            return True
+        if self._loading and not wait:
+            return False
+        with phase("snapshot_load"):
+            self.load(db, current)
+        return self.ready
+
+    def columns(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        categories: Optional[Sequence[str]] = None
+    ) -> Optional[Columns]:
+        """Expenses with start <= date < end in categories (None for all), or None if not loaded"""
+        import numpy as np
+        if len(self._delta) > self.delta_limit or self._dead > self.delta_limit:
+            self._compact()
+
+        start = epoch_seconds(start) if start is not None else None
+        end = epoch_seconds(end) if end is not None else None
+        # Take what the read needs under the lock, then filter without it.
+        # The arrays are only ever replaced, except alive, which is copied.
+        with self._lock:
+            if not self.ready:
+                return None
+            low = np.searchsorted(self._dates, start) if start is not None else 0
+            high = np.searchsorted(self._dates, end) if end is not None else len(self._dates)
+            dates = self._dates[low:high]
+            amounts = self._amounts[low:high]
+            codes = self._categories[low:high]
+            keep = self._alive[low:high].copy()
+            delta = list(self._delta.values())
+            names = list(self._names)
+            wanted = None
+            if categories is not None:
+                wanted = [self._codes[name] for name in categories if name in self._codes]
+
+        if delta:
+            delta = np.array(delta, dtype=np.float64)
+            delta_dates = delta[:, 0].astype(np.int64)
+            in_range = np.ones(len(delta), dtype=bool)
+            if start is not None:
+                in_range &= delta_dates >= start
+            if end is not None:
+                in_range &= delta_dates < end
+            dates = np.concatenate([dates, delta_dates])
+            amounts = np.concatenate([amounts, delta[:, 1]])
+            codes = np.concatenate([codes, delta[:, 2].astype(np.int32)])
+            keep = np.concatenate([keep, in_range])
+        if wanted is not None:
+            keep &= np.isin(codes, wanted)
+        if keep.all():
+            # The arrays are never written in place, so views are safe to hand out
+            return Columns(dates, amounts, codes, names)
+        return Columns(dates[keep], amounts[keep], codes[keep], names)
+
+snapshot = ExpenseSnapshot(COLUMNAR_DELTA_LIMIT) if COLUMNAR_SNAPSHOT else None
+if snapshot is not None:
+    changes.subscribe(snapshot.apply, snapshot.invalidate)
+
+def expense_columns(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    categories: Optional[Sequence[str]] = None
+) -> Optional[Columns]:
+    """Matching expenses from the snapshot, loading it if needed; None when it is disabled or loading"""
+    if snapshot is None or not snapshot.ensure(db, wait=False):
+        return None
+    return snapshot.columns(start, end, categories)
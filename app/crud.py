@@ -0,0 +1,72 @@
+"""
+Expense write operations shared by the request handlers and the group-commit writer
+
+Each operation flushes its change and folds it into the derived tables but
+leaves committing to the caller, so several can share one transaction. The
+caller holds the write lock before the operation reads the expense, so the
+row it folds in is the row its statement changes.
+"""
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Expense
+from app.schemas import ExpenseCreate, ExpenseUpdate
+from app.aggregates import record_added, record_modified, record_removed
+from app.change_log import DELETE, INSERT, UPDATE, log_changes
+
+async def create_expense(db: AsyncSession, expense: ExpenseCreate) -> Expense:
+    """Insert a new expense"""
+    db_expense = Expense(
+        amount=expense.amount,
+        category=expense.category,
+        description=expense.description,
+        date=expense.date or datetime.utcnow()
+    )
+    db.add(db_expense)
+    await db.flush()
+    row = (db_expense.id, db_expense.category, db_expense.amount, db_expense.date)
+    await db.run_sync(record_added, [row])
+    await db.run_sync(log_changes, INSERT, [row])
+    return db_expense
+
+async def get_expense_or_404(db: AsyncSession, expense_id: int) -> Expense:
+    """Load an expense by id or raise a 404"""
+    db_expense = await db.get(Expense, expense_id)
+    if not db_expense:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return db_expense
+
+async def update_expense(db: AsyncSession, expense_id: int, expense_update: ExpenseUpdate) -> Expense:
+    """Apply the fields set on expense_update to an existing expense"""
+    db_expense = await get_expense_or_404(db, expense_id)
+
+    previous = (db_expense.id, db_expense.category, db_expense.amount, db_expense.date)
+    previous_description = db_expense.description
+    update_data = expense_update.model_dump(exclude_unset=True)
+    for field, value in update_data.items():
+        setattr(db_expense, field, value)
+
+    await db.flush()
+    current = (db_expense.id, db_expense.category, db_expense.amount, db_expense.date)
+    if current != previous:
+        await db.run_sync(record_removed, [previous])
+        await db.run_sync(record_added, [current])
+    elif db_expense.description != previous_description:
+        # Not in the aggregates, but cached responses and the change log must see it
+        await db.run_sync(record_modified)
+    else:
+        return db_expense
+    await db.run_sync(log_changes, UPDATE, [previous])
+    return db_expense
+
+async def delete_expense(db: AsyncSession, expense_id: int) -> None:
+    """Delete an expense"""
+    db_expense = await get_expense_or_404(db, expense_id)
+
+    row = (db_expense.id, db_expense.category, db_expense.amount, db_expense.date)
+    await db.delete(db_expense)
+    await db.flush()
+    await db.run_sync(record_removed, [row])
+    await db.run_sync(log_changes, DELETE, [row])
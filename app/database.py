@@ -1,26 +1,203 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+import asyncio
+import contextvars
+import functools
+import logging
 import os
+import sqlite3
+import time
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
 
 # Database URL
 DB_DIR = os.getenv("DB_DIR", "./data")
 os.makedirs(DB_DIR, exist_ok=True)
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(DB_DIR, 'expenses.db')}")
 
+# Async driver for request handlers (sqlite:// -> sqlite+aiosqlite://)
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+)
+
+# Connection pool and worker thread sizing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+
+# SQLite tuning applied to every new connection. SQLITE_PROFILE picks a
+# preset ("performance", "safe" or "none" to keep SQLite's defaults) and the
+# individual SQLITE_* variables override single pragmas.
+SQLITE_PROFILES = {
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": str(256 * 1024 * 1024),
+        "cache_size": "-65536",
+        "temp_store": "MEMORY",
+        "busy_timeout": "5000",
+    },
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": "5000",
+    },
+    "none": {},
+}
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance")
+if SQLITE_PROFILE not in SQLITE_PROFILES:
+    raise ValueError(f"Unknown SQLITE_PROFILE {SQLITE_PROFILE!r}; expected one of {', '.join(SQLITE_PROFILES)}")
+SQLITE_PRAGMAS = dict(SQLITE_PROFILES[SQLITE_PROFILE])
+for _pragma in ("journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store", "busy_timeout"):
+    _value = os.getenv(f"SQLITE_{_pragma.upper()}")
+    if _value:
+        SQLITE_PRAGMAS[_pragma] = _value
+# Seconds between PRAGMA optimize / WAL checkpoint runs (0 disables)
+SQLITE_MAINTENANCE_INTERVAL = float(os.getenv("SQLITE_MAINTENANCE_INTERVAL", "300"))
+
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+for _engine in (engine, async_engine.sync_engine):
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine, "connect", _apply_sqlite_pragmas)
+
+class _RowSink:
+    """The request whose statements currently run on a connection"""
+    __slots__ = ("request",)
+
+    def __init__(self):
+        self.request = None
+
+    def add(self, rows: int):
+        if self.request is not None:
+            self.request.rows += rows
+
+class _RowCountingCursor(sqlite3.Cursor):
+    """Cursor adding the rows it fetches to its connection's sink"""
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self.connection.sink.add(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.connection.sink.add(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self.connection.sink.add(len(rows))
+        return rows
+
+class _RowCountingConnection(sqlite3.Connection):
+    def __init__(self, *args, sink: _RowSink, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sink = sink
+
+    def cursor(self, factory=_RowCountingCursor):
+        return super().cursor(factory)
+
+def _count_rows(dialect, connection_record, cargs, cparams):
+    # aiosqlite fetches on a thread of its own, outside the request's
+    # context, so the request is handed over through the connection
+    sink = connection_record.info["row_sink"] = _RowSink()
+    cparams["factory"] = functools.partial(_RowCountingConnection, sink=sink)
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+    sink = conn.info.get("row_sink")
+    if sink is not None:
+        sink.request = metrics.current.get()
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    metrics.record_query(time.perf_counter() - conn.info["query_started"].pop())
+
+def _query_failed(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        metrics.record_query(time.perf_counter() - started.pop())
+
+if metrics.METRICS:
+    for _engine in (engine, async_engine.sync_engine):
+        event.listen(_engine, "before_cursor_execute", _query_started)
+        event.listen(_engine, "after_cursor_execute", _query_finished)
+        event.listen(_engine, "handle_error", _query_failed)
+        if _engine.dialect.name == "sqlite":
+            event.listen(_engine, "do_connect", _count_rows)
+
+# Threads for synchronous, CPU-heavy work (statistics, workbook builds)
+executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db-worker")
+
 def init_db():
     """Initialize database tables"""
     from app.models import Expense
+    from app.aggregates import ensure_aggregates
+    from app.caching import ensure_data_version
+    from app.search import ensure_search_index
     Base.metadata.create_all(bind=engine)
 
+    # create_all skips indexes added to tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        ensure_data_version(db)
+        ensure_aggregates(db)
+        ensure_search_index(db)
+    finally:
+        db.close()
+
+@contextmanager
+def read_transaction(db: Session):
+    """Run the statements inside against one snapshot of the database, yielding the connection.
+
+    pysqlite only begins a transaction before a write, so consecutive
+    SELECTs would otherwise each see the latest commit.
+    """
+    connection = db.connection()
+    begin = connection.dialect.name == "sqlite" and not connection.connection.dbapi_connection.in_transaction
+    if begin:
+        connection.exec_driver_sql("BEGIN")
+    try:
+        yield connection
+    finally:
+        if begin:
+            connection.exec_driver_sql("ROLLBACK")
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
@@ -28,3 +205,44 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _call_with_session(fn, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+def maintain_sqlite():
+    """Refresh planner statistics and checkpoint the WAL back into the database"""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA optimize")
+        if SQLITE_PRAGMAS.get("journal_mode", "").upper() == "WAL":
+            connection.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)")
+
+async def sqlite_maintenance_loop():
+    """Run maintain_sqlite every SQLITE_MAINTENANCE_INTERVAL seconds until cancelled"""
+    if SQLITE_MAINTENANCE_INTERVAL <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SQLITE_MAINTENANCE_INTERVAL)
+        try:
+            await loop.run_in_executor(executor, maintain_sqlite)
+        except Exception:
+            # Retried next interval; a failed checkpoint loses nothing
+            logger.exception("SQLite maintenance failed")
+
+async def run_in_executor(fn, *args, **kwargs):
+    """Run fn(db, *args) with its own synchronous session off the event loop"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_call_with_session, fn, *args, **kwargs)
+    # Carry the request's context (its metrics) over to the worker thread
+    return await loop.run_in_executor(executor, contextvars.copy_context().run, call)
@@ -1,37 +1,46 @@
 """
-Excel export functionality using openpyxl and xlsxwriter
+Excel export functionality using xlsxwriter
+
+Only imported where a workbook is built (the export worker processes), so
+the serving process never loads xlsxwriter.
 """
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 from xlsxwriter import Workbook as XlsxWriterWorkbook
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
-from io import BytesIO
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.models import Expense
 from app.statistics import calculate_expense_statistics
+import tempfile
+import os
+
+# Expense rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 5_000
+
+def export_expenses_to_excel(db: Session, path: Optional[str] = None, data_version: Optional[int] = None) -> str:
+    """Export expenses to Excel with data and charts, returning the file path.
 
-def export_expenses_to_excel(db: Session) -> BytesIO:
-    """Export expenses to Excel with data and charts"""
-    expenses = db.query(Expense).order_by(Expense.date.desc()).all()
+    Rows are read in chunks and written with xlsxwriter's constant_memory
+    mode, which flushes each row to disk as soon as the next one starts, so
+    memory stays flat regardless of the number of expenses. Without a path
+    a temporary file is created; the caller is responsible for removing it.
+    Inside app.database.read_transaction the statistics and the rows come
+    from the same data, whose data_version is then listed with the
+    statistics.
+    """
     stats = calculate_expense_statistics(db)
     
-    # Create in-memory file
-    output = BytesIO()
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
     
-    # Note: xlsxwriter doesn't support reading from BytesIO directly in the way we need
-    # So we'll create a temporary approach
-    import tempfile
-    import os
-    
-    # Create temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-    temp_path = temp_file.name
-    temp_file.close()
-    
-    # Use xlsxwriter for charts (write to temp file first)
-    workbook = XlsxWriterWorkbook(temp_path)
+    # constant_memory leaves empty scratch files behind; give them a
+    # directory of their own that is removed with the workbook closed
+    scratch = tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path)))
+    workbook = XlsxWriterWorkbook(path, {
+        'constant_memory': True,
+        'tmpdir': scratch.name
+    })
     
     # Data sheet
     worksheet = workbook.add_worksheet('Expenses')
@@ -49,19 +58,6 @@ def export_expenses_to_excel(db: Session) -> BytesIO:
     date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
     currency_format = workbook.add_format({'num_format': '£#,##0.00'})
     
-    # Headers
-    headers = ['ID', 'Date', 'Category', 'Description', 'Amount']
-    for col_num, header in enumerate(headers):
-        worksheet.write(0, col_num, header, header_format)
-    
-    # Data rows
-    for row_num, expense in enumerate(expenses, 1):
-        worksheet.write(row_num, 0, expense.id)
-        worksheet.write_datetime(row_num, 1, expense.date, date_format)
-        worksheet.write(row_num, 2, expense.category)
-        worksheet.write(row_num, 3, expense.description or '')
-        worksheet.write(row_num, 4, expense.amount, currency_format)
-    
     # Auto-adjust column widths
     worksheet.set_column('A:A', 8)  # ID
     worksheet.set_column('B:B', 20)  # Date
@@ -69,6 +65,24 @@ def export_expenses_to_excel(db: Session) -> BytesIO:
     worksheet.set_column('D:D', 30)  # Description
     worksheet.set_column('E:E', 12)  # Amount
     
+    # Headers
+    headers = ['ID', 'Date', 'Category', 'Description', 'Amount']
+    for col_num, header in enumerate(headers):
+        worksheet.write(0, col_num, header, header_format)
+    
+    # Data rows, streamed as plain column tuples (constant_memory needs row order)
+    rows = db.execute(
+        select(Expense.id, Expense.date, Expense.category, Expense.description, Expense.amount)
+        .order_by(Expense.date.desc())
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    for row_num, (expense_id, date, category, description, amount) in enumerate(rows, 1):
+        worksheet.write(row_num, 0, expense_id)
+        worksheet.write_datetime(row_num, 1, date, date_format)
+        worksheet.write(row_num, 2, category)
+        worksheet.write(row_num, 3, description or '')
+        worksheet.write(row_num, 4, amount, currency_format)
+    
     # Statistics sheet
     stats_sheet = workbook.add_worksheet('Statistics')
     
@@ -85,6 +99,8 @@ def export_expenses_to_excel(db: Session) -> BytesIO:
         ['Max Expense', stats['max_expense']],
         ['Standard Deviation', stats['std_deviation']]
     ]
+    if data_version is not None:
+        stats_data.append(['Data Version', data_version])
     
     for row_num, (metric, value) in enumerate(stats_data, 1):
         stats_sheet.write(row_num, 0, metric)
@@ -158,14 +174,8 @@ def export_expenses_to_excel(db: Session) -> BytesIO:
     chart3.set_size({'width': 480, 'height': 300})
     chart_sheet.insert_chart('B38', chart3)
     
-    workbook.close()
-    
-    # Read the file back into BytesIO
-    with open(temp_path, 'rb') as f:
-        output.write(f.read())
-    
-    # Clean up temp file
-    os.unlink(temp_path)
-    
-    output.seek(0)
-    return output
+    try:
+        workbook.close()
+    finally:
+        scratch.cleanup()
+    return path
@@ -0,0 +1,284 @@
+"""
+Background Excel export jobs with a versioned on-disk cache
+
+A job's id is derived from the data version and the export parameters, so
+asking for the same export twice without a write in between returns the
+same job, and once built its file is served straight from the cache.
+Workbooks are built in a small process pool (spawned, so no database
+connections are inherited) to keep xlsxwriter off the serving process's
+GIL. The cache directory is bounded by EXPORT_CACHE_MAX_FILES and
+EXPORT_CACHE_MAX_BYTES, evicting least recently downloaded files first.
+
+Job state other than failures lives on disk: a finished file means done,
+a partial file means running. Every worker process therefore reports the
+same status for a job. The partial file is created with O_EXCL and doubles
+as a claim, so one build runs per job; a process that loses the claim
+waits for the winner's file.
+
+A build reads the statistics and the rows in one transaction and labels
+the workbook with the data version it read. That is the job's version
+once it is built, and can be newer than the version it was started at.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+from app.database import DB_DIR
+from app.metrics import phase
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(DB_DIR, "exports"))
+EXPORT_CACHE_MAX_FILES = int(os.getenv("EXPORT_CACHE_MAX_FILES", "20"))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Partial files older than this are left over from a crashed build
+EXPORT_JOB_TIMEOUT = float(os.getenv("EXPORT_JOB_TIMEOUT", "3600"))
+
+# Finished jobs remembered per process for their status and errors
+MAX_TRACKED_JOBS = 100
+# How often a job built by another process is checked for its file
+FOLLOW_POLL_SECONDS = 0.2
+
+EXPORT_FORMATS = {"xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+
+_PARTIAL_SUFFIX = ".partial"
+
+def job_id_for(version: int, **params) -> str:
+    """Cache key of an export of the data at version with params"""
+    key = repr((version, sorted(params.items())))
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+def file_path(job_id: str, format: str = "xlsx") -> str:
+    return os.path.join(EXPORT_CACHE_DIR, f"{job_id}.{format}")
+
+def _partial_path(job_id: str, format: str) -> str:
+    return f"{file_path(job_id, format)}{_PARTIAL_SUFFIX}"
+
+def _claimed(job_id: str, format: str) -> bool:
+    """Whether a build of job_id is in progress in any process"""
+    try:
+        return os.path.getmtime(_partial_path(job_id, format)) >= time.time() - EXPORT_JOB_TIMEOUT
+    except FileNotFoundError:
+        return False
+
+def _claim(job_id: str, format: str) -> Optional[str]:
+    """Create the partial file of job_id for this process to build, or None if another process holds it"""
+    path = _partial_path(job_id, format)
+    for _ in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return path
+        except FileExistsError:
+            if _claimed(job_id, format):
+                return None
+            # Left over from a crashed build
+            _unlink(path)
+    return None
+
+def _init_worker():
+    # Nothing publishes commits to a pool process, so an index built here would
+    # go stale after the first write and pin every amount for the process's
+    # life; the statistics read the amounts of each export instead
+    from app import percentiles
+    percentiles.index = None
+
+def build_export(job_id: str, format: str) -> Optional[Tuple[int, int]]:
+    """Build one export into the cache; runs in a pool process.
+
+    Returns the file size and the data version the workbook holds, or None
+    when another process builds (or has built) it.
+    """
+    from sqlalchemy import select
+    from app.database import SessionLocal, read_transaction
+    from app.excel_export import export_expenses_to_excel
+    from app.models import DataVersion
+
+    final = file_path(job_id, format)
+    partial = _claim(job_id, format)
+    if partial is None:
+        return None
+    if os.path.exists(final):
+        _unlink(partial)
+        return None
+    db = SessionLocal()
+    try:
+        # Statistics and rows from one snapshot, labelled with its version
+        with read_transaction(db):
+            version = db.scalar(select(DataVersion.version).where(DataVersion.id == 1)) or 0
+            export_expenses_to_excel(db, partial, data_version=version)
+    except BaseException:
+        _unlink(partial)
+        raise
+    finally:
+        db.close()
+    # Readers only ever see complete files
+    os.replace(partial, final)
+    return os.path.getsize(final), version
+
+def evict(keep: Optional[str] = None):
+    """Remove least recently used exports beyond the file count and size limits"""
+    entries = []
+    stale = time.time() - EXPORT_JOB_TIMEOUT
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        path = os.path.join(EXPORT_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if name.endswith(_PARTIAL_SUFFIX):
+            if stat.st_mtime < stale:
+                _unlink(path)
+            continue
+        # Skip builds' scratch files and the export just written
+        if os.path.splitext(name)[1][1:] not in EXPORT_FORMATS or path == keep:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    entries.sort()
+    total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep and os.path.exists(keep) else 0)
+    count = len(entries) + (1 if keep else 0)
+    for _, size, path in entries:
+        if count <= EXPORT_CACHE_MAX_FILES and total <= EXPORT_CACHE_MAX_BYTES:
+            break
+        _unlink(path)
+        count -= 1
+        total -= size
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def touch(path: str):
+    """Mark a cached export as recently used"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+class ExportJob:
+    """An export being built by this process"""
+
+    def __init__(self, job_id: str, format: str, version: int):
+        self.job_id = job_id
+        self.format = format
+        # The data version the job was started at, then the one its build read
+        self.version = version
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+class ExportJobManager:
+    """Starts export jobs once per cache key and reports their status"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, ExportJob] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._pool
+
+    def start(self, version: int, format: str = "xlsx") -> str:
+        """Start (or reuse) the export of the data at version; returns the job id"""
+        job_id = job_id_for(version, format=format)
+        job = self._jobs.get(job_id)
+        if job is not None and job.finished_at is None:
+            return job_id
+        if os.path.exists(file_path(job_id, format)):
+            touch(file_path(job_id, format))
+            return job_id
+
+        os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+        job = self._jobs[job_id] = ExportJob(job_id, format, version)
+        job.task = asyncio.create_task(self._run(job))
+        return job_id
+
+    async def _run(self, job: ExportJob):
+        loop = asyncio.get_running_loop()
+        try:
+            built = None
+            if not _claimed(job.job_id, job.format):
+                with phase("workbook"):
+                    built = await loop.run_in_executor(self._get_pool(), build_export, job.job_id, job.format)
+            if built is None:
+                await self._follow(job)
+            else:
+                _, job.version = built
+                evict(keep=file_path(job.job_id, job.format))
+        except Exception as exc:
+            if isinstance(exc, BrokenProcessPool):
+                # A worker died; later jobs get a fresh pool
+                self._pool = None
+            job.error = f"{type(exc).__name__}: {exc}"
+        finally:
+            job.finished_at = time.time()
+            self._prune()
+
+    async def _follow(self, job: ExportJob):
+        """Wait for the file of a job another process is building"""
+        path = file_path(job.job_id, job.format)
+        while not os.path.exists(path):
+            # The file replaces the partial file, so check for it once more
+            if not _claimed(job.job_id, job.format) and not os.path.exists(path):
+                raise RuntimeError("The export failed in another worker")
+            await asyncio.sleep(FOLLOW_POLL_SECONDS)
+
+    def _prune(self):
+        finished = sorted(
+            (job.finished_at, job_id) for job_id, job in self._jobs.items() if job.finished_at is not None
+        )
+        for _, job_id in finished[:max(0, len(self._jobs) - MAX_TRACKED_JOBS)]:
+            del self._jobs[job_id]
+
+    async def wait(self, job_id: str):
+        """Wait for a job started by this process to finish"""
+        job = self._jobs.get(job_id)
+        if job is not None and job.task is not None:
+            await asyncio.shield(job.task)
+
+    def status(self, job_id: str, format: str = "xlsx") -> Optional[Dict]:
+        """Status of a job, or None when it is unknown to every worker"""
+        path = file_path(job_id, format)
+        job = self._jobs.get(job_id)
+        if os.path.exists(path):
+            state = "done"
+        elif job is not None and job.error is not None:
+            state = "failed"
+        elif (job is not None and job.finished_at is None) or _claimed(job_id, format):
+            state = "running"
+        else:
+            # Never started here, or built and since evicted
+            return None
+        return {
+            "job_id": job_id,
+            "status": state,
+            "format": format,
+            "version": job.version if job is not None else None,
+            "created_at": job.created_at if job is not None else None,
+            "finished_at": job.finished_at if job is not None else None,
+            "size": os.path.getsize(path) if state == "done" else None,
+            "error": job.error if state == "failed" else None
+        }
+
+    def shutdown(self):
+        for job in self._jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+manager = ExportJobManager(EXPORT_WORKERS)
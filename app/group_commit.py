@@ -0,0 +1,152 @@
+"""
+Group commit for expense writes
+
+When enabled (GROUP_COMMIT=1), create/update/delete requests are queued and
+applied by a single writer task. It collects requests for up to
+GROUP_COMMIT_WINDOW_MS milliseconds or GROUP_COMMIT_MAX_BATCH requests and
+commits them in one transaction, so bursts cost one fsync instead of one
+per request. Each request runs inside its own SAVEPOINT: a failing request
+is rolled back and reported to its caller alone, without affecting the
+rest of the batch. Login sessions (app.sessions) are written the same way,
+so a login never waits on a batch's lock.
+
+Whatever the mode, the writes of one process take turns on an asyncio lock,
+in arrival order, before they take SQLite's. SQLite's busy handler polls
+with growing sleeps, so a waiter can keep missing the moments the lock is
+free while the writer takes it back at once, and fail after busy_timeout.
+Bulk writes run off the event loop through run_write_in_executor, which
+takes the same turn.
+"""
+import asyncio
+import os
+import weakref
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal, run_in_executor
+
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "128"))
+
+Operation = Callable[..., Awaitable[Any]]
+
+# One write lock per event loop (tests run several loops in one process)
+_write_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+def write_lock() -> asyncio.Lock:
+    """The lock this process's writers take, in arrival order, before SQLite's"""
+    loop = asyncio.get_running_loop()
+    lock = _write_locks.get(loop)
+    if lock is None:
+        lock = _write_locks[loop] = asyncio.Lock()
+    return lock
+
+class GroupCommitWriter:
+    """Queue of write operations committed together in short windows"""
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the writer task on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit whatever is queued, then stop the writer task"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, operation: Operation, *args) -> Any:
+        """Run operation(db, *args) in the next group transaction and return its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, args, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                async with write_lock():
+                    await self._commit(batch)
+            except Exception as exc:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit(self, batch: List[Tuple[Operation, tuple, asyncio.Future]]):
+        outcomes = []
+        async with AsyncSessionLocal() as db:
+            if db.bind.dialect.name == "sqlite":
+                # The sqlite3 driver only begins on the first write, which would let
+                # the first SAVEPOINT open (and its RELEASE commit) the transaction
+                await db.execute(text("BEGIN IMMEDIATE"))
+            for operation, args, future in batch:
+                try:
+                    async with db.begin_nested():
+                        outcomes.append((future, await operation(db, *args), None))
+                except Exception as exc:
+                    outcomes.append((future, None, exc))
+            try:
+                await db.commit()
+            except Exception as exc:
+                # The whole transaction failed: every request in it shares the error
+                outcomes = [(future, None, exc) for future, _, _ in outcomes]
+
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+writer = GroupCommitWriter(GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_MAX_BATCH)
+
+async def run_write(db: AsyncSession, operation: Operation, *args) -> Any:
+    """Apply a write operation through the group writer, or directly and commit"""
+    if writer.running:
+        return await writer.submit(operation, *args)
+    async with write_lock():
+        if db.bind.dialect.name == "sqlite":
+            # Take the write lock before the operation reads the row it changes, as
+            # the writer does; otherwise concurrent requests read the same row and
+            # each fold their change into the derived data
+            await db.execute(text("BEGIN IMMEDIATE"))
+        result = await operation(db, *args)
+        await db.commit()
+        return result
+
+async def run_write_in_executor(fn: Callable, *args) -> Any:
+    """run_in_executor for a write: fn(db, *args) runs once the writes queued before it are done"""
+    async with write_lock():
+        return await run_in_executor(fn, *args)
@@ -2,31 +2,63 @@
 Main FastAPI application for Expense Tracker
 """
 from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
-import secrets
+from contextlib import asynccontextmanager
+import asyncio
 import os
 
-from app.database import init_db
-from app.routers import expenses
+from app.database import init_db, run_in_executor, sqlite_maintenance_loop
+from app import columnar, group_commit, export_jobs, metrics
+from app.sessions import SESSION_TTL, SessionSecret, session_sweep_loop
+from app.routers import expenses, budget
 from app.auth import get_current_user, verify_password, create_session, remove_session
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the database, then run maintenance, session expiry, the optional group-commit writer and the snapshot load"""
+    # Not at import, so importing the app has no side effects on the database;
+    # the production launcher (run.py --prod) does it once before starting
+    # workers, which would otherwise race on creating the tables
+    if os.getenv("EXPENSE_DB_INITIALIZED") != "1":
+        init_db()
+    maintenance = asyncio.create_task(sqlite_maintenance_loop())
+    session_sweep = asyncio.create_task(session_sweep_loop())
+    if group_commit.GROUP_COMMIT:
+        group_commit.writer.start()
+    # Load the columnar snapshot off the event loop; analytics use SQL until it is ready
+    snapshot_load = None
+    if columnar.snapshot is not None:
+        snapshot_load = asyncio.create_task(run_in_executor(columnar.snapshot.ensure))
+    yield
+    await group_commit.writer.stop()
+    export_jobs.manager.shutdown()
+    if snapshot_load is not None:
+        snapshot_load.cancel()
+    session_sweep.cancel()
+    maintenance.cancel()
+
 app = FastAPI(
     title="Expense Tracker",
     description="Personal finance tracker with statistics and Excel export",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Add session middleware for authentication
-app.add_middleware(SessionMiddleware, secret_key=secrets.token_urlsafe(32))
+# Add session middleware for authentication; the secret is shared by every
+# worker so a cookie signed by one is accepted by the others, and read when
+# the middleware stack is built on startup
+app.add_middleware(SessionMiddleware, secret_key=SessionSecret(), max_age=SESSION_TTL)
 
-# Initialize database
-init_db()
+# Outermost, so request timings include the session middleware
+if metrics.METRICS:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 # Include routers
 app.include_router(expenses.router, prefix="/api/expenses", tags=["Expenses"])
+app.include_router(budget.router, prefix="/api/budget", tags=["Budget"])
 
 # Templates
 templates = Jinja2Templates(directory="app/templates")
@@ -53,7 +85,7 @@ async def login(request: Request):
     password = form_data.get("password", "")
     
     if verify_password(username, password):
-        session_token = create_session()
+        session_token = await create_session(username)
         request.session["expense_session"] = session_token
         return RedirectResponse(url="/", status_code=302)
     else:
@@ -75,7 +107,7 @@ async def logout(request: Request):
     """Logout endpoint"""
     session_token = request.session.get("expense_session")
     if session_token:
-        remove_session(session_token)
+        await remove_session(session_token)
         request.session.clear()
     
     return RedirectResponse(url="/login", status_code=302)
@@ -85,6 +117,12 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+if metrics.METRICS:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint():
+        """Request, SQL and phase metrics in the Prometheus text format"""
+        return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8999"))
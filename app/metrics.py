@@ -0,0 +1,229 @@
+"""
+Request, SQL and phase instrumentation exported at /metrics
+
+MetricsMiddleware times every request and counts responses by route
+template (not the raw path, so ids do not multiply the series) and status.
+While a request runs its RequestMetrics is the current one in a context
+variable: the engine hooks in app.database add each SQL statement's time
+and the rows fetched to it, and phase() adds named timers around stats
+computation and workbook builds. When the request ends these per-request
+totals are recorded in histograms, which is what exposes N+1 patterns: a
+route whose queries-per-request histogram sits far above one.
+
+Everything is served in the Prometheus text format by render(), and with
+SERVER_TIMING=1 the per-request totals are also sent back in a
+Server-Timing header, which browsers show in their network panel.
+
+Counts are per process: with several workers (run.py --prod) each scrape
+reaches one of them, and the worker label keeps their series apart.
+METRICS=0 removes the middleware, the hooks and the endpoint.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import accumulate
+from typing import Dict, Optional, Sequence, Tuple
+
+METRICS = os.getenv("METRICS", "1") == "1"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+# Route label of requests that matched no route
+UNMATCHED = "<unmatched>"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class RequestMetrics:
+    """SQL and phase totals of one request"""
+
+    __slots__ = ("queries", "query_seconds", "rows", "phases")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.phases: Dict[str, float] = {}
+
+current: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+class Histogram:
+    """Bucket counts and sum of observations per label set"""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # Per label set: observations per bucket (the last one above every
+        # bound) and their sum; made cumulative when rendered
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self, extra: Labels) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = list(accumulate(counts))
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), cumulative):
+                le = bound if isinstance(bound, str) else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(labels + extra + (('le', le),))} {bucket_count}")
+            lines.append(f"{self.name}_sum{_labels(labels + extra)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(labels + extra)} {cumulative[-1]}")
+        return lines
+
+class Counter:
+    """Monotonic totals per label set"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._series: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self, extra: Labels) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(labels + extra)} {_number(value)}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+# Event loop and executor threads record concurrently
+_lock = threading.Lock()
+
+requests_total = Counter("expense_http_requests_total", "Requests by method, route and status")
+request_seconds = Histogram("expense_http_request_duration_seconds", "Request latency by method and route", SECONDS_BUCKETS)
+request_queries = Histogram("expense_db_queries_per_request", "SQL statements executed per request", QUERY_BUCKETS)
+request_rows = Histogram("expense_db_rows_per_request", "Rows fetched from the database per request", ROW_BUCKETS)
+request_query_seconds = Histogram("expense_db_seconds_per_request", "Time spent in SQL statements per request", SECONDS_BUCKETS)
+queries_total = Counter("expense_db_queries_total", "SQL statements executed, inside requests or not")
+query_seconds_total = Counter("expense_db_query_seconds_total", "Time spent in SQL statements, inside requests or not")
+phase_seconds = Histogram("expense_phase_duration_seconds", "Duration of timed phases (stats computation, workbook builds)", SECONDS_BUCKETS)
+
+REGISTRY = (
+    requests_total, request_seconds, request_queries, request_rows, request_query_seconds,
+    queries_total, query_seconds_total, phase_seconds
+)
+
+def record_query(seconds: float):
+    """Count one SQL statement that took seconds; called by the engine hooks"""
+    request = current.get()
+    if request is not None:
+        request.queries += 1
+        request.query_seconds += seconds
+    with _lock:
+        queries_total.inc(())
+        query_seconds_total.inc((), seconds)
+
+def record_phase(name: str, seconds: float):
+    request = current.get()
+    if request is not None:
+        request.phases[name] = request.phases.get(name, 0.0) + seconds
+    with _lock:
+        phase_seconds.observe((("phase", name),), seconds)
+
+@contextmanager
+def phase(name: str):
+    """Time the enclosed block as phase name, also in the current request's Server-Timing"""
+    if not METRICS:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+def record_request(method: str, route: str, status: int, seconds: float, request: RequestMetrics):
+    labels = (("method", method), ("route", route))
+    with _lock:
+        requests_total.inc(labels + (("status", str(status)),))
+        request_seconds.observe(labels, seconds)
+        request_queries.observe(labels, request.queries)
+        request_rows.observe(labels, request.rows)
+        request_query_seconds.observe(labels, request.query_seconds)
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    worker = (("worker", str(os.getpid())),)
+    with _lock:
+        lines = [line for metric in REGISTRY for line in metric.render(worker)]
+    return "\n".join(lines) + "\n"
+
+def server_timing(request: RequestMetrics, seconds: float) -> str:
+    """Server-Timing header value: SQL time and statement count, phases and the total"""
+    entries = [f'db;dur={request.query_seconds * 1000:.1f};desc="{request.queries} queries, {request.rows} rows"']
+    entries += [f"{name};dur={value * 1000:.1f}" for name, value in request.phases.items()]
+    entries.append(f"total;dur={seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+def route_template(scope) -> str:
+    """Path template of the route that handled scope, with its router's prefix"""
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    regex = getattr(route, "path_regex", None)
+    if template is None or regex is None:
+        return UNMATCHED
+    # Routes of included routers may know only their path within the router;
+    # the prefix is what precedes the part of the path their pattern matches
+    path = scope["path"]
+    for i, char in enumerate(path):
+        if char == "/" and regex.match(path[i:]):
+            return path[:i] + template
+    return template
+
+class MetricsMiddleware:
+    """ASGI middleware timing requests and recording their SQL and phase totals"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics()
+        token = current.set(request)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    value = server_timing(request, time.perf_counter() - started)
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current.reset(token)
+            record_request(scope["method"], route_template(scope), status, time.perf_counter() - started, request)
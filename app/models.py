@@ -1,7 +1,7 @@
 """
 Database models for Expense Tracker
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, Index
 from datetime import datetime
 from app.database import Base
 
@@ -11,7 +11,83 @@ class Expense(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     amount = Column(Float, nullable=False)
-    category = Column(String, nullable=False, index=True)
+    category = Column(String, nullable=False)
     description = Column(Text, nullable=True)
-    date = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    date = Column(DateTime, default=datetime.utcnow, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Keyset pagination newest first, with and without a category filter
+        Index("ix_expenses_date_id", "date", "id"),
+        Index("ix_expenses_category_date_id", "category", "date", "id"),
+        # Serve MIN/MAX lookups when a deleted expense was an aggregate bound
+        Index("ix_expenses_amount", "amount"),
+        Index("ix_expenses_category_amount", "category", "amount"),
+    )
+
+class ExpenseAggregate(Base):
+    """Running aggregates per category (the '' row holds the global totals)"""
+    __tablename__ = "expense_aggregates"
+
+    category = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    total_squares = Column(Float, nullable=False, default=0.0)
+    min_amount = Column(Float, nullable=True)
+    max_amount = Column(Float, nullable=True)
+
+class DailyRollup(Base):
+    """Expense count and total per calendar day"""
+    __tablename__ = "daily_rollups"
+
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+
+class WeeklyRollup(Base):
+    """Expense count and total per ISO week, keyed by the week's Monday"""
+    __tablename__ = "weekly_rollups"
+
+    week_start = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+
+class BudgetSetting(Base):
+    """Single-row table holding the configured weekly budget"""
+    __tablename__ = "budget_settings"
+
+    id = Column(Integer, primary_key=True)
+    weekly_limit = Column(Float, nullable=False)
+
+class DataVersion(Base):
+    """Single-row counter bumped by every expense write; ETags are derived from it"""
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class ExpenseChange(Base):
+    """One entry of the change log: an expense inserted, updated or deleted.
+
+    Updates and deletes keep the category, amount and date the expense had
+    before the change; seq is never reused, even after pruning.
+    """
+    __tablename__ = "expense_changes"
+
+    seq = Column(Integer, primary_key=True)
+    expense_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    category = Column(String, nullable=True)
+    amount = Column(Float, nullable=True)
+    date = Column(DateTime, nullable=True)
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class LoginSession(Base):
+    """A signed-in browser session, keyed by a hash of its token"""
+    __tablename__ = "login_sessions"
+
+    token_hash = Column(String, primary_key=True)
+    username = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
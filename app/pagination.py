@@ -0,0 +1,39 @@
+"""
+Opaque keyset cursors for paging expenses newest first (or best search match first)
+"""
+import base64
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+from app.schemas import to_naive_utc
+
+def encode_cursor(date: datetime, expense_id: int) -> str:
+    """Encode the (date, id) of the last row on a page"""
+    raw = f"{date.isoformat()}|{expense_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor, rejecting malformed ones"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, expense_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        # Dates are stored as naive UTC; a hand-made cursor may carry an offset
+        return to_naive_utc(datetime.fromisoformat(date)), int(expense_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_score_cursor(score: float, expense_id: int) -> str:
+    """Encode the (score, id) of the last search hit on a page"""
+    raw = f"{score!r}|{expense_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_score_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a cursor produced by encode_score_cursor, rejecting malformed ones"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, expense_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return float(score), int(expense_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,304 @@
+"""
+In-memory order statistics over expense amounts
+
+The PercentileIndex keeps every amount in a sorted list per category and
+overall (exact answers), plus a log-bucketed sketch per category whose
+answers are within a fixed relative error (approximate answers). Both
+support removal, so edits and deletes cost O(log n) and a median or p99 is
+read without touching the database.
+
+Committed changes arrive through app.changes, so rolled back writes never
+reach the index. The index is built lazily on first use. Every change
+carries the data version of its write; a gap (another process wrote, or
+the aggregates were rebuilt) drops the index, and every read rebuilds it
+when the database version has moved on without it.
+
+PERCENTILE_INDEX selects what is kept in memory:
+
+    exact   sorted lists and sketches (default)
+    approx  sketches only; exact answers read the amounts from the database
+    off     nothing; every answer reads the amounts from the database
+"""
+import math
+import os
+import threading
+from itertools import chain
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence
+
+from sortedcontainers import SortedDict, SortedList
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import changes
+from app.changes import Change
+from app.database import read_transaction
+from app.metrics import phase
+from app.models import DataVersion, Expense
+
+if TYPE_CHECKING:
+    import numpy as np
+
+PERCENTILE_MODES = ("exact", "approx", "off")
+PERCENTILE_INDEX = os.getenv("PERCENTILE_INDEX", "exact")
+if PERCENTILE_INDEX not in PERCENTILE_MODES:
+    raise ValueError(f"Unknown PERCENTILE_INDEX {PERCENTILE_INDEX!r}; expected one of {', '.join(PERCENTILE_MODES)}")
+# Relative error bound of approximate percentiles (0.01 = within 1%)
+PERCENTILE_ACCURACY = float(os.getenv("PERCENTILE_ACCURACY", "0.01"))
+
+# Rows fetched per round trip while building the index
+BUILD_CHUNK_SIZE = 50_000
+
+# Category key of the structures holding all expenses
+ALL = None
+
+class StaleIndex(Exception):
+    """A change did not match the indexed amounts, or followed a write the index missed"""
+
+def sorted_percentile(values: Sequence[float], q: float) -> float:
+    """Percentile q (0-100) of sorted values, interpolated like numpy's default.
+
+    The midpoint case averages the two middle values so the median equals
+    np.median exactly.
+    """
+    position = q / 100 * (len(values) - 1)
+    low = math.floor(position)
+    fraction = position - low
+    if fraction == 0:
+        return float(values[low])
+    a, b = float(values[low]), float(values[low + 1])
+    if fraction == 0.5:
+        return (a + b) / 2
+    if fraction < 0.5:
+        return a + (b - a) * fraction
+    return b - (b - a) * (1 - fraction)
+
+class AmountSketch:
+    """Quantile sketch with relative error guarantees (DDSketch-style log buckets).
+
+    Amounts in (gamma^(k-1), gamma^k] share bucket k and are reported as the
+    bucket's midpoint, so every answer is within relative_accuracy of an
+    amount at the requested rank. Counts can be decremented, which t-digest
+    does not allow. Non-positive amounts are counted in a zero bucket.
+    """
+
+    def __init__(self, relative_accuracy: float):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = SortedDict()
+        self.zero_count = 0
+        self.count = 0
+
+    def _key(self, amount: float) -> int:
+        return math.ceil(math.log(amount) / self._log_gamma)
+
+    def load(self, amounts: "np.ndarray"):
+        """Add an array of amounts at once"""
+        import numpy as np
+        positive = amounts[amounts > 0]
+        keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += len(amounts) - len(positive)
+        self.count += len(amounts)
+
+    def add(self, amount: float, weight: int = 1):
+        if amount <= 0:
+            if self.zero_count + weight < 0:
+                raise StaleIndex(amount)
+            self.zero_count += weight
+        else:
+            key = self._key(amount)
+            count = self.buckets.get(key, 0) + weight
+            if count < 0:
+                raise StaleIndex(amount)
+            if count:
+                self.buckets[key] = count
+            else:
+                del self.buckets[key]
+        self.count += weight
+
+    def remove(self, amount: float):
+        self.add(amount, -1)
+
+    def percentile(self, q: float) -> float:
+        """Approximate percentile q (0-100); the nearest ranked bucket's midpoint"""
+        rank = round(q / 100 * (self.count - 1))
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key, count in self.buckets.items():
+            seen += count
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 0.0
+
+class PercentileIndex:
+    """Sorted amounts and sketches per category, kept in step with commits"""
+
+    def __init__(self, exact: bool, relative_accuracy: float):
+        self.exact = exact
+        self.relative_accuracy = relative_accuracy
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._sorted: Optional[Dict[Optional[str], SortedList]] = None
+        self._sketches: Optional[Dict[Optional[str], AmountSketch]] = None
+        self._building = False
+        self._backlog: List[Change] = []
+        # Data version of the last change reflected in the index
+        self._version = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._sketches is not None
+
+    def invalidate(self):
+        """Drop the index; it is rebuilt on next use"""
+        with self._lock:
+            self._sorted = None
+            self._sketches = None
+            # A build in progress read rows that are now out of date
+            self._backlog = None if self._building else []
+
+    def apply(self, changes: Iterable[Change]):
+        """Apply committed changes; they are replayed after a build in progress"""
+        with self._lock:
+            if not self.ready:
+                if self._building and self._backlog is not None:
+                    self._backlog.extend(changes)
+                return
+            try:
+                self._replay(changes)
+            except StaleIndex:
+                self._sorted = None
+                self._sketches = None
+
+    def _replay(self, changes: Iterable[Change]):
+        for added, removed, version in changes:
+            if version <= self._version:
+                # Already part of the built index
+                continue
+            if version != self._version + 1:
+                # Another process wrote in between
+                raise StaleIndex(version)
+            self._apply(added, removed)
+            self._version = version
+
+    def _apply(self, added: List[tuple], removed: List[tuple]):
+        for _, category, amount, _ in removed:
+            for key in (category, ALL):
+                sketch = self._sketches.get(key)
+                if sketch is None:
+                    raise StaleIndex(amount)
+                sketch.remove(amount)
+                if self._sorted is not None:
+                    try:
+                        self._sorted[key].remove(amount)
+                    except ValueError:
+                        raise StaleIndex(amount)
+                if key is not ALL and sketch.count == 0:
+                    del self._sketches[key]
+                    if self._sorted is not None:
+                        del self._sorted[key]
+        for _, category, amount, _ in added:
+            for key in (category, ALL):
+                sketch = self._sketches.get(key)
+                if sketch is None:
+                    sketch = self._sketches[key] = AmountSketch(self.relative_accuracy)
+                    if self._sorted is not None:
+                        self._sorted[key] = SortedList()
+                sketch.add(amount)
+                if self._sorted is not None:
+                    self._sorted[key].add(amount)
+
+    def build(self, db: Session):
+        """Load every amount from the database, ordered by the (category, amount) index"""
+        import numpy as np
+        with self._build_lock:
+            with self._lock:
+                if self.ready:
+                    return
+                self._building = True
+                self._backlog = []
+            try:
+                by_category: Dict[str, List[float]] = {}
+                # The version and the amounts come from the same snapshot
+                with read_transaction(db) as connection:
+                    version = connection.execute(
+                        select(DataVersion.version).where(DataVersion.id == 1)
+                    ).scalar() or 0
+                    result = connection.execute(
+                        select(Expense.category, Expense.amount).order_by(Expense.category, Expense.amount)
+                    )
+                    try:
+                        while True:
+                            chunk = result.cursor.fetchmany(BUILD_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            for category, amount in chunk:
+                                by_category.setdefault(category, []).append(amount)
+                    finally:
+                        result.close()
+
+                sketches = {ALL: AmountSketch(self.relative_accuracy)}
+                for key, amounts in chain(by_category.items(), [(ALL, list(chain.from_iterable(by_category.values())))]):
+                    sketch = sketches.setdefault(key, AmountSketch(self.relative_accuracy))
+                    sketch.load(np.fromiter(amounts, dtype=np.float64, count=len(amounts)))
+                sorted_amounts = None
+                if self.exact:
+                    # Each category is already sorted; the global list merges their runs
+                    sorted_amounts = {key: SortedList(amounts) for key, amounts in by_category.items()}
+                    sorted_amounts[ALL] = SortedList(chain.from_iterable(by_category.values()))
+            finally:
+                with self._lock:
+                    backlog = self._backlog
+                    self._building = False
+                    self._backlog = []
+
+            with self._lock:
+                if backlog is None:
+                    return
+                self._sketches = sketches
+                self._sorted = sorted_amounts
+                self._version = version
+                try:
+                    self._replay(backlog)
+                except StaleIndex:
+                    self._sorted = None
+                    self._sketches = None
+
+    def percentiles(
+        self,
+        db: Session,
+        qs: Sequence[float],
+        category: Optional[str] = None,
+        approximate: bool = False
+    ) -> Optional[List[float]]:
+        """Percentiles (0-100) of amounts in category (None for all), or None if not indexed.
+
+        An index behind the version db reads is rebuilt before answering,
+        unless commits of this process are still being published to it.
+        """
+        if not approximate and not self.exact:
+            return None
+        current = db.get(DataVersion, 1)
+        current = current.version if current is not None else 0
+        with self._lock:
+            if self.ready and self._version < current and not changes.publishing():
+                self._sorted = None
+                self._sketches = None
+        if not self.ready:
+            with phase("percentile_index_build"):
+                self.build(db)
+        with self._lock:
+            if not self.ready:
+                return None
+            sketch = self._sketches.get(category)
+            if sketch is None or sketch.count == 0:
+                return [0.0 for _ in qs]
+            if approximate:
+                return [sketch.percentile(q) for q in qs]
+            return [sorted_percentile(self._sorted[category], q) for q in qs]
+
+index = PercentileIndex(PERCENTILE_INDEX == "exact", PERCENTILE_ACCURACY) if PERCENTILE_INDEX != "off" else None
+if index is not None:
+    changes.subscribe(index.apply, index.invalidate)
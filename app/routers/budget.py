@@ -0,0 +1,125 @@
+"""
+Weekly budget router endpoints
+
+Spending is read from the daily and weekly rollup tables maintained by
+app.aggregates, never from the raw expenses table.
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+import calendar
+import os
+
+from app.database import get_async_db
+from app.models import BudgetSetting, DailyRollup, WeeklyRollup
+from app.schemas import BudgetSettings, BudgetStatus, BudgetDay, BudgetPeriod
+from app.aggregates import week_start
+
+# Weekly limit used until one is saved through PUT /api/budget/
+DEFAULT_WEEKLY_LIMIT = float(os.getenv("BUDGET_WEEKLY_LIMIT", "100"))
+if not DEFAULT_WEEKLY_LIMIT > 0:
+    raise ValueError(f"BUDGET_WEEKLY_LIMIT must be greater than 0, got {DEFAULT_WEEKLY_LIMIT!r}")
+
+router = APIRouter()
+
+async def get_weekly_limit(db: AsyncSession) -> float:
+    """Configured weekly limit, falling back to BUDGET_WEEKLY_LIMIT"""
+    setting = await db.get(BudgetSetting, 1)
+    return setting.weekly_limit if setting else DEFAULT_WEEKLY_LIMIT
+
+@router.get("/", response_model=BudgetSettings)
+async def get_budget(db: AsyncSession = Depends(get_async_db)):
+    """Get the weekly budget"""
+    return BudgetSettings(weekly_limit=await get_weekly_limit(db))
+
+@router.put("/", response_model=BudgetSettings)
+async def set_budget(settings: BudgetSettings, db: AsyncSession = Depends(get_async_db)):
+    """Change the weekly budget"""
+    setting = await db.get(BudgetSetting, 1)
+    if setting is None:
+        db.add(BudgetSetting(id=1, weekly_limit=settings.weekly_limit))
+    else:
+        setting.weekly_limit = settings.weekly_limit
+    await db.commit()
+    return settings
+
+@router.get("/current", response_model=BudgetStatus)
+async def get_current_week(
+    on: Optional[date] = Query(None, description="Any day of the week to report (default: today, UTC)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get spending and remaining budget for the current (or given) ISO week"""
+    start = week_start(on or datetime.utcnow().date())
+    end = start + timedelta(days=6)
+    limit = await get_weekly_limit(db)
+
+    week = await db.get(WeeklyRollup, start)
+    spent = week.total if week else 0.0
+    days = (await db.execute(
+        select(DailyRollup)
+        .where(DailyRollup.day >= start, DailyRollup.day <= end)
+        .order_by(DailyRollup.day)
+    )).scalars().all()
+
+    iso_year, iso_week, _ = start.isocalendar()
+    return BudgetStatus(
+        week_start=start,
+        week_end=end,
+        iso_year=iso_year,
+        iso_week=iso_week,
+        weekly_limit=limit,
+        spent=spent,
+        remaining=limit - spent,
+        count=week.count if week else 0,
+        percent_used=spent / limit * 100,
+        days=[BudgetDay(day=row.day, total=row.total, count=row.count) for row in days]
+    )
+
+@router.get("/history", response_model=List[BudgetPeriod])
+async def get_history(
+    period: str = Query("week", pattern="^(week|month)$"),
+    limit: int = Query(12, ge=1, le=520, description="Number of most recent periods with spending"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get spending per week or month against the budget, newest first.
+
+    Monthly budgets are the weekly limit prorated over the days in the month.
+    """
+    weekly_limit = await get_weekly_limit(db)
+    periods = []
+
+    if period == "week":
+        rows = (await db.execute(
+            select(WeeklyRollup).order_by(WeeklyRollup.week_start.desc()).limit(limit)
+        )).scalars().all()
+        for row in rows:
+            periods.append((row.week_start, row.week_start + timedelta(days=6), weekly_limit, row.total, row.count))
+    else:
+        month = func.strftime("%Y-%m", DailyRollup.day)
+        rows = (await db.execute(
+            select(month, func.sum(DailyRollup.total), func.sum(DailyRollup.count))
+            .group_by(month)
+            .order_by(month.desc())
+            .limit(limit)
+        )).all()
+        for key, total, count in rows:
+            year, month_number = map(int, key.split("-"))
+            days_in_month = calendar.monthrange(year, month_number)[1]
+            start = date(year, month_number, 1)
+            end = date(year, month_number, days_in_month)
+            periods.append((start, end, weekly_limit * days_in_month / 7, total, count))
+
+    return [
+        BudgetPeriod(
+            period_start=start,
+            period_end=end,
+            limit=budget,
+            spent=spent,
+            remaining=budget - spent,
+            count=count,
+            over_budget=spent > budget
+        )
+        for start, end, budget, spent, count in periods
+    ]
@@ -1,103 +1,479 @@
 """
 Expense router endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Body, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from pydantic import TypeAdapter
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, List, Optional
 from datetime import datetime
+import asyncio
+import io
+import time
 
-from app.database import get_db
-from app.models import Expense
-from app.schemas import ExpenseCreate, ExpenseUpdate, ExpenseResponse, ExpenseStats
-from app.statistics import calculate_expense_statistics
-from app.excel_export import export_expenses_to_excel
-from fastapi.responses import StreamingResponse
+from app.database import AsyncSessionLocal, get_async_db, run_in_executor
+from app.models import Expense, ExpenseAggregate
+from app.aggregates import GLOBAL_KEY
+from app.schemas import UtcDateTime, ExpenseCreate, ExpenseUpdate, ExpenseResponse, ExpenseStats, PercentileStats, TimeSeries, CategorySummary, BulkImportResult, ExportJobStatus, SearchResult, ChangeFeed, ExpenseSelection, BulkExpenseUpdate, BulkChangeResult
+from app.statistics import calculate_expense_statistics, calculate_filtered_statistics, calculate_percentiles, calculate_timeseries
+from app import crud
+from app.group_commit import run_write, run_write_in_executor
+from app.pagination import encode_cursor, decode_cursor, encode_score_cursor, decode_score_cursor
+from app.serialization import EXPENSE_COLUMNS, EXPENSE_FIELDS, dumps, encode_rows, encode_ndjson, encode_csv
+from app.caching import response_cache, get_data_version, make_etag, etag_matches, not_modified, CACHE_CONTROL
+from app.bulk_import import bulk_insert, iter_json_rows, iter_ndjson_rows, iter_csv_rows
+from app import bulk_edit, change_log, export_jobs, search
+from app.change_log import ChangeLogExpired
+from app.metrics import phase
+from fastapi.responses import FileResponse, StreamingResponse
 
 router = APIRouter()
 
+# Rows fetched from the database cursor per streamed chunk
+STREAM_CHUNK_SIZE = 2000
+# Changed expenses sent per change-stream event
+CHANGE_STREAM_BATCH = 1000
+# An idle change stream sends a comment this often so proxies keep it open
+CHANGE_STREAM_HEARTBEAT_SECONDS = 15
+
+expense_list = TypeAdapter(List[ExpenseResponse])
+category_list = TypeAdapter(List[CategorySummary])
+
 @router.post("/", response_model=ExpenseResponse, status_code=status.HTTP_201_CREATED)
-async def create_expense(expense: ExpenseCreate, db: Session = Depends(get_db)):
+async def create_expense(expense: ExpenseCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new expense"""
-    db_expense = Expense(
-        amount=expense.amount,
-        category=expense.category,
-        description=expense.description,
-        date=expense.date or datetime.utcnow()
-    )
-    db.add(db_expense)
-    db.commit()
-    db.refresh(db_expense)
-    return db_expense
+    return await run_write(db, crud.create_expense, expense)
+
+@router.post("/bulk", response_model=BulkImportResult)
+async def create_expenses_bulk(rows: List[Any] = Body(...)):
+    """Create many expenses from a JSON array, reporting invalid rows"""
+    return await run_write_in_executor(bulk_insert, iter_json_rows(rows))
+
+@router.patch("/bulk", response_model=BulkChangeResult)
+async def update_expenses_bulk(request: BulkExpenseUpdate, dry_run: bool = False):
+    """Update every expense selected by ids and/or a filter in one statement; dry_run only counts them"""
+    return await run_write_in_executor(bulk_edit.update_expenses, request, dry_run)
+
+@router.delete("/bulk", response_model=BulkChangeResult)
+async def delete_expenses_bulk(selection: ExpenseSelection, dry_run: bool = False):
+    """Delete every expense selected by ids and/or a filter in one statement; dry_run only counts them"""
+    return await run_write_in_executor(bulk_edit.delete_expenses, selection, dry_run)
+
+@router.post("/import", response_model=BulkImportResult)
+async def import_expenses(
+    file: UploadFile = File(...),
+    format: Optional[str] = None
+):
+    """Import expenses from an uploaded CSV or NDJSON file"""
+    if format is None:
+        name = (file.filename or "").lower()
+        format = "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+    
+    # The upload is spooled to disk by the form parser; read it line by line
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    rows = iter_csv_rows(stream) if format == "csv" else iter_ndjson_rows(stream)
+    return await run_write_in_executor(bulk_insert, rows)
 
 @router.get("/", response_model=List[ExpenseResponse])
 async def get_expenses(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     category: str = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    fast: bool = True,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get expenses newest first with optional filtering.
+
+    Pass the X-Next-Cursor header of a page as ``cursor`` to fetch the next
+    one; unlike ``skip``, a cursor seeks straight to the page through the
+    (date, id) indexes, so deep pages cost the same as the first.
+
+    By default rows are selected as plain columns and encoded directly;
+    ``fast=false`` builds ORM objects and validates them through
+    ExpenseResponse instead. Both produce the same JSON.
+    """
+    etag = make_etag(await get_data_version(db), "list", skip=skip, limit=limit, category=category, cursor=cursor)
+    cached = response_cache.lookup(request, etag)
+    if cached is not None:
+        return cached
+    
+    query = select(*EXPENSE_COLUMNS) if fast else select(Expense)
+    
+    if category:
+        query = query.where(Expense.category == category)
+    
+    if cursor:
+        query = query.where(tuple_(Expense.date, Expense.id) < decode_cursor(cursor))
+    
+    query = query.order_by(Expense.date.desc(), Expense.id.desc()).offset(skip).limit(limit)
+    result = await db.execute(query)
+    expenses = result.all() if fast else result.scalars().all()
+    headers = {}
+    if expenses and len(expenses) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(expenses[-1].date, expenses[-1].id)
+    if fast:
+        body = encode_rows(expenses)
+    else:
+        body = expense_list.dump_json(expense_list.validate_python(expenses, from_attributes=True))
+    return response_cache.store(etag, body, headers)
+
+@router.get("/categories", response_model=List[CategorySummary])
+async def get_categories(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Get every category with its expense count and total, from the running aggregates"""
+    etag = make_etag(await get_data_version(db), "categories")
+    cached = response_cache.lookup(request, etag)
+    if cached is not None:
+        return cached
+    
+    rows = (await db.execute(
+        select(ExpenseAggregate.category, ExpenseAggregate.count, ExpenseAggregate.total)
+        .where(ExpenseAggregate.category != GLOBAL_KEY, ExpenseAggregate.count > 0)
+        .order_by(ExpenseAggregate.category)
+    )).all()
+    categories = [CategorySummary(category=category, count=count, total=total) for category, count, total in rows]
+    return response_cache.store(etag, category_list.dump_json(categories))
+
+async def _stream_rows(query, format: str):
+    """Encode query results chunk by chunk from a server-side cursor.
+
+    The generator opens its own session: the request's session is closed
+    before the response body is sent.
+    """
+    if format == "csv":
+        yield encode_csv([], header=EXPENSE_FIELDS)
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=STREAM_CHUNK_SIZE))
+        async for rows in result.partitions():
+            yield encode_csv(rows) if format == "csv" else encode_ndjson(rows)
+
+@router.get("/stream")
+async def stream_expenses(
+    start: Optional[UtcDateTime] = Query(None, description="Earliest expense date (inclusive)"),
+    end: Optional[UtcDateTime] = Query(None, description="Latest expense date (exclusive)"),
+    category: Optional[str] = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")
 ):
-    """Get all expenses with optional filtering"""
-    query = db.query(Expense)
+    """Stream every expense in a date range, oldest first, as NDJSON or CSV.
+
+    Rows are read through the (date, id) indexes in chunks and written as
+    they arrive, so memory stays flat and the first rows go out at once
+    however large the range is.
+    """
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    query = select(*EXPENSE_COLUMNS)
     
+    if start:
+        query = query.where(Expense.date >= start)
+    if end:
+        query = query.where(Expense.date < end)
     if category:
-        query = query.filter(Expense.category == category)
+        query = query.where(Expense.category == category)
+    
+    query = query.order_by(Expense.date, Expense.id)
+    if format == "csv":
+        return StreamingResponse(
+            _stream_rows(query, format),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=expenses.csv"}
+        )
+    return StreamingResponse(_stream_rows(query, format), media_type="application/x-ndjson")
+
+@router.get("/search", response_model=List[SearchResult])
+async def search_expenses(
+    request: Request,
+    q: str = Query(..., description='Words, "quoted phrases" and prefixes (tes*); all must match'),
+    start: Optional[UtcDateTime] = Query(None, description="Earliest expense date (inclusive)"),
+    end: Optional[UtcDateTime] = Query(None, description="Latest expense date (exclusive)"),
+    category: Optional[List[str]] = Query(None, description="Only these categories (repeatable)"),
+    order: str = Query("relevance", pattern="^(relevance|date)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Search expense descriptions and categories, best matches first.
+
+    Backed by the expense_search full-text index (see app.search). Pass
+    the X-Next-Cursor header of a page as ``cursor`` for the next one;
+    ``order=date`` lists the matches newest first instead. Relevance pages
+    stay consistent as long as no expense is written in between.
+    """
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    try:
+        match = search.parse_query(q)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    
+    etag = make_etag(
+        await get_data_version(db), "search",
+        q=match, start=start, end=end, category=category, order=order, limit=limit, cursor=cursor
+    )
+    cached = response_cache.lookup(request, etag)
+    if cached is not None:
+        return cached
+    
+    after = None
+    if cursor:
+        after = decode_cursor(cursor) if order == "date" else decode_score_cursor(cursor)
+    rows = (await db.execute(search.search_query(match, start, end, category, order, after, limit))).all()
+    headers = {}
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.date, last.id) if order == "date" else encode_score_cursor(last.score, last.id)
+    return response_cache.store(etag, encode_rows(rows, search.SEARCH_FIELDS), headers)
+
+@router.get("/changes", response_model=ChangeFeed)
+async def get_changes(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    """Get what changed after sequence number ``since``, one entry per changed expense.
+
+    Without ``since`` only the current sequence number is returned: read it
+    before loading the data it should keep up to date. 410 means the change
+    log no longer reaches back to ``since`` and everything must be reloaded.
+    """
+    if since is None:
+        body = {"seq": await run_in_executor(change_log.latest_seq), "changes": [], "more": False}
+        return Response(content=dumps(body), media_type="application/json")
+    
+    try:
+        entries, seq, more = await run_in_executor(change_log.read_changes, since, limit)
+    except ChangeLogExpired:
+        raise HTTPException(status_code=410, detail="The change log no longer reaches back to this sequence number")
+    return Response(content=dumps({"seq": seq, "changes": entries, "more": more}), media_type="application/json")
+
+async def _change_events(since: int):
+    """Server-sent events of the changes after since, as they are committed.
+
+    Each read takes a pooled connection only for as long as it runs.
+    """
+    quiet_since = time.monotonic()
+    with change_log.listen() as changed:
+        while True:
+            changed.clear()
+            try:
+                entries, seq, more = await run_in_executor(change_log.read_changes, since, CHANGE_STREAM_BATCH)
+            except ChangeLogExpired:
+                yield b"event: reset\ndata: {}\n\n"
+                return
+            if seq != since:
+                since = seq
+                body = dumps({"seq": seq, "changes": entries, "more": more})
+                yield b"id: %d\nevent: changes\ndata: %s\n\n" % (seq, body)
+                quiet_since = time.monotonic()
+                if more:
+                    continue
+            elif time.monotonic() - quiet_since >= CHANGE_STREAM_HEARTBEAT_SECONDS:
+                yield b": keep-alive\n\n"
+                quiet_since = time.monotonic()
+            
+            # Woken by commits of this process; polling catches other workers'
+            try:
+                await asyncio.wait_for(changed.wait(), change_log.CHANGE_STREAM_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+@router.get("/changes/stream")
+async def stream_changes(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """Push changes as server-sent events.
+
+    Each "changes" event carries a /changes body and its sequence number as
+    the event id, so a reconnecting EventSource resumes from Last-Event-ID.
+    A "reset" event means the client fell behind the change log and must
+    reload everything. Without ``since`` the stream starts at the current
+    sequence number.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    if since is None:
+        since = await run_in_executor(change_log.latest_seq)
     
-    expenses = query.order_by(Expense.date.desc()).offset(skip).limit(limit).all()
-    return expenses
+    return StreamingResponse(
+        _change_events(since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/{expense_id}", response_model=ExpenseResponse)
-async def get_expense(expense_id: int, db: Session = Depends(get_db)):
+async def get_expense(expense_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific expense by ID"""
-    expense = db.query(Expense).filter(Expense.id == expense_id).first()
-    if not expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    return expense
+    return await crud.get_expense_or_404(db, expense_id)
 
 @router.put("/{expense_id}", response_model=ExpenseResponse)
 async def update_expense(
     expense_id: int,
     expense_update: ExpenseUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update an expense"""
-    db_expense = db.query(Expense).filter(Expense.id == expense_id).first()
-    if not db_expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
-    update_data = expense_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_expense, field, value)
-    
-    db.commit()
-    db.refresh(db_expense)
-    return db_expense
+    return await run_write(db, crud.update_expense, expense_id, expense_update)
 
 @router.delete("/{expense_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_expense(expense_id: int, db: Session = Depends(get_db)):
+async def delete_expense(expense_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete an expense"""
-    db_expense = db.query(Expense).filter(Expense.id == expense_id).first()
-    if not db_expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
-    db.delete(db_expense)
-    db.commit()
+    await run_write(db, crud.delete_expense, expense_id)
     return None
 
 @router.get("/stats/summary", response_model=ExpenseStats)
-async def get_statistics(db: Session = Depends(get_db)):
-    """Get expense statistics"""
-    stats = calculate_expense_statistics(db)
-    return ExpenseStats(**stats)
+async def get_statistics(
+    request: Request,
+    start: Optional[UtcDateTime] = Query(None, description="Earliest expense date (inclusive)"),
+    end: Optional[UtcDateTime] = Query(None, description="Latest expense date (exclusive)"),
+    category: Optional[List[str]] = Query(None, description="Only these categories (repeatable)"),
+    mode: str = Query("exact", pattern="^(exact|approx)$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get expense statistics, over everything or a date range and set of categories.
+
+    mode=approx reads the lifetime median from the sketch; filtered
+    medians are always exact.
+    """
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    
+    etag = make_etag(await get_data_version(db), "summary", mode=mode, start=start, end=end, category=category)
+    cached = response_cache.lookup(request, etag)
+    if cached is not None:
+        return cached
+    
+    with phase("stats"):
+        if start or end or category:
+            stats = await run_in_executor(calculate_filtered_statistics, start, end, category)
+        else:
+            stats = await run_in_executor(calculate_expense_statistics, mode == "approx")
+    return response_cache.store(etag, ExpenseStats(**stats).model_dump_json().encode())
+
+@router.get("/stats/timeseries", response_model=TimeSeries)
+async def get_timeseries(
+    request: Request,
+    bucket: str = Query("month", pattern="^(day|week|month)$"),
+    start: Optional[UtcDateTime] = Query(None, description="Earliest expense date (inclusive)"),
+    end: Optional[UtcDateTime] = Query(None, description="Latest expense date (exclusive)"),
+    category: Optional[List[str]] = Query(None, description="Only these categories (repeatable)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get totals and counts per day, ISO week or month, with per-category splits"""
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    
+    etag = make_etag(await get_data_version(db), "timeseries", bucket=bucket, start=start, end=end, category=category)
+    cached = response_cache.lookup(request, etag)
+    if cached is not None:
+        return cached
+    
+    try:
+        with phase("stats"):
+            series = await run_in_executor(calculate_timeseries, bucket, start, end, category)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return response_cache.store(etag, TimeSeries(**series).model_dump_json().encode())
+
+@router.get("/stats/percentiles", response_model=PercentileStats)
+async def get_percentiles(
+    q: List[float] = Query([50, 90, 99], description="Percentiles to compute, 0-100"),
+    category: Optional[str] = None,
+    mode: str = Query("exact", pattern="^(exact|approx)$")
+):
+    """Get amount percentiles, overall or for one category"""
+    if any(not 0 <= value <= 100 for value in q):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+    
+    with phase("stats"):
+        return await run_in_executor(calculate_percentiles, q, category, mode == "approx")
+
+def _export_status(request: Request, job_id: str, format: str) -> Optional[ExportJobStatus]:
+    job = export_jobs.manager.status(job_id, format)
+    if job is None:
+        return None
+    download_url = None
+    if job["status"] == "done":
+        download_url = request.app.url_path_for("download_export", job_id=job_id)
+        if format != "xlsx":
+            download_url += f"?format={format}"
+    return ExportJobStatus(**job, download_url=download_url)
+
+@router.post("/exports", response_model=ExportJobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def start_export(
+    request: Request,
+    response: Response,
+    format: str = Query("xlsx", pattern="^xlsx$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Start building an export of the current data in the background.
+
+    Identical requests without a write in between share one job; when its
+    file is already cached the job is reported done straight away.
+    """
+    job_id = export_jobs.manager.start(await get_data_version(db), format)
+    job = _export_status(request, job_id, format)
+    if job.status == "done":
+        response.status_code = status.HTTP_200_OK
+    return job
+
+@router.get("/exports/{job_id}", response_model=ExportJobStatus)
+async def get_export(request: Request, job_id: str, format: str = Query("xlsx", pattern="^xlsx$")):
+    """Get the status of an export job"""
+    job = _export_status(request, job_id, format)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+@router.get("/exports/{job_id}/download", name="download_export")
+async def download_export(job_id: str, format: str = Query("xlsx", pattern="^xlsx$")):
+    """Download a finished export from the cache"""
+    job = export_jobs.manager.status(job_id, format)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    
+    path = export_jobs.file_path(job_id, format)
+    export_jobs.touch(path)
+    return FileResponse(
+        path,
+        media_type=export_jobs.EXPORT_FORMATS[format],
+        filename=f"expenses_export_{job_id}.{format}",
+        headers={"ETag": f'"{job_id}"', "Cache-Control": CACHE_CONTROL}
+    )
 
 @router.get("/export/excel")
-async def export_excel(db: Session = Depends(get_db)):
-    """Export expenses to Excel file"""
-    excel_file = export_expenses_to_excel(db)
+async def export_excel(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Export expenses to Excel file, waiting for the background job"""
+    version = await get_data_version(db)
+    etag = make_etag(version, "excel")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    job_id = export_jobs.manager.start(version)
+    await export_jobs.manager.wait(job_id)
+    job = export_jobs.manager.status(job_id)
+    if job is None or job["status"] != "done":
+        raise HTTPException(status_code=500, detail=(job or {}).get("error") or "Export failed")
+    if job["version"] is not None:
+        # The build may have read a version newer than the one it was started at
+        etag = make_etag(job["version"], "excel")
     
     filename = f"expenses_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
     
-    return StreamingResponse(
-        excel_file,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    # Served from the export cache, so repeat downloads are not rebuilt
+    path = export_jobs.file_path(job_id)
+    export_jobs.touch(path)
+    return FileResponse(
+        path,
+        media_type=export_jobs.EXPORT_FORMATS["xlsx"],
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "ETag": etag,
+            "Cache-Control": CACHE_CONTROL
+        }
     )
@@ -1,23 +1,32 @@
 """
 Pydantic schemas for Expense Tracker
 """
-from pydantic import BaseModel, Field, field_validator
-from datetime import datetime
-from typing import Optional
+from pydantic import AfterValidator, BaseModel, Field, field_validator, model_validator
+from datetime import date, datetime, timezone
+from typing import Annotated, List, Optional
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Convert an offset-aware datetime to naive UTC, the form expense dates are stored in"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+# Dates from clients: stored, compared and bucketed as naive UTC everywhere
+UtcDateTime = Annotated[datetime, AfterValidator(to_naive_utc)]
 
 class ExpenseCreate(BaseModel):
     """Schema for creating an expense"""
     amount: float = Field(..., gt=0, description="Expense amount (must be positive)")
     category: str = Field(..., min_length=1, max_length=50, description="Expense category")
     description: Optional[str] = Field(None, max_length=500, description="Optional description")
-    date: Optional[datetime] = Field(default_factory=datetime.utcnow, description="Expense date")
+    date: Optional[UtcDateTime] = Field(default_factory=datetime.utcnow, description="Expense date")
 
 class ExpenseUpdate(BaseModel):
     """Schema for updating an expense"""
     amount: Optional[float] = Field(None, gt=0)
     category: Optional[str] = Field(None, min_length=1, max_length=50)
     description: Optional[str] = Field(None, max_length=500)
-    date: Optional[datetime] = None
+    date: Optional[UtcDateTime] = None
 
 class ExpenseResponse(BaseModel):
     """Schema for expense response"""
@@ -31,6 +40,10 @@ class ExpenseResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SearchResult(ExpenseResponse):
+    """Schema for a full-text search hit; higher scores are better matches"""
+    score: float
+
 class ExpenseStats(BaseModel):
     """Schema for expense statistics"""
     total_expenses: float
@@ -42,3 +55,151 @@ class ExpenseStats(BaseModel):
     std_deviation: float
     category_breakdown: dict[str, float]
     category_counts: dict[str, int]
+
+class TimeSeriesPoint(BaseModel):
+    """Spending in one day, ISO week or month"""
+    period_start: date
+    total: float
+    count: int
+    category_breakdown: dict[str, float]
+    category_counts: dict[str, int]
+
+class TimeSeries(BaseModel):
+    """Schema for spending per bucket over a date range"""
+    bucket: str
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    total: float
+    count: int
+    points: List[TimeSeriesPoint]
+
+class CategorySummary(BaseModel):
+    """Schema for a category with its expense count and total"""
+    category: str
+    count: int
+    total: float
+
+class PercentileStats(BaseModel):
+    """Schema for amount percentiles"""
+    category: Optional[str] = None
+    mode: str
+    count: int
+    relative_accuracy: Optional[float] = None
+    percentiles: dict[str, float]
+
+class BulkRowError(BaseModel):
+    """Validation errors for one rejected row (rows are numbered from 1)"""
+    row: int
+    errors: List[str]
+
+class BulkImportResult(BaseModel):
+    """Schema for bulk insert and import results"""
+    inserted: int
+    failed: int
+    errors: List[BulkRowError]
+    errors_truncated: bool
+    elapsed_seconds: float
+    rows_per_second: float
+
+class ExpenseSelection(BaseModel):
+    """Schema selecting expenses for a bulk change; every given criterion must match"""
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=10000, description="Expense ids")
+    categories: Optional[List[str]] = Field(None, min_length=1, description="Any of these categories")
+    start: Optional[UtcDateTime] = Field(None, description="Earliest date (inclusive)")
+    end: Optional[UtcDateTime] = Field(None, description="Latest date (exclusive)")
+    min_amount: Optional[float] = Field(None, description="Smallest amount (inclusive)")
+    max_amount: Optional[float] = Field(None, description="Largest amount (inclusive)")
+
+    @model_validator(mode="after")
+    def check_criteria(self):
+        criteria = (self.ids, self.categories, self.start, self.end, self.min_amount, self.max_amount)
+        if all(criterion is None for criterion in criteria):
+            raise ValueError("Select expenses by ids or at least one filter")
+        if self.start and self.end and self.end <= self.start:
+            raise ValueError("end must be after start")
+        return self
+
+class BulkExpenseUpdate(ExpenseSelection):
+    """Schema for a bulk update: the fields given in set are written to every selected expense"""
+    set: ExpenseUpdate
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if not self.set.model_fields_set:
+            raise ValueError("set must change at least one field")
+        for field in ("amount", "category", "date"):
+            if field in self.set.model_fields_set and getattr(self.set, field) is None:
+                raise ValueError(f"set.{field} cannot be null")
+        return self
+
+class BulkChangeResult(BaseModel):
+    """Schema for bulk update and delete results; a dry run only counts"""
+    matched: int
+    changed: int
+    dry_run: bool
+    elapsed_seconds: float
+
+class BudgetSettings(BaseModel):
+    """Schema for the weekly budget setting"""
+    weekly_limit: float = Field(..., gt=0, description="Weekly spending limit")
+
+class BudgetDay(BaseModel):
+    """Spending on one day"""
+    day: date
+    total: float
+    count: int
+
+class BudgetStatus(BaseModel):
+    """Schema for spending against the budget in one ISO week"""
+    week_start: date
+    week_end: date
+    iso_year: int
+    iso_week: int
+    weekly_limit: float
+    spent: float
+    remaining: float
+    count: int
+    percent_used: float
+    days: List[BudgetDay]
+
+class BudgetPeriod(BaseModel):
+    """Schema for spending against the budget in one past week or month"""
+    period_start: date
+    period_end: date
+    limit: float
+    spent: float
+    remaining: float
+    count: int
+    over_budget: bool
+
+class ExportJobStatus(BaseModel):
+    """Schema for a background export job"""
+    job_id: str
+    status: str
+    format: str
+    version: Optional[int] = None
+    created_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    size: Optional[int] = None
+    error: Optional[str] = None
+    download_url: Optional[str] = None
+
+class ChangePrevious(BaseModel):
+    """Schema for the fields of a changed expense before the change"""
+    category: str
+    amount: float
+    date: datetime
+
+class ExpenseChangeEntry(BaseModel):
+    """Schema for the latest change of one expense (op "upsert" with its current row, or "delete")"""
+    seq: int
+    id: int
+    op: str
+    expense: Optional[ExpenseResponse] = None
+    previous: Optional[ChangePrevious] = None
+
+class ChangeFeed(BaseModel):
+    """Schema for a page of changes; pass seq back as since for the next one"""
+    seq: int
+    changes: List[ExpenseChangeEntry]
+    more: bool
@@ -0,0 +1,193 @@
+"""
+Full-text search over expense descriptions and categories
+
+An SQLite FTS5 table, expense_search, indexes the description and category
+of every expense. It is an external-content table: it holds only the
+index and reads the text back from expenses by rowid (the expense id).
+Triggers on expenses keep it in step with every insert, update and
+delete, so bulk imports and set-based statements are covered as well as
+ORM writes.
+
+Queries are words, "quoted phrases" and prefixes (word*); every term must
+match. Results are ranked with bm25, weighting description matches above
+category matches, and can be filtered by date range and category.
+
+Rebuild or check the index from the command line:
+
+    python -m app.search rebuild
+    python -m app.search verify
+"""
+import argparse
+import re
+import sys
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import Integer, and_, column, func, literal_column, or_, select, table, text, tuple_
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import Session
+
+from app.models import Expense
+from app.serialization import EXPENSE_COLUMNS, EXPENSE_FIELDS
+
+SEARCH_TABLE = "expense_search"
+# bm25 weights of the indexed columns, in declaration order
+DESCRIPTION_WEIGHT = 2.0
+CATEGORY_WEIGHT = 1.0
+
+# Response fields of a search hit: the expense plus its relevance
+SEARCH_FIELDS = EXPENSE_FIELDS + ("score",)
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        description, category,
+        content='expenses', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS expenses_search_insert AFTER INSERT ON expenses BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, description, category) VALUES (new.id, new.description, new.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS expenses_search_delete AFTER DELETE ON expenses BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description, category)
+        VALUES ('delete', old.id, old.description, old.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS expenses_search_update AFTER UPDATE OF description, category ON expenses BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description, category)
+        VALUES ('delete', old.id, old.description, old.category);
+        INSERT INTO {SEARCH_TABLE}(rowid, description, category) VALUES (new.id, new.description, new.category);
+    END""",
+]
+
+_search = table(SEARCH_TABLE, column("rowid", Integer))
+_match_column = literal_column(SEARCH_TABLE)
+# bm25 is lower for better matches; negated so higher scores rank first
+_score = (-func.bm25(_match_column, DESCRIPTION_WEIGHT, CATEGORY_WEIGHT)).label("score")
+
+# A "quoted phrase" or a bare word, either optionally followed by * for a prefix
+_TERM = re.compile(r'"([^"]*)"(\*?)|([^\s"]+)')
+
+def available(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+def ensure_search_index(db: Session):
+    """Create the search table and its triggers, indexing existing expenses the first time"""
+    if not available(db):
+        return
+    exists = db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_TABLE}
+    ).first() is not None
+    for statement in _DDL:
+        db.execute(text(statement))
+    if not exists:
+        rebuild(db)
+    db.commit()
+
+def rebuild(db: Session):
+    """Re-index every expense from the expenses table"""
+    db.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+def verify(db: Session) -> List[str]:
+    """Check that the index matches the expenses table, returning problems found"""
+    try:
+        db.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('integrity-check', 1)"))
+    except DatabaseError as exc:
+        return [f"{SEARCH_TABLE}: {exc.orig}"]
+    return []
+
+def parse_query(query: str) -> str:
+    """Translate a user query into an FTS5 MATCH expression.
+
+    Words and phrases are quoted, so operators and punctuation in the input
+    are searched for rather than interpreted; a trailing * keeps its
+    meaning as a prefix. Raises ValueError when nothing searchable is left.
+    """
+    terms = []
+    for phrase, phrase_prefix, word in _TERM.findall(query):
+        value, prefix = (phrase, phrase_prefix) if not word else (word.rstrip("*"), "*" if word.endswith("*") else "")
+        # Terms without a letter or digit have no tokens to look up
+        if not re.search(r"\w", value):
+            continue
+        terms.append('"' + value.replace('"', '""') + '"' + prefix)
+    if not terms:
+        raise ValueError("Search query has no words to search for")
+    return " ".join(terms)
+
+def search_query(
+    match: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    categories: Optional[Sequence[str]] = None,
+    order: str = "relevance",
+    after: Optional[Tuple] = None,
+    limit: Optional[int] = 50
+):
+    """Select matching expenses with their score, best first (or newest first for order="date").
+
+    after is the (score, id) or (date, id) of the last row of the previous
+    page, depending on order.
+    """
+    matches = _match_column.op("MATCH")(match)
+    if order != "date" and not (start or end or categories):
+        # Rank inside the index and look up only the page's expenses
+        hits = select(_search.c.rowid, _score).where(matches)
+        if after:
+            score, expense_id = after
+            hits = hits.where(or_(_score < score, and_(_score == score, _search.c.rowid < expense_id)))
+        hits = hits.order_by(_score.desc(), _search.c.rowid.desc()).limit(limit).subquery()
+        return (
+            select(*EXPENSE_COLUMNS, hits.c.score)
+            .join(hits, Expense.id == hits.c.rowid)
+            .order_by(hits.c.score.desc(), Expense.id.desc())
+        )
+
+    query = (
+        select(*EXPENSE_COLUMNS, _score)
+        .select_from(_search.join(Expense, Expense.id == _search.c.rowid))
+        .where(matches)
+    )
+    if start:
+        query = query.where(Expense.date >= start)
+    if end:
+        query = query.where(Expense.date < end)
+    if categories:
+        query = query.where(Expense.category.in_(categories))
+
+    if order == "date":
+        if after:
+            query = query.where(tuple_(Expense.date, Expense.id) < after)
+        query = query.order_by(Expense.date.desc(), Expense.id.desc())
+    else:
+        if after:
+            score, expense_id = after
+            query = query.where(or_(_score < score, and_(_score == score, Expense.id < expense_id)))
+        query = query.order_by(_score.desc(), Expense.id.desc())
+    return query.limit(limit)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the expense full-text search index")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args(argv)
+
+    from app.database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        if not available(db):
+            print("Full-text search needs SQLite")
+            return 1
+        if args.command == "rebuild":
+            rebuild(db)
+            db.commit()
+            print("Search index rebuilt")
+            return 0
+
+        problems = verify(db)
+        for problem in problems:
+            print(problem)
+        print("Search index OK" if not problems else "Search index does not match the expenses table")
+        return 1 if problems else 0
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Fast JSON encoding of expense rows
+
+Rows selected as plain column tuples are trusted database output, so they
+are encoded straight to bytes without building ORM objects or validating
+each one into a Pydantic model. orjson is used when installed; the
+standard library encoder produces the same JSON, only slower.
+
+The NDJSON and CSV encoders work on one chunk of rows at a time so that
+streaming responses never hold more than a chunk in memory.
+"""
+import csv
+import io
+import json
+from datetime import date
+from typing import Any, Iterable, Sequence
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from app.models import Expense
+
+# Field order of ExpenseResponse
+EXPENSE_FIELDS = ("id", "amount", "category", "description", "date", "created_at")
+EXPENSE_COLUMNS = tuple(getattr(Expense, field) for field in EXPENSE_FIELDS)
+
+def _default(value: Any):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON bytes, datetimes in ISO 8601 like Pydantic writes them"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+def row_dicts(rows: Iterable[Sequence], fields: Sequence[str] = EXPENSE_FIELDS) -> list:
+    return [dict(zip(fields, row)) for row in rows]
+
+def encode_rows(rows: Iterable[Sequence], fields: Sequence[str] = EXPENSE_FIELDS) -> bytes:
+    """JSON array of objects built from column tuples in fields order"""
+    return dumps(row_dicts(rows, fields))
+
+def encode_ndjson(rows: Iterable[Sequence], fields: Sequence[str] = EXPENSE_FIELDS) -> bytes:
+    """One JSON object per line, newline-terminated"""
+    return b"".join(dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+def encode_csv(rows: Iterable[Sequence], header: Sequence[str] = None) -> bytes:
+    """CSV lines for rows (preceded by header when given); datetimes in ISO 8601"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(
+        [value.isoformat() if isinstance(value, date) else value for value in row]
+        for row in rows
+    )
+    return buffer.getvalue().encode()
@@ -0,0 +1,225 @@
+"""
+Login session storage shared by every worker process
+
+Session tokens live in a pluggable backend selected by SESSION_BACKEND:
+
+    sqlite  the login_sessions table, shared by all workers and kept across
+            restarts (default)
+    memory  a dict in this process; only for a single worker
+
+Tokens are stored as SHA-256 hashes and expire SESSION_TTL seconds after
+login; expired rows are deleted by a background sweep. A small LRU cache
+in front of the backend answers repeat checks without a query. A logout
+takes effect at once in the worker that handled it and within
+SESSION_CACHE_SECONDS in the others.
+
+The cookie signing secret comes from SESSION_SECRET, or is generated once
+and kept in DB_DIR/session_secret so every worker and restart shares it.
+It is read when the session middleware is built at startup, not when the
+app is imported.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import DB_DIR, AsyncSessionLocal
+from app.group_commit import run_write
+from app.models import LoginSession
+
+logger = logging.getLogger(__name__)
+
+SESSION_BACKENDS = ("sqlite", "memory")
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+if SESSION_BACKEND not in SESSION_BACKENDS:
+    raise ValueError(f"Unknown SESSION_BACKEND {SESSION_BACKEND!r}; expected one of {', '.join(SESSION_BACKENDS)}")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+# How long a cached check is trusted before the backend is asked again
+SESSION_CACHE_SECONDS = float(os.getenv("SESSION_CACHE_SECONDS", "30"))
+# Seconds between deletions of expired sessions (0 disables)
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "600"))
+SESSION_SECRET_FILE = os.path.join(DB_DIR, "session_secret")
+
+def load_session_secret() -> str:
+    """SESSION_SECRET, or the secret persisted in DB_DIR, created on first use"""
+    secret = os.getenv("SESSION_SECRET")
+    if secret:
+        return secret
+    if not os.path.exists(SESSION_SECRET_FILE):
+        _create_session_secret()
+    with open(SESSION_SECRET_FILE) as f:
+        secret = f.read().strip()
+    if not secret:
+        raise RuntimeError(f"{SESSION_SECRET_FILE} is empty; remove it or set SESSION_SECRET")
+    return secret
+
+def _create_session_secret():
+    # Written in full under a scratch name, then linked into place: linking
+    # fails if the file exists, so when several workers start at once exactly
+    # one secret wins and nobody reads a partly written file
+    fd, scratch = tempfile.mkstemp(dir=DB_DIR, prefix=".session_secret.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_urlsafe(32))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(scratch, SESSION_SECRET_FILE)
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(scratch)
+
+class SessionSecret:
+    """Signing secret for SessionMiddleware, loaded when the middleware is built rather than at import"""
+
+    def __str__(self) -> str:
+        return load_session_secret()
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def _add(db: AsyncSession, token_hash: str, username: str, expires_at: datetime):
+    db.add(LoginSession(token_hash=token_hash, username=username, expires_at=expires_at))
+    await db.flush()
+
+async def _remove(db: AsyncSession, token_hash: str):
+    await db.execute(delete(LoginSession).where(LoginSession.token_hash == token_hash))
+
+async def _sweep(db: AsyncSession, now: datetime) -> int:
+    result = await db.execute(delete(LoginSession).where(LoginSession.expires_at <= now))
+    return result.rowcount
+
+class SQLiteSessionStore:
+    """Sessions in the login_sessions table.
+
+    Writes go through run_write, so with GROUP_COMMIT=1 they queue behind
+    the writer's batch instead of waiting on its lock.
+    """
+
+    async def add(self, token_hash: str, username: str, expires_at: datetime):
+        async with AsyncSessionLocal() as db:
+            await run_write(db, _add, token_hash, username, expires_at)
+
+    async def get(self, token_hash: str) -> Optional[Tuple[str, datetime]]:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(LoginSession, token_hash)
+            return (row.username, row.expires_at) if row is not None else None
+
+    async def remove(self, token_hash: str):
+        async with AsyncSessionLocal() as db:
+            await run_write(db, _remove, token_hash)
+
+    async def sweep(self, now: datetime) -> int:
+        async with AsyncSessionLocal() as db:
+            return await run_write(db, _sweep, now)
+
+class MemorySessionStore:
+    """Sessions in a dict; only suitable for a single worker process"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Tuple[str, datetime]] = {}
+
+    async def add(self, token_hash: str, username: str, expires_at: datetime):
+        self._sessions[token_hash] = (username, expires_at)
+
+    async def get(self, token_hash: str) -> Optional[Tuple[str, datetime]]:
+        return self._sessions.get(token_hash)
+
+    async def remove(self, token_hash: str):
+        self._sessions.pop(token_hash, None)
+
+    async def sweep(self, now: datetime) -> int:
+        expired = [key for key, (_, expires_at) in self._sessions.items() if expires_at <= now]
+        for key in expired:
+            del self._sessions[key]
+        return len(expired)
+
+class SessionManager:
+    """Creates and checks sessions through a backend with an LRU cache in front"""
+
+    def __init__(self, store, ttl: int, cache_size: int, cache_seconds: float):
+        self.store = store
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cache_seconds = cache_seconds
+        # token hash -> (username, expires_at, monotonic time checked)
+        self._cache: OrderedDict = OrderedDict()
+
+    def _remember(self, token_hash: str, username: str, expires_at: datetime):
+        if self.cache_size <= 0:
+            return
+        self._cache[token_hash] = (username, expires_at, time.monotonic())
+        self._cache.move_to_end(token_hash)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def create(self, username: str) -> str:
+        """Start a session for username and return its token"""
+        token = secrets.token_urlsafe(32)
+        token_hash = _hash(token)
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        await self.store.add(token_hash, username, expires_at)
+        self._remember(token_hash, username, expires_at)
+        return token
+
+    async def get(self, token: str) -> Optional[str]:
+        """Username of a live session, or None"""
+        token_hash = _hash(token)
+        cached = self._cache.get(token_hash)
+        if cached is not None and time.monotonic() - cached[2] < self.cache_seconds:
+            self._cache.move_to_end(token_hash)
+            username, expires_at, _ = cached
+        else:
+            self._cache.pop(token_hash, None)
+            found = await self.store.get(token_hash)
+            if found is None:
+                return None
+            username, expires_at = found
+            self._remember(token_hash, username, expires_at)
+        if expires_at <= datetime.utcnow():
+            self._cache.pop(token_hash, None)
+            return None
+        return username
+
+    async def remove(self, token: str):
+        """End a session"""
+        token_hash = _hash(token)
+        self._cache.pop(token_hash, None)
+        await self.store.remove(token_hash)
+
+    async def sweep(self) -> int:
+        """Delete expired sessions from the backend; returns how many"""
+        now = datetime.utcnow()
+        for token_hash in [key for key, (_, expires_at, _) in self._cache.items() if expires_at <= now]:
+            del self._cache[token_hash]
+        return await self.store.sweep(now)
+
+async def session_sweep_loop():
+    """Run manager.sweep every SESSION_SWEEP_INTERVAL seconds until cancelled"""
+    if SESSION_SWEEP_INTERVAL <= 0:
+        return
+    while True:
+        try:
+            await manager.sweep()
+        except Exception:
+            # A failed sweep (a locked database, say) is retried next interval
+            logger.exception("Sweeping expired sessions failed")
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+
+manager = SessionManager(
+    SQLiteSessionStore() if SESSION_BACKEND == "sqlite" else MemorySessionStore(),
+    SESSION_TTL,
+    SESSION_CACHE_SIZE,
+    SESSION_CACHE_SECONDS
+)
@@ -1,16 +1,180 @@
 """
 Statistics and analysis functions using numpy
+
+Lifetime totals are read from the running aggregates. Filtered counts,
+sums, minima, maxima and per-category breakdowns are computed with
+vectorized numpy operations over the columnar snapshot (app.columnar), or
+by SQLite when it is disabled. Medians and other percentiles come from the
+in-memory percentile index; without one, the amounts are streamed
+column-only into a preallocated numpy buffer without building ORM objects.
+
+numpy is imported inside the functions that use it, so importing the app
+does not load it.
 """
-import numpy as np
-from typing import List, Dict
+import math
+from datetime import date, datetime
+from typing import TYPE_CHECKING, List, Dict, Optional, Sequence
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from app.models import Expense
+from app.models import Expense, ExpenseAggregate
+from app.aggregates import GLOBAL_KEY, load_aggregates
+from app import percentiles
+from app.columnar import epoch_seconds, expense_columns
+from app.percentiles import sorted_percentile
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Rows fetched per round trip when streaming the amount column
+AMOUNT_CHUNK_SIZE = 50_000
+
+TIMESERIES_BUCKETS = ("day", "week", "month")
+# Largest number of buckets one time series may span
+MAX_TIMESERIES_POINTS = 5000
+
+_SECONDS_PER_DAY = 86400
+
+def summarize_amounts(db: Session, *criteria) -> Dict:
+    """Count, sum, sum of squares, min and max of amounts matching criteria, in SQL"""
+    count, total, squares, low, high = db.execute(
+        select(
+            func.count(Expense.id),
+            func.coalesce(func.sum(Expense.amount), 0.0),
+            func.coalesce(func.sum(Expense.amount * Expense.amount), 0.0),
+            func.min(Expense.amount),
+            func.max(Expense.amount)
+        ).where(*criteria)
+    ).one()
+    return {"count": count, "total": total, "squares": squares, "min": low, "max": high}
+
+def category_breakdown(db: Session, *criteria) -> Dict[str, Dict]:
+    """Per-category count and total of amounts matching criteria, via GROUP BY"""
+    rows = db.execute(
+        select(Expense.category, func.count(Expense.id), func.sum(Expense.amount))
+        .where(*criteria)
+        .group_by(Expense.category)
+        .order_by(Expense.category)
+    )
+    return {category: {"count": count, "total": float(total)} for category, count, total in rows}
+
+def _criteria(start: Optional[datetime], end: Optional[datetime], categories: Optional[Sequence[str]]) -> list:
+    criteria = []
+    if start is not None:
+        criteria.append(Expense.date >= start)
+    if end is not None:
+        criteria.append(Expense.date < end)
+    if categories is not None:
+        criteria.append(Expense.category.in_(categories))
+    return criteria
+
+def filtered_summary(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    categories: Optional[Sequence[str]] = None
+) -> Dict:
+    """summarize_amounts over expenses with start <= date < end in categories, from the snapshot when loaded"""
+    columns = expense_columns(db, start, end, categories)
+    if columns is None:
+        return summarize_amounts(db, *_criteria(start, end, categories))
+    return _summarize_array(columns.amounts)
+
+def _summarize_array(amounts: "np.ndarray") -> Dict:
+    import numpy as np
+    if len(amounts) == 0:
+        return {"count": 0, "total": 0.0, "squares": 0.0, "min": None, "max": None}
+    return {
+        "count": len(amounts),
+        "total": float(amounts.sum()),
+        "squares": float(np.dot(amounts, amounts)),
+        "min": float(amounts.min()),
+        "max": float(amounts.max())
+    }
+
+def filtered_breakdown(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    categories: Optional[Sequence[str]] = None
+) -> Dict[str, Dict]:
+    """category_breakdown over expenses with start <= date < end in categories, via bincount when loaded"""
+    columns = expense_columns(db, start, end, categories)
+    if columns is None:
+        return category_breakdown(db, *_criteria(start, end, categories))
+    return columns.breakdown()
 
-def calculate_expense_statistics(db: Session) -> Dict:
+def load_amounts(db: Session, *criteria, count: Optional[int] = None) -> "np.ndarray":
+    """Stream the amount column into a float64 array without ORM hydration.
+
+    Pass the expected row count when it is already known to skip the COUNT
+    query; the buffer still grows if rows were added in the meantime.
+    """
+    import numpy as np
+    if count is None:
+        count = db.execute(select(func.count(Expense.id)).where(*criteria)).scalar_one()
+
+    buffer = np.empty(count, dtype=np.float64)
+    filled = 0
+    # Read plain tuples straight off the DBAPI cursor: no Row or ORM objects
+    result = db.connection().execute(select(Expense.amount).where(*criteria))
+    try:
+        while True:
+            chunk = result.cursor.fetchmany(AMOUNT_CHUNK_SIZE)
+            if not chunk:
+                break
+            end = filled + len(chunk)
+            if end > len(buffer):
+                buffer = np.resize(buffer, max(end, 2 * len(buffer)))
+            buffer[filled:end] = [row[0] for row in chunk]
+            filled = end
+    finally:
+        result.close()
+    return buffer[:filled]
+
+def amount_percentiles(
+    db: Session,
+    qs: Sequence[float],
+    category: Optional[str] = None,
+    approximate: bool = False,
+    count: Optional[int] = None
+) -> List[float]:
+    """Percentiles (0-100) of amounts, overall or for one category.
+
+    Answered from the percentile index when one is kept; otherwise the
+    amounts are loaded and sorted, which is always exact. Pass the count
+    from the aggregates, when known, to skip counting the amounts.
+    """
+    if percentiles.index is not None:
+        values = percentiles.index.percentiles(db, qs, category, approximate)
+        if values is not None:
+            return values
+
+    criteria = [Expense.category == category] if category is not None else []
+    amounts = load_amounts(db, *criteria, count=count)
+    if len(amounts) == 0:
+        return [0.0 for _ in qs]
+    amounts.sort()
+    return [sorted_percentile(amounts, q) for q in qs]
+
+def calculate_percentiles(db: Session, qs: Sequence[float], category: Optional[str] = None, approximate: bool = False) -> Dict:
+    """Requested percentiles of amounts, keyed "p50", "p99.9" and so on"""
+    row = db.get(ExpenseAggregate, category if category is not None else GLOBAL_KEY)
+    count = row.count if row is not None else 0
+    values = amount_percentiles(db, qs, category, approximate, count=count)
+    indexed = percentiles.index is not None and (approximate or percentiles.index.exact)
+    return {
+        "category": category,
+        "mode": "approx" if approximate else "exact",
+        "count": count,
+        "relative_accuracy": percentiles.PERCENTILE_ACCURACY if approximate and indexed else None,
+        "percentiles": {f"p{q:g}": value for q, value in zip(qs, values)}
+    }
+
+def calculate_expense_statistics(db: Session, approximate: bool = False) -> Dict:
     """Calculate comprehensive statistics for expenses"""
-    expenses = db.query(Expense).all()
+    overall, categories = load_aggregates(db)
     
-    if not expenses:
+    if overall is None or overall.count == 0:
         return {
             "total_expenses": 0.0,
             "total_count": 0,
@@ -23,47 +187,191 @@ def calculate_expense_statistics(db: Session) -> Dict:
             "category_counts": {}
         }
     
-    # Extract amounts as numpy array
-    amounts = np.array([exp.amount for exp in expenses])
-    
-    # Basic statistics using numpy
-    total_expenses = float(np.sum(amounts))
-    total_count = len(expenses)
-    average_expense = float(np.mean(amounts))
-    median_expense = float(np.median(amounts))
-    min_expense = float(np.min(amounts))
-    max_expense = float(np.max(amounts))
-    std_deviation = float(np.std(amounts))
-    
-    # Category breakdown
-    category_breakdown = {}
-    category_counts = {}
-    
-    for expense in expenses:
-        category = expense.category
-        if category not in category_breakdown:
-            category_breakdown[category] = 0.0
-            category_counts[category] = 0
-        category_breakdown[category] += expense.amount
-        category_counts[category] += 1
+    # Totals come from the running aggregates, the median from the percentile index
+    total_count = overall.count
+    average_expense = overall.total / total_count
+    variance = max(overall.total_squares / total_count - average_expense ** 2, 0.0)
+    median_expense, = amount_percentiles(db, [50], approximate=approximate, count=total_count)
     
     return {
-        "total_expenses": total_expenses,
+        "total_expenses": float(overall.total),
         "total_count": total_count,
-        "average_expense": average_expense,
+        "average_expense": float(average_expense),
         "median_expense": median_expense,
-        "min_expense": min_expense,
-        "max_expense": max_expense,
-        "std_deviation": std_deviation,
-        "category_breakdown": category_breakdown,
-        "category_counts": category_counts
+        "min_expense": float(overall.min_amount),
+        "max_expense": float(overall.max_amount),
+        "std_deviation": math.sqrt(variance),
+        "category_breakdown": {row.category: float(row.total) for row in categories},
+        "category_counts": {row.category: row.count for row in categories}
     }
 
-def calculate_category_statistics(db: Session, category: str) -> Dict:
+def calculate_filtered_statistics(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    categories: Optional[Sequence[str]] = None
+) -> Dict:
+    """calculate_expense_statistics over expenses with start <= date < end in categories.
+
+    Everything, the exact median included, comes from one pass over the
+    columnar snapshot; without it, from SQL plus the amount column.
+    """
+    import numpy as np
+    columns = expense_columns(db, start, end, categories)
+    if columns is not None:
+        amounts = columns.amounts
+        summary = _summarize_array(amounts)
+        breakdown = columns.breakdown()
+    else:
+        criteria = _criteria(start, end, categories)
+        summary = summarize_amounts(db, *criteria)
+        breakdown = category_breakdown(db, *criteria)
+        amounts = load_amounts(db, *criteria, count=summary["count"]) if summary["count"] else None
+
+    count = summary["count"]
+    if count == 0:
+        return {
+            "total_expenses": 0.0,
+            "total_count": 0,
+            "average_expense": 0.0,
+            "median_expense": 0.0,
+            "min_expense": 0.0,
+            "max_expense": 0.0,
+            "std_deviation": 0.0,
+            "category_breakdown": {},
+            "category_counts": {}
+        }
+
+    average = summary["total"] / count
+    variance = max(summary["squares"] / count - average ** 2, 0.0)
+    return {
+        "total_expenses": float(summary["total"]),
+        "total_count": count,
+        "average_expense": float(average),
+        "median_expense": float(np.median(amounts)),
+        "min_expense": float(summary["min"]),
+        "max_expense": float(summary["max"]),
+        "std_deviation": float(np.sqrt(variance)),
+        "category_breakdown": {name: group["total"] for name, group in breakdown.items()},
+        "category_counts": {name: group["count"] for name, group in breakdown.items()}
+    }
+
+def _bucket_keys(seconds: "np.ndarray", bucket: str) -> "np.ndarray":
+    """Bucket numbers of epoch seconds: days since the epoch for day and week, months for month"""
+    import numpy as np
+    days = seconds // _SECONDS_PER_DAY
+    if bucket == "month" and len(days):
+        # Look each day's month up in a table over the range of days, which is
+        # several times faster than converting every value to datetime64[M]
+        first = days.min()
+        months = np.arange(first, days.max() + 1).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        return months[days - first]
+    if bucket == "week":
+        # 1970-01-01 was a Thursday; step back to the Monday
+        return days - (days + 3) % 7
+    return days
+
+def _bucket_of(seconds: int, bucket: str) -> int:
+    import numpy as np
+    return int(_bucket_keys(np.array([seconds], dtype=np.int64), bucket)[0])
+
+def _bucket_start(key: int, bucket: str) -> date:
+    import numpy as np
+    return np.datetime64(key, "M" if bucket == "month" else "D").astype("datetime64[D]").item()
+
+def _timeseries(
+    bucket: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    seconds: "np.ndarray",
+    codes: "np.ndarray",
+    names: List[str],
+    amounts: "np.ndarray",
+    counts: Optional["np.ndarray"] = None
+) -> Dict:
+    """Bin rows (or pre-grouped rows carrying counts) into buckets with a bincount per measure"""
+    import numpy as np
+    keys = _bucket_keys(seconds, bucket)
+    empty = len(keys) == 0
+    first = _bucket_of(epoch_seconds(start), bucket) if start is not None else None if empty else int(keys.min())
+    # end is exclusive
+    last = _bucket_of(epoch_seconds(end) - 1, bucket) if end is not None else None if empty else int(keys.max())
+    result = {"bucket": bucket, "start": start, "end": end, "total": 0.0, "count": 0, "points": []}
+    if first is None or last is None or last < first:
+        return result
+
+    step = 7 if bucket == "week" else 1
+    size = (last - first) // step + 1
+    if size > MAX_TIMESERIES_POINTS:
+        raise ValueError(f"The range spans {size} {bucket}s; at most {MAX_TIMESERIES_POINTS} are allowed")
+
+    # One bincount over (bucket, category) pairs gives every split at once
+    width = len(names)
+    pairs = (keys - first) // step * width + codes
+    bucket_counts = np.bincount(pairs, weights=counts, minlength=size * width).reshape(size, width)
+    bucket_totals = np.bincount(pairs, weights=amounts, minlength=size * width).reshape(size, width)
+    order = sorted(range(width), key=names.__getitem__)
+
+    for slot in range(size):
+        present = [code for code in order if bucket_counts[slot, code]]
+        result["points"].append({
+            "period_start": _bucket_start(first + slot * step, bucket),
+            "total": float(bucket_totals[slot].sum()),
+            "count": int(bucket_counts[slot].sum()),
+            "category_breakdown": {names[code]: float(bucket_totals[slot, code]) for code in present},
+            "category_counts": {names[code]: int(bucket_counts[slot, code]) for code in present}
+        })
+    result["total"] = float(bucket_totals.sum())
+    result["count"] = int(bucket_counts.sum())
+    return result
+
+def calculate_timeseries(
+    db: Session,
+    bucket: str = "month",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    categories: Optional[Sequence[str]] = None
+) -> Dict:
+    """Totals and counts per day, ISO week or month, overall and per category.
+
+    Buckets run from the one holding start (or the first expense) to the
+    one holding end (or the last expense), empty ones included, in UTC.
+    Binned from the columnar snapshot, or from a per-day GROUP BY when it
+    is not loaded. Raises ValueError for an unknown bucket or a range of
+    more than MAX_TIMESERIES_POINTS buckets.
+    """
+    import numpy as np
+    if bucket not in TIMESERIES_BUCKETS:
+        raise ValueError(f"Unknown bucket {bucket!r}; expected one of {', '.join(TIMESERIES_BUCKETS)}")
+
+    columns = expense_columns(db, start, end, categories)
+    if columns is not None:
+        return _timeseries(bucket, start, end, columns.dates, columns.codes, columns.names, columns.amounts)
+
+    day = func.date(Expense.date)
+    rows = db.execute(
+        select(day, Expense.category, func.count(Expense.id), func.sum(Expense.amount))
+        .where(*_criteria(start, end, categories))
+        .group_by(day, Expense.category)
+    ).all()
+    days, row_categories, counts, totals = zip(*rows) if rows else ((), (), (), ())
+    names, codes = np.unique(np.array(row_categories, dtype=object), return_inverse=True)
+    return _timeseries(
+        bucket,
+        start,
+        end,
+        np.array(days, dtype="datetime64[D]").astype("datetime64[s]").astype(np.int64),
+        codes,
+        names.tolist(),
+        np.array(totals, dtype=np.float64),
+        np.array(counts, dtype=np.float64)
+    )
+
+def calculate_category_statistics(db: Session, category: str, approximate: bool = False) -> Dict:
     """Calculate statistics for a specific category"""
-    expenses = db.query(Expense).filter(Expense.category == category).all()
+    summary = filtered_summary(db, categories=[category])
     
-    if not expenses:
+    if summary["count"] == 0:
         return {
             "category": category,
             "total": 0.0,
@@ -74,14 +382,14 @@ def calculate_category_statistics(db: Session, category: str) -> Dict:
             "max": 0.0
         }
     
-    amounts = np.array([exp.amount for exp in expenses])
+    median, = amount_percentiles(db, [50], category, approximate, count=summary["count"])
     
     return {
         "category": category,
-        "total": float(np.sum(amounts)),
-        "count": len(expenses),
-        "average": float(np.mean(amounts)),
-        "median": float(np.median(amounts)),
-        "min": float(np.min(amounts)),
-        "max": float(np.max(amounts))
+        "total": float(summary["total"]),
+        "count": summary["count"],
+        "average": float(summary["total"] / summary["count"]),
+        "median": median,
+        "min": float(summary["min"]),
+        "max": float(summary["max"])
     }
@@ -0,0 +1,137 @@
+"""
+Columnar snapshot benchmark: filtered statistics from SQL vs the snapshot
+
+For each database size, measures the one-off load of the columnar snapshot
+(time and memory), then the latency of the same filtered questions
+answered by SQLite (summarize_amounts and category_breakdown) and by the
+snapshot (filtered_summary and filtered_breakdown): every expense, one
+90-day window, and one category over a year, plus a time series of
+every expense per month, week and day (calculate_timeseries, whose SQL
+path is a per-day GROUP BY). Also reports the cost of applying one edit.
+Each size runs in a fresh subprocess.
+
+    python -m benchmarks.bench_columnar --sizes 100000 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.dataset import use_database
+
+# Filters as (label, start, end, categories)
+FILTERS = [
+    ("all", None, None, None),
+    ("90 days", datetime(2024, 6, 1), datetime(2024, 8, 30), None),
+    ("Food, 1 year", datetime(2024, 1, 1), datetime(2025, 1, 1), ["Food"]),
+]
+
+def _best_ms(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+def run_worker(db_path: str, repeat: int):
+    """Measure one database in this process and print a JSON result"""
+    use_database(db_path)
+    from app.columnar import snapshot
+    from app.database import SessionLocal
+    from app import columnar
+    from app.statistics import (
+        _criteria, calculate_timeseries, category_breakdown, filtered_breakdown, filtered_summary, summarize_amounts
+    )
+
+    db = SessionLocal()
+    try:
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        snapshot.ensure(db)
+        load_seconds = time.perf_counter() - started
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        filters = {}
+        for label, start, end, categories in FILTERS:
+            criteria = _criteria(start, end, categories)
+            filters[label] = {
+                "sql_ms": _best_ms(lambda: (summarize_amounts(db, *criteria), category_breakdown(db, *criteria)), repeat),
+                "snapshot_ms": _best_ms(
+                    lambda: (filtered_summary(db, start, end, categories), filtered_breakdown(db, start, end, categories)),
+                    repeat
+                )
+            }
+
+        for bucket in ("month", "week", "day"):
+            with_snapshot = _best_ms(lambda: calculate_timeseries(db, bucket), repeat)
+            columnar.snapshot = None
+            try:
+                without = _best_ms(lambda: calculate_timeseries(db, bucket), 1)
+            finally:
+                columnar.snapshot = snapshot
+            filters[f"timeseries {bucket}"] = {"sql_ms": without, "snapshot_ms": with_snapshot}
+
+        version = snapshot.version
+        row = (int(snapshot._ids[0]), "Food", 12.34, datetime(2024, 1, 1))
+        edits = []
+        for _ in range(1000):
+            started = time.perf_counter()
+            snapshot.apply([([row], [row], version + 1)])
+            edits.append((time.perf_counter() - started) * 1000)
+            version += 1
+    finally:
+        db.close()
+
+    edits.sort()
+    print(json.dumps({
+        "load_ms": load_seconds * 1000,
+        "snapshot_rss_mb": (peak_kb - baseline_kb) / 1024,
+        "filters": filters,
+        "edit_p50_ms": edits[len(edits) // 2]
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--worker", metavar="DB_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.repeat)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        db_path = os.path.join(args.data_dir, f"expenses_{size}.db")
+        if not os.path.exists(db_path):
+            print(f"Seeding {size} rows into {db_path}...", file=sys.stderr)
+            subprocess.run(
+                [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({db_path!r}, {size})"],
+                check=True
+            )
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_columnar", "--repeat", str(args.repeat), "--worker", db_path],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = {"rows": size, **json.loads(output.strip().splitlines()[-1])}
+        results.append(result)
+        print(f"{size:>10} rows  load {result['load_ms']:8.1f} ms / {result['snapshot_rss_mb']:6.1f} MB"
+              f"  edit {result['edit_p50_ms']:.3f} ms")
+        for label, timing in result["filters"].items():
+            print(f"{'':>16}{label:<18} sql {timing['sql_ms']:8.1f} ms  snapshot {timing['snapshot_ms']:7.2f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Event-loop responsiveness check: /health latency during a large export
+
+Starts the app under uvicorn against a seeded database, downloads an Excel
+export and polls /health for as long as the export runs. Exits non-zero
+when the p99 health latency exceeds the budget, i.e. when a heavy request
+is blocking the event loop.
+
+    python -m benchmarks.bench_concurrency --rows 200000 --budget-ms 250
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.dataset import use_database
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def wait_until_up(session, base_url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{base_url}/health") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+async def measure(base_url: str, interval: float) -> dict:
+    async with aiohttp.ClientSession() as session:
+        await wait_until_up(session, base_url)
+
+        async def export():
+            started = time.perf_counter()
+            size = 0
+            async with session.get(f"{base_url}/api/expenses/export/excel") as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+            return time.perf_counter() - started, size
+
+        export_task = asyncio.create_task(export())
+        latencies = []
+        while not export_task.done():
+            started = time.perf_counter()
+            async with session.get(f"{base_url}/health") as response:
+                await response.read()
+            latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(interval)
+        export_seconds, export_bytes = await export_task
+
+    return {
+        "export_seconds": export_seconds,
+        "export_bytes": export_bytes,
+        "health_samples": len(latencies),
+        "health_p50_ms": percentile(latencies, 0.50),
+        "health_p99_ms": percentile(latencies, 0.99),
+        "health_max_ms": max(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    parser.add_argument("--interval", type=float, default=0.02, help="Seconds between health probes")
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Maximum allowed p99 health latency")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    db_path = os.path.join(args.data_dir, f"expenses_{args.rows}.db")
+    if not os.path.exists(db_path):
+        print(f"Seeding {args.rows} rows into {db_path}...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({db_path!r}, {args.rows})"],
+            check=True
+        )
+
+    use_database(db_path)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=os.environ.copy()
+    )
+    try:
+        result = asyncio.run(measure(f"http://127.0.0.1:{port}", args.interval))
+    finally:
+        server.terminate()
+        server.wait()
+
+    result["budget_ms"] = args.budget_ms
+    result["passed"] = result["health_p99_ms"] <= args.budget_ms
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
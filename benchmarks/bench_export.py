@@ -0,0 +1,118 @@
+"""
+Excel export benchmark: in-memory workbook vs constant-memory streaming
+
+Measures latency and peak RSS of export_expenses_to_excel against a
+reproduction of the original export (ORM list, in-memory workbook, temp
+file read back into BytesIO) at several database sizes. Each measurement
+runs in a fresh subprocess so peak RSS is not shared.
+
+    python -m benchmarks.bench_export --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.dataset import use_database
+
+IMPLEMENTATIONS = ["legacy", "streaming"]
+
+def legacy_export(db):
+    """The memory profile of the original export, data sheet only"""
+    import tempfile
+    from io import BytesIO
+    from xlsxwriter import Workbook
+    from app.models import Expense
+    from app.statistics import calculate_expense_statistics
+
+    expenses = db.query(Expense).order_by(Expense.date.desc()).all()
+    calculate_expense_statistics(db)
+    output = BytesIO()
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+    temp_file.close()
+    workbook = Workbook(temp_file.name)
+    worksheet = workbook.add_worksheet('Expenses')
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+    for row_num, expense in enumerate(expenses, 1):
+        worksheet.write(row_num, 0, expense.id)
+        worksheet.write_datetime(row_num, 1, expense.date, date_format)
+        worksheet.write(row_num, 2, expense.category)
+        worksheet.write(row_num, 3, expense.description or '')
+        worksheet.write(row_num, 4, expense.amount)
+    workbook.close()
+    with open(temp_file.name, 'rb') as f:
+        output.write(f.read())
+    os.unlink(temp_file.name)
+
+def streaming_export(db):
+    from app.excel_export import export_expenses_to_excel
+
+    path = export_expenses_to_excel(db)
+    # Read it back in chunks as FileResponse would
+    with open(path, 'rb') as f:
+        while f.read(64 * 1024):
+            pass
+    os.unlink(path)
+
+def run_worker(implementation: str, db_path: str):
+    """Measure one implementation in this process and print a JSON result"""
+    use_database(db_path)
+    from app.database import SessionLocal
+
+    function = {"legacy": legacy_export, "streaming": streaming_export}[implementation]
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        function(db)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "implementation": implementation,
+        "seconds": elapsed,
+        "peak_rss_delta_mb": (peak_kb - baseline_kb) / 1024
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--worker", nargs=2, metavar=("IMPLEMENTATION", "DB_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        db_path = os.path.join(args.data_dir, f"expenses_{size}.db")
+        if not os.path.exists(db_path):
+            print(f"Seeding {size} rows into {db_path}...", file=sys.stderr)
+            subprocess.run(
+                [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({db_path!r}, {size})"],
+                check=True
+            )
+        for implementation in IMPLEMENTATIONS:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_export", "--worker", implementation, db_path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = {"rows": size, **json.loads(output.strip().splitlines()[-1])}
+            results.append(result)
+            print(f"{size:>10} rows  {implementation:<10} {result['seconds'] * 1000:10.1f} ms"
+                  f"  {result['peak_rss_delta_mb']:8.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
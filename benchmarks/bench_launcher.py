@@ -0,0 +1,112 @@
+"""
+Launcher benchmark: requests per second under run.py vs run.py --prod
+
+Starts the server with each launcher against a seeded database and drives
+it with concurrent keep-alive clients for a fixed time, cycling through a
+few read endpoints (health, a page of the list, the summary and one
+category's time series), or only the paths given with --path. Reports
+throughput and latency percentiles.
+
+    python -m benchmarks.bench_launcher --rows 100000 --seconds 20 --concurrency 32
+    python -m benchmarks.bench_launcher --path /health
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.bench_concurrency import free_port, percentile, wait_until_up
+from benchmarks.dataset import use_database
+
+PATHS = [
+    "/health",
+    "/api/expenses/?limit=50",
+    "/api/expenses/stats/summary",
+    "/api/expenses/stats/timeseries?bucket=month&category=Food",
+]
+
+LAUNCHERS = {
+    "run.py": [],
+    "run.py --prod": ["--prod"],
+}
+
+async def drive(base_url: str, paths: list, seconds: float, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_until_up(session, base_url, timeout=60)
+        deadline = time.perf_counter() + seconds
+
+        async def client(offset: int):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                async with session.get(base_url + paths[i % len(paths)]) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+                i += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--path", action="append", help="Request only this path (repeatable)")
+    parser.add_argument("--workers", type=int, help="Workers for --prod (default: CPU count)")
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    db_path = os.path.join(args.data_dir, f"expenses_{args.rows}.db")
+    if not os.path.exists(db_path):
+        print(f"Seeding {args.rows} rows into {db_path}...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({db_path!r}, {args.rows})"],
+            check=True
+        )
+    use_database(db_path)
+    # Measure serving, not repeat hits on the response cache
+    os.environ["RESPONSE_CACHE_SIZE"] = "0"
+
+    results = []
+    for name, extra in LAUNCHERS.items():
+        port = free_port()
+        if args.workers and extra:
+            extra = extra + ["--workers", str(args.workers)]
+        server = subprocess.Popen(
+            [sys.executable, "run.py", "--port", str(port), *extra],
+            env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            result = {"launcher": name, **asyncio.run(drive(f"http://127.0.0.1:{port}", args.path or PATHS, args.seconds, args.concurrency))}
+        finally:
+            server.terminate()
+            server.wait()
+        results.append(result)
+        print(f"{name:<14} {result['requests_per_second']:8.0f} req/s  p50 {result['p50_ms']:7.1f} ms"
+              f"  p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Load test: mixed scenarios against every expenses endpoint
+
+Starts the app with `run.py --prod` on a copy of a seeded database (or targets a
+running server with --url), logs each virtual user in through /login and
+runs each scenario for a fixed time. A scenario is a weighted mix of
+operations, one or more requests each:
+
+    browse     list pages (offset and cursor), single expenses, categories,
+               date-range streams (NDJSON and CSV)
+    analytics  summary (plain and filtered), time series, percentiles
+    write      create, update, delete, bulk insert, CSV import
+    export     background export job (start, poll, download) and the
+               direct Excel download
+    mixed      all of the above, mostly reads
+
+Reports throughput and p50/p95/p99 latency per scenario and operation as
+JSON, and compares them with the stored baseline for the same parameters
+(benchmarks/baselines/load.json); exits non-zero on a regression or when
+any request failed.
+
+    python -m benchmarks.bench_load --rows 100000 --seconds 20 --users 16
+    python -m benchmarks.bench_load --scenario mixed --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import aiohttp
+
+from benchmarks import report
+from benchmarks.bench_concurrency import free_port, wait_until_up
+from benchmarks.dataset import CATEGORIES, seeded_database
+
+API = "/api/expenses"
+# The seeded dates span the three years before this
+DATA_END = datetime(2025, 1, 1)
+DATA_DAYS = 3 * 365
+
+class Context:
+    """State shared by the virtual users of one run"""
+
+    def __init__(self, base_url: str, seed: int):
+        self.base_url = base_url
+        self.rng = random.Random(seed)
+        # Ids of seeded expenses (read, never deleted) and of expenses this run created
+        self.known_ids = []
+        self.created_ids = []
+
+    def window(self, days: int):
+        start = DATA_END - timedelta(days=self.rng.randrange(DATA_DAYS - days))
+        return start - timedelta(days=days), start
+
+    def expense(self) -> dict:
+        return {
+            "amount": round(self.rng.lognormvariate(2.3, 0.9), 2) or 0.01,
+            "category": self.rng.choice(CATEGORIES),
+            "description": "Load test",
+            "date": (DATA_END - timedelta(seconds=self.rng.randrange(DATA_DAYS * 86400))).isoformat()
+        }
+
+async def _get(session, ctx, path: str, **params) -> int:
+    async with session.get(ctx.base_url + path, params=params) as response:
+        await response.read()
+        return response.status
+
+async def list_page(session, ctx, user):
+    return await _get(session, ctx, f"{API}/", limit=50, skip=ctx.rng.randrange(1000))
+
+async def list_cursor(session, ctx, user):
+    params = {"limit": 50}
+    if user.get("cursor"):
+        params["cursor"] = user["cursor"]
+    async with session.get(f"{ctx.base_url}{API}/", params=params) as response:
+        await response.read()
+        user["cursor"] = response.headers.get("X-Next-Cursor")
+        return response.status
+
+async def get_expense(session, ctx, user):
+    return await _get(session, ctx, f"{API}/{ctx.rng.choice(ctx.known_ids)}")
+
+async def categories(session, ctx, user):
+    return await _get(session, ctx, f"{API}/categories")
+
+async def stream(session, ctx, user):
+    start, end = ctx.window(30)
+    return await _get(
+        session, ctx, f"{API}/stream",
+        start=start.isoformat(), end=end.isoformat(), format=ctx.rng.choice(["ndjson", "csv"])
+    )
+
+async def summary(session, ctx, user):
+    return await _get(session, ctx, f"{API}/stats/summary")
+
+async def summary_filtered(session, ctx, user):
+    start, end = ctx.window(90)
+    return await _get(
+        session, ctx, f"{API}/stats/summary",
+        start=start.isoformat(), end=end.isoformat(), category=ctx.rng.choice(CATEGORIES)
+    )
+
+async def timeseries(session, ctx, user):
+    start, end = ctx.window(365)
+    return await _get(
+        session, ctx, f"{API}/stats/timeseries",
+        bucket=ctx.rng.choice(["day", "week", "month"]), start=start.isoformat(), end=end.isoformat()
+    )
+
+async def percentiles(session, ctx, user):
+    params = [("q", "50"), ("q", "95"), ("q", "99")]
+    if ctx.rng.random() < 0.5:
+        params.append(("category", ctx.rng.choice(CATEGORIES)))
+    async with session.get(f"{ctx.base_url}{API}/stats/percentiles", params=params) as response:
+        await response.read()
+        return response.status
+
+async def create(session, ctx, user):
+    async with session.post(f"{ctx.base_url}{API}/", json=ctx.expense()) as response:
+        body = await response.json()
+        if response.status == 201:
+            ctx.created_ids.append(body["id"])
+        return response.status
+
+async def update(session, ctx, user):
+    if not ctx.created_ids:
+        return await create(session, ctx, user)
+    # Taken out of the pool meanwhile so no other user deletes it concurrently
+    expense_id = ctx.created_ids.pop(ctx.rng.randrange(len(ctx.created_ids)))
+    try:
+        async with session.put(f"{ctx.base_url}{API}/{expense_id}", json=ctx.expense()) as response:
+            await response.read()
+            return response.status
+    finally:
+        ctx.created_ids.append(expense_id)
+
+async def delete(session, ctx, user):
+    if not ctx.created_ids:
+        return await create(session, ctx, user)
+    expense_id = ctx.created_ids.pop(ctx.rng.randrange(len(ctx.created_ids)))
+    async with session.delete(f"{ctx.base_url}{API}/{expense_id}") as response:
+        await response.read()
+        return response.status
+
+async def bulk(session, ctx, user):
+    rows = [ctx.expense() for _ in range(100)]
+    async with session.post(f"{ctx.base_url}{API}/bulk", json=rows) as response:
+        await response.read()
+        return response.status
+
+async def import_csv(session, ctx, user):
+    lines = ["amount,category,description,date"]
+    lines += [f"{row['amount']},{row['category']},{row['description']},{row['date']}" for row in
+              (ctx.expense() for _ in range(100))]
+    form = aiohttp.FormData()
+    form.add_field("file", "\n".join(lines).encode(), filename="expenses.csv", content_type="text/csv")
+    async with session.post(f"{ctx.base_url}{API}/import", data=form) as response:
+        await response.read()
+        return response.status
+
+async def export_job(session, ctx, user):
+    async with session.post(f"{ctx.base_url}{API}/exports") as response:
+        job = await response.json()
+        if response.status not in (200, 202):
+            return response.status
+    while job["status"] not in ("done", "failed"):
+        await asyncio.sleep(0.1)
+        async with session.get(f"{ctx.base_url}{API}/exports/{job['job_id']}") as response:
+            job = await response.json()
+            if response.status != 200:
+                return response.status
+    if job["status"] != "done":
+        return 500
+    return await _get(session, ctx, job["download_url"])
+
+async def export_excel(session, ctx, user):
+    return await _get(session, ctx, f"{API}/export/excel")
+
+BROWSE = {list_page: 3, list_cursor: 3, get_expense: 4, categories: 1, stream: 1}
+ANALYTICS = {summary: 3, summary_filtered: 3, timeseries: 2, percentiles: 2}
+WRITE = {create: 4, update: 3, delete: 2, bulk: 1, import_csv: 1}
+EXPORT = {export_job: 3, export_excel: 1}
+
+def _scaled(operations: dict, factor: float) -> dict:
+    return {operation: weight * factor for operation, weight in operations.items()}
+
+SCENARIOS = {
+    "browse": BROWSE,
+    "analytics": ANALYTICS,
+    "write": WRITE,
+    "export": EXPORT,
+    "mixed": {**_scaled(BROWSE, 5), **_scaled(ANALYTICS, 3), **_scaled(WRITE, 2), **_scaled(EXPORT, 0.05)},
+}
+
+async def login(session, base_url: str, username: str, password: str) -> int:
+    """Log in through the form; a successful login redirects, anything else is an error"""
+    data = {"username": username, "password": password}
+    async with session.post(f"{base_url}/login", data=data, allow_redirects=False) as response:
+        await response.read()
+        return 200 if response.status == 302 else max(response.status, 400)
+
+async def run_scenario(ctx: Context, name: str, seconds: float, users: int, credentials) -> dict:
+    operations = SCENARIOS[name]
+    choices, weights = list(operations), list(operations.values())
+    latencies = {operation.__name__: [] for operation in choices}
+    errors = {operation.__name__: 0 for operation in choices}
+    login_ms = []
+    login_errors = 0
+
+    async def user():
+        nonlocal login_errors
+        state = {}
+        async with aiohttp.ClientSession() as session:
+            started = time.perf_counter()
+            if await login(session, ctx.base_url, *credentials) >= 400:
+                # The API does not require a session; carry on and report it
+                login_errors += 1
+            login_ms.append((time.perf_counter() - started) * 1000)
+            while time.perf_counter() < deadline:
+                operation = ctx.rng.choices(choices, weights)[0]
+                started = time.perf_counter()
+                try:
+                    status = await operation(session, ctx, state)
+                except aiohttp.ClientError:
+                    status = 599
+                latencies[operation.__name__].append((time.perf_counter() - started) * 1000)
+                if status >= 400:
+                    errors[operation.__name__] += 1
+
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(users)))
+    elapsed = time.perf_counter() - started
+
+    results = {f"{name}/login": report.summarize(login_ms, elapsed, login_errors)}
+    for operation, samples in latencies.items():
+        results[f"{name}/{operation}"] = report.summarize(samples, elapsed, errors[operation])
+    everything = [value for samples in latencies.values() for value in samples]
+    results[f"{name}/total"] = report.summarize(everything, elapsed, sum(errors.values()))
+    return results
+
+async def run(base_url: str, scenarios, seconds: float, users: int, credentials, seed: int) -> dict:
+    ctx = Context(base_url, seed)
+    results = {}
+    async with aiohttp.ClientSession() as session:
+        await wait_until_up(session, base_url, timeout=60)
+        async with session.get(f"{base_url}{API}/", params={"limit": 1000}) as response:
+            ctx.known_ids = [row["id"] for row in await response.json()]
+    if not ctx.known_ids:
+        raise RuntimeError("the database has no expenses")
+    for name in scenarios:
+        results.update(await run_scenario(ctx, name, seconds, users, credentials))
+        total = results[f"{name}/total"]
+        print(f"{name:<10} {total['per_second']:8.1f} req/s  p50 {total['p50_ms']:7.1f} ms"
+              f"  p95 {total['p95_ms']:7.1f} ms  p99 {total['p99_ms']:7.1f} ms  errors {total['errors']}",
+              file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--users", type=int, default=16, help="Concurrent virtual users")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="Scenario to run (repeatable; default: all)")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Test a running server instead of starting one (it is written to)")
+    parser.add_argument("--username", default=os.getenv("EXPENSE_USERNAME", "user"))
+    parser.add_argument("--password", default=os.getenv("EXPENSE_PASSWORD", "password123"))
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    parser.add_argument("--group-commit", action="store_true",
+                        help="Start the server with GROUP_COMMIT=1 (writes batched by one writer task)")
+    # Lock waits on a busy machine make write latencies vary a lot between runs
+    report.add_arguments(parser, "load", tolerance=1.0)
+    args = parser.parse_args()
+
+    scenarios = args.scenario or list(SCENARIOS)
+    credentials = (args.username, args.password)
+    parameters = {
+        "rows": None if args.url else args.rows,
+        "seconds": args.seconds,
+        "users": args.users,
+        "workers": None if args.url else args.workers,
+        "group_commit": None if args.url else args.group_commit,
+        "scenarios": scenarios,
+        "seed": args.seed
+    }
+
+    if args.url:
+        results = asyncio.run(run(args.url.rstrip("/"), scenarios, args.seconds, args.users, credentials, args.seed))
+    else:
+        source = seeded_database(args.data_dir, args.rows)
+        with tempfile.TemporaryDirectory() as run_dir:
+            # Writes go to a copy, so every run starts from the same data
+            db_path = os.path.join(run_dir, "expenses.db")
+            shutil.copyfile(source, db_path)
+            env = {**os.environ, "DB_DIR": run_dir, "DATABASE_URL": f"sqlite:///{db_path}"}
+            env.pop("ASYNC_DATABASE_URL", None)
+            if args.group_commit:
+                env["GROUP_COMMIT"] = "1"
+            port = free_port()
+            # The production launcher creates any missing tables once before the workers start
+            server = subprocess.Popen(
+                [sys.executable, "run.py", "--prod", "--port", str(port), "--workers", str(args.workers)], env=env
+            )
+            try:
+                results = asyncio.run(
+                    run(f"http://127.0.0.1:{port}", scenarios, args.seconds, args.users, credentials, args.seed)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+    sys.exit(report.finish({"benchmark": "load", "parameters": parameters, "results": results}, args))
+
+if __name__ == "__main__":
+    main()
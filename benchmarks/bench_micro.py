@@ -0,0 +1,87 @@
+"""
+Micro-benchmarks: statistics and Excel export called directly
+
+Calls calculate_expense_statistics (lifetime summary, and the percentile
+endpoint's exact and approximate medians), calculate_filtered_statistics
+(one category over a year), calculate_timeseries (monthly) and
+export_expenses_to_excel repeatedly against a seeded database in one
+process, after one warm-up call each, so in-memory indexes are built.
+Reports p50/p95/p99 latency and calls per second as JSON and compares them
+with the stored baseline for the same parameters
+(benchmarks/baselines/micro.json); exits non-zero on a regression.
+
+    python -m benchmarks.bench_micro --rows 100000 --repeat 200 --export-repeat 3
+    python -m benchmarks.bench_micro --save-baseline
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from benchmarks import report
+from benchmarks.dataset import seeded_database, use_database
+
+def _time(function, repeat: int) -> dict:
+    function()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call_started = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return report.summarize(latencies, time.perf_counter() - started)
+
+def run(repeat: int, export_repeat: int) -> dict:
+    from app.columnar import snapshot
+    from app.database import SessionLocal
+    from app.excel_export import export_expenses_to_excel
+    from app.statistics import (
+        calculate_expense_statistics, calculate_filtered_statistics, calculate_percentiles, calculate_timeseries
+    )
+
+    def export():
+        os.unlink(export_expenses_to_excel(db))
+
+    db = SessionLocal()
+    try:
+        if snapshot is not None:
+            snapshot.ensure(db)
+        year = (datetime(2024, 1, 1), datetime(2025, 1, 1))
+        cases = {
+            "calculate_expense_statistics": (lambda: calculate_expense_statistics(db), repeat),
+            "calculate_percentiles exact": (lambda: calculate_percentiles(db, [50, 95, 99]), repeat),
+            "calculate_percentiles approx": (lambda: calculate_percentiles(db, [50, 95, 99], approximate=True), repeat),
+            "calculate_filtered_statistics Food, 1 year": (
+                lambda: calculate_filtered_statistics(db, *year, ["Food"]), repeat
+            ),
+            "calculate_timeseries month": (lambda: calculate_timeseries(db, "month"), repeat),
+            "export_expenses_to_excel": (export, export_repeat),
+        }
+        results = {}
+        for name, (function, times) in cases.items():
+            results[name] = _time(function, times)
+            print(f"{name:<44} p50 {results[name]['p50_ms']:9.2f} ms  p99 {results[name]['p99_ms']:9.2f} ms",
+                  file=sys.stderr)
+            # Each case gets a fresh transaction
+            db.rollback()
+        return results
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=200, help="Calls per statistics function")
+    parser.add_argument("--export-repeat", type=int, default=3, help="Calls of export_expenses_to_excel")
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    report.add_arguments(parser, "micro")
+    args = parser.parse_args()
+
+    use_database(seeded_database(args.data_dir, args.rows))
+    results = run(args.repeat, args.export_repeat)
+    parameters = {"rows": args.rows, "repeat": args.repeat, "export_repeat": args.export_repeat}
+    sys.exit(report.finish({"benchmark": "micro", "parameters": parameters, "results": results}, args))
+
+if __name__ == "__main__":
+    main()
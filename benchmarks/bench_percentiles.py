@@ -0,0 +1,118 @@
+"""
+Percentile benchmark: median by loading amounts vs the in-memory index
+
+For each database size, measures the median computed the previous way
+(stream every amount, np.median), the one-off cost of building the
+percentile index, the latency of exact and approximate p50/p90/p99 reads
+from it, and the cost of applying one edit. Each size runs in a fresh
+subprocess so the index's memory can be reported.
+
+    python -m benchmarks.bench_percentiles --sizes 100000 1000000
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.dataset import seed_database, use_database
+
+QUERIES = 1000
+
+def _per_call_ms(function, calls: int = QUERIES) -> dict:
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {"p50_ms": timings[len(timings) // 2], "p99_ms": timings[int(len(timings) * 0.99)]}
+
+def run_worker(db_path: str, repeat: int):
+    """Measure one database in this process and print a JSON result"""
+    use_database(db_path)
+    import numpy as np
+    from app.database import SessionLocal
+    from app.percentiles import PercentileIndex, PERCENTILE_ACCURACY
+    from app.statistics import load_amounts
+
+    db = SessionLocal()
+    try:
+        legacy = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            float(np.median(load_amounts(db), overwrite_input=True))
+            legacy.append(time.perf_counter() - started)
+
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        index = PercentileIndex(exact=True, relative_accuracy=PERCENTILE_ACCURACY)
+        started = time.perf_counter()
+        index.build(db)
+        build_seconds = time.perf_counter() - started
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        qs = [50, 90, 99]
+        exact = _per_call_ms(lambda: index.percentiles(db, qs))
+        exact_category = _per_call_ms(lambda: index.percentiles(db, qs, "Food"))
+        approx = _per_call_ms(lambda: index.percentiles(db, qs, approximate=True))
+        # Each change must follow the previous one's data version
+        versions = itertools.count(index._version + 1)
+        edit = _per_call_ms(lambda: index.apply([([(0, "Food", 12.34, None)], [(0, "Food", 12.34, None)], next(versions))]))
+        assert index.ready, "the index dropped itself while applying edits"
+    finally:
+        db.close()
+
+    print(json.dumps({
+        "legacy_median_ms": min(legacy) * 1000,
+        "build_ms": build_seconds * 1000,
+        "index_rss_mb": (peak_kb - baseline_kb) / 1024,
+        "exact": exact,
+        "exact_category": exact_category,
+        "approx": approx,
+        "edit": edit
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--worker", metavar="DB_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.repeat)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        db_path = os.path.join(args.data_dir, f"expenses_{size}.db")
+        if not os.path.exists(db_path):
+            print(f"Seeding {size} rows into {db_path}...", file=sys.stderr)
+            subprocess.run(
+                [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({db_path!r}, {size})"],
+                check=True
+            )
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_percentiles", "--repeat", str(args.repeat), "--worker", db_path],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = {"rows": size, **json.loads(output.strip().splitlines()[-1])}
+        results.append(result)
+        print(f"{size:>10} rows  load+np.median {result['legacy_median_ms']:8.1f} ms"
+              f"  build {result['build_ms']:8.1f} ms / {result['index_rss_mb']:6.1f} MB"
+              f"  exact {result['exact']['p50_ms']:.3f}/{result['exact']['p99_ms']:.3f} ms"
+              f"  approx {result['approx']['p50_ms']:.3f}/{result['approx']['p99_ms']:.3f} ms"
+              f"  edit {result['edit']['p50_ms']:.3f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Search benchmark: the FTS5 index vs a LIKE '%term%' scan
+
+Runs the queries behind GET /api/expenses/search against a seeded
+database (a first page of 50 hits, best match first and newest first) and
+the LIKE scan a client would otherwise need (newest 50 descriptions
+containing the text), for a common word, a rare one, a prefix, a phrase
+and a word combined with category and date filters. Also reports how
+long building the index takes and its size. Prints JSON and compares it
+with the stored baseline for the same parameters
+(benchmarks/baselines/search.json); exits non-zero on a regression.
+
+    python -m benchmarks.bench_search --rows 1000000 --repeat 50
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from benchmarks import report
+from benchmarks.dataset import seeded_database, use_database
+
+PAGE_SIZE = 50
+
+# (name, search query, LIKE pattern, filters)
+CASES = [
+    ("common word", "tesco", "%tesco%", {}),
+    ("rare word", "4821", "%4821%", {}),
+    ("prefix", "spec*", "%spec%", {}),
+    ("phrase", '"meal deal"', "%meal deal%", {}),
+    ("word + category + year", "greggs", "%greggs%",
+     {"categories": ["Food"], "start": datetime(2024, 1, 1), "end": datetime(2025, 1, 1)}),
+]
+
+def _like_query(pattern: str, start=None, end=None, categories=None):
+    from sqlalchemy import select
+    from app.models import Expense
+    from app.serialization import EXPENSE_COLUMNS
+
+    query = select(*EXPENSE_COLUMNS).where(Expense.description.like(pattern))
+    if start:
+        query = query.where(Expense.date >= start)
+    if end:
+        query = query.where(Expense.date < end)
+    if categories:
+        query = query.where(Expense.category.in_(categories))
+    return query.order_by(Expense.date.desc(), Expense.id.desc()).limit(PAGE_SIZE)
+
+def _time(db, query, repeat: int) -> dict:
+    db.execute(query).all()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call_started = time.perf_counter()
+        db.execute(query).all()
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return report.summarize(latencies, time.perf_counter() - started)
+
+def run(repeat: int) -> dict:
+    from sqlalchemy import func, select, text
+    from app import search
+    from app.database import SessionLocal
+    from app.models import Expense
+
+    db = SessionLocal()
+    try:
+        if not db.scalar(select(func.count()).where(Expense.description.like("Tesco%"))):
+            sys.exit("This database was seeded before merchant descriptions; delete it to reseed")
+        # Databases seeded before the search index existed get it here
+        search.ensure_search_index(db)
+
+        started = time.perf_counter()
+        search.rebuild(db)
+        db.commit()
+        rebuild_seconds = time.perf_counter() - started
+        pages = db.execute(text(
+            "SELECT sum(pgsize) FROM dbstat WHERE name LIKE :prefix"
+        ), {"prefix": f"{search.SEARCH_TABLE}%"}).scalar() if _has_dbstat(db) else None
+        print(f"index rebuilt in {rebuild_seconds:.1f} s" + (f", {pages / 2**20:.0f} MB" if pages else ""),
+              file=sys.stderr)
+
+        results = {}
+        for name, query, pattern, filters in CASES:
+            match = search.parse_query(query)
+            hits = db.scalar(select(func.count()).select_from(
+                search.search_query(match, limit=None, **filters).subquery()
+            ))
+            cases = {
+                f"{name}: fts relevance": search.search_query(match, limit=PAGE_SIZE, **filters),
+                f"{name}: fts date": search.search_query(match, order="date", limit=PAGE_SIZE, **filters),
+                f"{name}: like date": _like_query(pattern, **filters),
+            }
+            for label, statement in cases.items():
+                results[label] = {**_time(db, statement, repeat), "matches": hits}
+                print(f"{label:<44} p50 {results[label]['p50_ms']:9.2f} ms  ({hits} matches)", file=sys.stderr)
+            db.rollback()
+        return {"rebuild_seconds": rebuild_seconds, "index_bytes": pages, "queries": results}
+    finally:
+        db.close()
+
+def _has_dbstat(db) -> bool:
+    from sqlalchemy import text
+    try:
+        db.execute(text("SELECT 1 FROM dbstat LIMIT 1"))
+        return True
+    except Exception:
+        db.rollback()
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=50, help="Runs of each query")
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    report.add_arguments(parser, "search")
+    args = parser.parse_args()
+
+    use_database(seeded_database(args.data_dir, args.rows))
+    measured = run(args.repeat)
+    sys.exit(report.finish({
+        "benchmark": "search",
+        "parameters": {"rows": args.rows, "repeat": args.repeat},
+        "index": {"rebuild_seconds": measured["rebuild_seconds"], "bytes": measured["index_bytes"]},
+        "results": measured["queries"],
+    }, args))
+
+if __name__ == "__main__":
+    main()
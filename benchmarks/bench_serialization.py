@@ -0,0 +1,109 @@
+"""
+List serialization benchmark: ORM + response_model vs column tuples + orjson
+
+Calls GET /api/expenses/ in-process (ASGI, no network) for several page
+sizes and compares three ways of producing the same JSON:
+
+    legacy  the original handler: ORM objects returned through
+            response_model=List[ExpenseResponse]
+    model   fast=false: ORM objects validated with a TypeAdapter and
+            dumped by pydantic-core
+    fast    fast=true (default): plain column tuples encoded by orjson
+
+The response cache is disabled so every request does the full work.
+
+    python -m benchmarks.bench_serialization --rows 100000 --limits 100 1000 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.dataset import use_database
+
+def legacy_app():
+    """A minimal app serving the list endpoint as it was before the fast path"""
+    from typing import List
+    from fastapi import Depends, FastAPI
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.database import get_async_db
+    from app.models import Expense
+    from app.schemas import ExpenseResponse
+
+    app = FastAPI()
+
+    @app.get("/api/expenses/", response_model=List[ExpenseResponse])
+    async def get_expenses(limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+        query = select(Expense).order_by(Expense.date.desc(), Expense.id.desc()).limit(limit)
+        return (await db.execute(query)).scalars().all()
+
+    return app
+
+async def measure(limits, repeat: int):
+    import httpx
+    from app.database import init_db
+    from app.main import app
+
+    # ASGITransport does not run the lifespan, which is where the app does this
+    init_db()
+
+    clients = {
+        "legacy": (legacy_app(), ""),
+        "model": (app, "&fast=false"),
+        "fast": (app, "&fast=true"),
+    }
+    results = []
+    for limit in limits:
+        for name, (target, suffix) in clients.items():
+            transport = httpx.ASGITransport(app=target)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                url = f"/api/expenses/?limit={limit}{suffix}"
+                await client.get(url)
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    response = await client.get(url)
+                    timings.append(time.perf_counter() - started)
+                    response.raise_for_status()
+            result = {
+                "limit": limit,
+                "path": name,
+                "median_ms": statistics.median(timings) * 1000,
+                "bytes": len(response.content)
+            }
+            results.append(result)
+            print(f"limit {limit:>6}  {name:<7} {result['median_ms']:9.2f} ms  {result['bytes'] / 1024:9.1f} KB")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--limits", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    db_path = os.path.join(args.data_dir, f"expenses_{args.rows}.db")
+    if not os.path.exists(db_path):
+        print(f"Seeding {args.rows} rows into {db_path}...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({db_path!r}, {args.rows})"],
+            check=True
+        )
+    use_database(db_path)
+    os.environ["RESPONSE_CACHE_SIZE"] = "0"
+
+    results = asyncio.run(measure(args.limits, args.repeat))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Mixed read/write throughput under each SQLITE_PROFILE
+
+Copies a seeded database per profile and runs concurrent async clients
+doing 80% list reads and 20% expense creations through the app's own
+session and aggregate code for a fixed duration. It also times bare
+single-row commits, which is where the journal and sync settings bite.
+
+    python -m benchmarks.bench_sqlite_profile --rows 100000 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+
+from benchmarks.dataset import CATEGORIES, use_database
+
+PROFILES = ["none", "performance"]
+
+async def client(deadline: float, counts: dict, seed: int):
+    from sqlalchemy import select
+    from app.aggregates import record_added
+    from app.database import AsyncSessionLocal
+    from app.models import Expense
+
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        async with AsyncSessionLocal() as db:
+            if rng.random() < 0.8:
+                query = (
+                    select(Expense)
+                    .where(Expense.category == rng.choice(CATEGORIES))
+                    .order_by(Expense.date.desc(), Expense.id.desc())
+                    .limit(50)
+                )
+                (await db.execute(query)).scalars().all()
+                counts["reads"] += 1
+            else:
+                expense = Expense(amount=round(rng.uniform(1, 80), 2), category=rng.choice(CATEGORIES))
+                db.add(expense)
+                await db.flush()
+                await db.run_sync(record_added, [(expense.id, expense.category, expense.amount, expense.date)])
+                await db.commit()
+                counts["writes"] += 1
+
+async def run_clients(concurrency: int, seconds: float) -> dict:
+    counts = {"reads": 0, "writes": 0}
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client(deadline, counts, seed) for seed in range(concurrency)))
+    return counts
+
+def commit_rate(db_path: str, commits: int = 2000) -> float:
+    """Single-row insert transactions per second with the profile's pragmas"""
+    from app.database import SQLITE_PRAGMAS
+
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            connection.execute(f"PRAGMA {name}={value}")
+        connection.execute("CREATE TABLE bench_commits (value INTEGER)")
+        started = time.perf_counter()
+        for value in range(commits):
+            connection.execute("BEGIN")
+            connection.execute("INSERT INTO bench_commits VALUES (?)", (value,))
+            connection.execute("COMMIT")
+        elapsed = time.perf_counter() - started
+        connection.execute("DROP TABLE bench_commits")
+        return commits / elapsed
+    finally:
+        connection.close()
+
+def run_worker(profile: str, db_path: str, concurrency: int, seconds: float):
+    os.environ["SQLITE_PROFILE"] = profile
+    use_database(db_path)
+    counts = asyncio.run(run_clients(concurrency, seconds))
+    print(json.dumps({
+        "profile": profile,
+        "commits_per_second": commit_rate(db_path),
+        "reads_per_second": counts["reads"] / seconds,
+        "writes_per_second": counts["writes"] / seconds,
+        "ops_per_second": (counts["reads"] + counts["writes"]) / seconds
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    parser.add_argument("--worker", nargs=2, metavar=("PROFILE", "DB_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], args.concurrency, args.seconds)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    source = os.path.join(args.data_dir, f"expenses_{args.rows}.db")
+    if not os.path.exists(source):
+        print(f"Seeding {args.rows} rows into {source}...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({source!r}, {args.rows})"],
+            check=True
+        )
+
+    for profile in PROFILES:
+        db_path = os.path.join(args.data_dir, f"profile_{profile}.db")
+        shutil.copyfile(source, db_path)
+        # journal_mode is stored in the file; start every profile from SQLite's default
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("PRAGMA journal_mode=DELETE")
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_sqlite_profile", "--seconds", str(args.seconds),
+             "--concurrency", str(args.concurrency), "--worker", profile, db_path],
+            check=True, capture_output=True, text=True
+        ).stdout
+        print(output.strip().splitlines()[-1])
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Startup benchmark: time and memory to import app.main
+
+Imports the application in fresh interpreters and reports the median wall
+time and the peak RSS of the import, plus which heavy optional modules it
+loaded. Exits non-zero when the median time or the RSS exceeds its budget,
+or when a module that should load lazily (numpy, xlsxwriter, openpyxl) was
+imported.
+
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Loaded on first use of the statistics and export endpoints, never at import
+LAZY_MODULES = ("numpy", "xlsxwriter", "openpyxl")
+# Headroom over this 1-vCPU sandbox: a median import of 830 ms and 69 MB peak RSS
+IMPORT_BUDGET_MS = 950.0
+RSS_BUDGET_MB = 75.0
+
+# ru_maxrss survives exec, so it reports the parent's peak when that is
+# larger (under pytest, say); VmHWM belongs to the new process alone
+_MEASURE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+try:
+    with open("/proc/self/status") as status:
+        rss_kb = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+except OSError:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "import_ms": elapsed * 1000,
+    "rss_mb": rss_kb / 1024,
+    "loaded": [name for name in %r if name in sys.modules]
+}))
+""" % (LAZY_MODULES,)
+
+def measure_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _MEASURE], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure(runs: int, budget_ms: float = IMPORT_BUDGET_MS, budget_mb: float = RSS_BUDGET_MB) -> dict:
+    """Import app.main runs times against an empty DB_DIR; "passed" says whether it kept to the budgets"""
+    with tempfile.TemporaryDirectory() as db_dir:
+        env = {**os.environ, "DB_DIR": db_dir}
+        env.pop("DATABASE_URL", None)
+        env.pop("ASYNC_DATABASE_URL", None)
+        # The first import also compiles bytecode; leave it out
+        measure_once(env)
+        samples = [measure_once(env) for _ in range(runs)]
+
+    loaded = sorted({name for sample in samples for name in sample["loaded"]})
+    result = {
+        "runs": runs,
+        "import_ms_median": statistics.median(sample["import_ms"] for sample in samples),
+        "import_ms_max": max(sample["import_ms"] for sample in samples),
+        "rss_mb_max": max(sample["rss_mb"] for sample in samples),
+        "eagerly_loaded": loaded,
+        "budget_ms": budget_ms,
+        "budget_mb": budget_mb,
+    }
+    result["passed"] = (
+        result["import_ms_median"] <= budget_ms
+        and result["rss_mb_max"] <= budget_mb
+        and not loaded
+    )
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="Maximum median import time")
+    parser.add_argument("--budget-mb", type=float, default=RSS_BUDGET_MB, help="Maximum peak RSS after import")
+    args = parser.parse_args()
+
+    result = measure(args.runs, args.budget_ms, args.budget_mb)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Statistics benchmark: ORM full-table loading vs SQL aggregation
+
+Seeds databases of increasing size and measures latency and peak memory of
+the original ORM-based statistics functions against the current ones. Each
+measurement runs in a fresh subprocess so peak RSS is not shared.
+
+    python -m benchmarks.bench_statistics --sizes 100000 1000000 10000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.dataset import seed_database, use_database
+
+IMPLEMENTATIONS = ["legacy_summary", "summary", "legacy_category", "category"]
+
+def legacy_calculate_expense_statistics(db):
+    """calculate_expense_statistics as it was before SQL aggregation"""
+    import numpy as np
+    from app.models import Expense
+
+    expenses = db.query(Expense).all()
+    amounts = np.array([exp.amount for exp in expenses])
+    category_breakdown = {}
+    category_counts = {}
+    for expense in expenses:
+        category = expense.category
+        if category not in category_breakdown:
+            category_breakdown[category] = 0.0
+            category_counts[category] = 0
+        category_breakdown[category] += expense.amount
+        category_counts[category] += 1
+    return {
+        "total_expenses": float(np.sum(amounts)),
+        "total_count": len(expenses),
+        "average_expense": float(np.mean(amounts)),
+        "median_expense": float(np.median(amounts)),
+        "min_expense": float(np.min(amounts)),
+        "max_expense": float(np.max(amounts)),
+        "std_deviation": float(np.std(amounts)),
+        "category_breakdown": category_breakdown,
+        "category_counts": category_counts
+    }
+
+def legacy_calculate_category_statistics(db, category):
+    """calculate_category_statistics as it was before SQL aggregation"""
+    import numpy as np
+    from app.models import Expense
+
+    expenses = db.query(Expense).filter(Expense.category == category).all()
+    amounts = np.array([exp.amount for exp in expenses])
+    return {
+        "category": category,
+        "total": float(np.sum(amounts)),
+        "count": len(expenses),
+        "average": float(np.mean(amounts)),
+        "median": float(np.median(amounts)),
+        "min": float(np.min(amounts)),
+        "max": float(np.max(amounts))
+    }
+
+def run_worker(implementation: str, db_path: str, repeat: int):
+    """Measure one implementation in this process and print a JSON result"""
+    use_database(db_path)
+    from app.database import SessionLocal
+    from app.statistics import calculate_expense_statistics, calculate_category_statistics
+
+    functions = {
+        "legacy_summary": legacy_calculate_expense_statistics,
+        "summary": calculate_expense_statistics,
+        "legacy_category": lambda db: legacy_calculate_category_statistics(db, "Food"),
+        "category": lambda db: calculate_category_statistics(db, "Food"),
+    }
+    function = functions[implementation]
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            function(db)
+            timings.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "implementation": implementation,
+        "best_seconds": min(timings),
+        "peak_rss_delta_mb": (peak_kb - baseline_kb) / 1024
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy-above", type=int, default=None,
+                        help="Skip the ORM implementations above this many rows (they need several GB)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--worker", nargs=2, metavar=("IMPLEMENTATION", "DB_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], args.repeat)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        db_path = os.path.join(args.data_dir, f"expenses_{size}.db")
+        if not os.path.exists(db_path):
+            print(f"Seeding {size} rows into {db_path}...", file=sys.stderr)
+            subprocess.run(
+                [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({db_path!r}, {size})"],
+                check=True
+            )
+        for implementation in IMPLEMENTATIONS:
+            if implementation.startswith("legacy") and args.skip_legacy_above and size > args.skip_legacy_above:
+                continue
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_statistics", "--repeat", str(args.repeat),
+                 "--worker", implementation, db_path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = {"rows": size, **json.loads(output.strip().splitlines()[-1])}
+            results.append(result)
+            print(f"{size:>10} rows  {implementation:<16} {result['best_seconds'] * 1000:10.1f} ms"
+                  f"  {result['peak_rss_delta_mb']:8.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
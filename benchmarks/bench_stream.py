@@ -0,0 +1,128 @@
+"""
+Streaming benchmark: GET /stream vs paging through GET /api/expenses/
+
+Starts the app under uvicorn against a seeded database and pulls every
+expense once through the NDJSON and CSV streams and once by following
+X-Next-Cursor pages. Reports time to first byte, total time, throughput
+and the server's peak anonymous memory growth (sampled RssAnon, which
+leaves out SQLite's mmap of the database file) during each run.
+
+    python -m benchmarks.bench_stream --rows 1000000 --page-size 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.bench_concurrency import free_port, wait_until_up
+from benchmarks.dataset import use_database
+
+def anon_rss_mb(pid: int) -> float:
+    """Anonymous resident memory: excludes SQLite's mmap of the database file"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+async def sample_peak(pid: int, samples: list, interval: float = 0.02):
+    while True:
+        samples.append(anon_rss_mb(pid))
+        await asyncio.sleep(interval)
+
+async def pull_stream(session, url: str) -> dict:
+    started = time.perf_counter()
+    first_byte = None
+    size = lines = 0
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+    return {"ttfb_ms": first_byte * 1000, "seconds": time.perf_counter() - started, "bytes": size, "lines": lines}
+
+async def pull_pages(session, base_url: str, page_size: int) -> dict:
+    started = time.perf_counter()
+    first_byte = None
+    size = rows = 0
+    cursor = None
+    while True:
+        url = f"{base_url}/api/expenses/?limit={page_size}" + (f"&cursor={cursor}" if cursor else "")
+        async with session.get(url) as response:
+            response.raise_for_status()
+            body = await response.read()
+            cursor = response.headers.get("X-Next-Cursor")
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(body)
+        rows += len(json.loads(body))
+        if not cursor:
+            break
+    return {"ttfb_ms": first_byte * 1000, "seconds": time.perf_counter() - started, "bytes": size, "lines": rows}
+
+async def measure(base_url: str, pid: int, page_size: int) -> list:
+    runs = [
+        ("stream ndjson", lambda session: pull_stream(session, f"{base_url}/api/expenses/stream")),
+        ("stream csv", lambda session: pull_stream(session, f"{base_url}/api/expenses/stream?format=csv")),
+        (f"pages of {page_size}", lambda session: pull_pages(session, base_url, page_size)),
+    ]
+    results = []
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        await wait_until_up(session, base_url)
+        for name, run in runs:
+            baseline = anon_rss_mb(pid)
+            samples = []
+            sampler = asyncio.create_task(sample_peak(pid, samples))
+            try:
+                result = {"method": name, **await run(session)}
+            finally:
+                sampler.cancel()
+            result["server_peak_rss_delta_mb"] = max(samples) - baseline
+            results.append(result)
+            print(f"{name:<16} ttfb {result['ttfb_ms']:8.1f} ms  total {result['seconds']:7.1f} s"
+                  f"  {result['lines'] / result['seconds']:9.0f} rows/s  server peak +{result['server_peak_rss_delta_mb']:.1f} MB",
+                  file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=10_000)
+    parser.add_argument("--data-dir", default="/tmp/expense-bench")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    db_path = os.path.join(args.data_dir, f"expenses_{args.rows}.db")
+    if not os.path.exists(db_path):
+        print(f"Seeding {args.rows} rows into {db_path}...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, "-c", f"from benchmarks.dataset import seed_database; seed_database({db_path!r}, {args.rows})"],
+            check=True
+        )
+
+    use_database(db_path)
+    # Measure the work itself, not repeat hits on the response cache
+    os.environ["RESPONSE_CACHE_SIZE"] = "0"
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=os.environ.copy()
+    )
+    try:
+        results = asyncio.run(measure(f"http://127.0.0.1:{port}", server.pid, args.page_size))
+    finally:
+        server.terminate()
+        server.wait()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Synthetic expense data for benchmarks
+
+Seeds a SQLite database with realistic-looking expenses using batched core
+inserts, then rebuilds the derived aggregate tables. Also usable on its own:
+
+    python -m benchmarks.dataset --rows 1000000 --output /tmp/expense-bench/expenses_1000000.db
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+CATEGORIES = ["Food", "Transport", "Entertainment", "Shopping", "Bills", "Healthcare", "Education", "Other"]
+WEIGHTS = [40, 20, 10, 12, 8, 4, 3, 3]
+BATCH_SIZE = 50_000
+
+# Merchants and purchases per category, so descriptions read like bank statement lines
+MERCHANTS = {
+    "Food": ["Tesco Express", "Sainsbury's Local", "Aldi", "Greggs", "Pret A Manger", "Nando's", "Co-op"],
+    "Transport": ["Merseyrail", "Arriva Bus", "Trainline", "Uber", "Shell"],
+    "Entertainment": ["Odeon Cinema", "Spotify", "Netflix", "Steam", "Liverpool FC"],
+    "Shopping": ["Amazon", "Primark", "Argos", "Waterstones", "IKEA"],
+    "Bills": ["Octopus Energy", "United Utilities", "EE Mobile", "Virgin Media", "Council Tax"],
+    "Healthcare": ["Boots", "Superdrug", "Lloyds Pharmacy", "Specsavers"],
+    "Education": ["Udemy", "Blackwell's", "University Print Shop"],
+    "Other": ["Post Office", "Timpson", "Oxfam", "PayPal"],
+}
+ITEMS = {
+    "Food": ["groceries", "meal deal", "lunch", "coffee", "dinner", "weekly shop", "snacks"],
+    "Transport": ["day ticket", "return ticket", "ride", "fuel", "railcard"],
+    "Entertainment": ["tickets", "subscription", "game", "match day"],
+    "Shopping": ["order", "clothes", "books", "homeware", "gift"],
+    "Bills": ["direct debit", "monthly bill", "top-up"],
+    "Healthcare": ["prescription", "toiletries", "eye test"],
+    "Education": ["course", "textbooks", "printing"],
+    "Other": ["parcel", "key cutting", "donation", "transfer"],
+}
+
+def use_database(path: str):
+    """Point the app at a benchmark database; call before importing app modules"""
+    os.environ["DB_DIR"] = os.path.dirname(os.path.abspath(path))
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(path)}"
+
+def generate_rows(count: int, seed: int = 0, years: int = 3):
+    """Yield expense dicts with skewed categories spread over several years"""
+    rng = random.Random(seed)
+    end = datetime(2025, 1, 1)
+    span = years * 365 * 86400
+    for _ in range(count):
+        date = end - timedelta(seconds=rng.randrange(span))
+        amount = round(rng.lognormvariate(2.3, 0.9), 2) or 0.01
+        category = rng.choices(CATEGORIES, WEIGHTS)[0]
+        reference = rng.randrange(10_000)
+        merchants, items = MERCHANTS[category], ITEMS[category]
+        yield {
+            "amount": amount,
+            "category": category,
+            # e.g. "Tesco Express meal deal #4821"; the reference matches ~1 row in 10,000
+            "description": f"{merchants[reference % len(merchants)]} {items[reference // len(merchants) % len(items)]} #{reference}",
+            "date": date,
+            "created_at": date
+        }
+
+def seed_database(path: str, count: int, seed: int = 0, years: int = 3):
+    """Create a fresh database at path holding count expenses"""
+    if os.path.exists(path):
+        os.unlink(path)
+    use_database(path)
+
+    from sqlalchemy import insert
+    from app.database import SessionLocal, init_db
+    from app.models import Expense
+    from app import aggregates
+
+    init_db()
+    db = SessionLocal()
+    try:
+        batch = []
+        for row in generate_rows(count, seed, years):
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                db.execute(insert(Expense), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Expense), batch)
+        aggregates.rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+
+def seeded_database(data_dir: str, rows: int) -> str:
+    """Path of the shared benchmark database with rows expenses, seeding it on first use.
+
+    Seeding runs in a subprocess because the app binds its database URL at
+    import time.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"expenses_{rows}.db")
+    if not os.path.exists(path):
+        print(f"Seeding {rows} rows into {path}...", file=sys.stderr)
+        subprocess.run([sys.executable, "-m", "benchmarks.dataset", "--rows", str(rows), "--output", path], check=True)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--output", help="Database file to create (default: DB_DIR/expenses.db)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed; the same seed gives the same rows")
+    parser.add_argument("--years", type=int, default=3, help="Years of history the dates span")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(os.getenv("DB_DIR", "./data"), "expenses.db")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    seed_database(output, args.rows, args.seed, args.years)
+    print(f"Seeded {args.rows} expenses into {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Latency summaries and baseline comparison shared by the benchmarks
+
+Results are plain JSON: a benchmark name, its parameters, and one entry per
+measured operation holding the sample count, throughput and p50/p95/p99
+latency in milliseconds. Stored baselines live in benchmarks/baselines/;
+compare() flags operations whose latency grew, or whose throughput fell,
+by more than a tolerance, and any operation that failed requests. A run
+with failed requests is never stored as a baseline: its latencies include
+the failures.
+"""
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Sequence
+
+from benchmarks.bench_concurrency import percentile
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Metrics compared against a baseline: latency may not grow, throughput may not fall
+LATENCY_METRICS = ("p50_ms", "p95_ms")
+THROUGHPUT_METRIC = "per_second"
+# Operations with fewer samples on either side are too noisy to compare
+MIN_SAMPLES = 50
+
+def summarize(latencies_ms: Sequence[float], seconds: float, errors: int = 0) -> Dict:
+    """Count, throughput and p50/p95/p99 of latencies collected over seconds"""
+    if not latencies_ms:
+        return {"count": 0, "errors": errors, "per_second": 0.0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        "count": len(latencies_ms),
+        "errors": errors,
+        "per_second": len(latencies_ms) / seconds if seconds > 0 else 0.0,
+        "p50_ms": percentile(latencies_ms, 0.50),
+        "p95_ms": percentile(latencies_ms, 0.95),
+        "p99_ms": percentile(latencies_ms, 0.99),
+    }
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+def load_baseline(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(path: str, report: Dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of report against baseline, as readable lines; empty when none.
+
+    Operations missing from either side or with fewer than MIN_SAMPLES
+    samples are not compared, and neither are latencies below 1 ms (nor the throughput of operations that fast),
+    where timer noise dominates. Errors count as a regression whatever
+    the baseline says.
+    """
+    regressions = failures(report)
+    for operation, current in report["results"].items():
+        previous = baseline.get("results", {}).get(operation)
+        if previous is None or min(previous["count"], current["count"]) < MIN_SAMPLES:
+            continue
+        for metric in LATENCY_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None or old < 1.0:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append(f"{operation}: {metric} {old:.1f} -> {new:.1f}")
+        old, new = previous.get(THROUGHPUT_METRIC), current.get(THROUGHPUT_METRIC)
+        if old and new is not None and (previous.get("p50_ms") or 0) >= 1.0 and new < old / (1 + tolerance):
+            regressions.append(f"{operation}: {THROUGHPUT_METRIC} {old:.1f} -> {new:.1f}")
+    return regressions
+
+def failures(report: Dict) -> List[str]:
+    """Operations of report with failed requests, as readable lines"""
+    return [
+        f"{operation}: {result['errors']} errors"
+        for operation, result in report["results"].items() if result.get("errors")
+    ]
+
+def add_arguments(parser, name: str, tolerance: float = 0.5):
+    """--output, --baseline, --save-baseline and --tolerance for a benchmark named name"""
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", default=baseline_path(name),
+                        help="Baseline JSON to compare against (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=tolerance,
+                        help="Allowed relative slowdown before a metric counts as a regression")
+
+def finish(report: Dict, args) -> int:
+    """Print and store report, compare it with the baseline; returns the exit status"""
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        errors = failures(report)
+        for line in errors:
+            print(f"ERROR {line}", file=sys.stderr)
+        if errors:
+            print("Not stored as the baseline: requests failed", file=sys.stderr)
+            return 1
+        save_baseline(args.baseline, report)
+        return 0
+    baseline = load_baseline(args.baseline)
+    if baseline is None or baseline.get("parameters") != report.get("parameters"):
+        if baseline is not None:
+            print(f"Baseline {args.baseline} was measured with other parameters; not compared", file=sys.stderr)
+        regressions = failures(report)
+    else:
+        regressions = compare(report, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
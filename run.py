@@ -1,10 +1,72 @@
 #!/usr/bin/env python3
 """
 Run script for Expense Tracker
+
+    ./run.py                     development: one process, reloads on code changes
+    ./run.py --prod              production: one worker per CPU, no reloader
+    ./run.py --prod --workers 4
+
+The mode can also be set with RUN_MODE=prod, and the production settings
+with WEB_CONCURRENCY, HOST, KEEP_ALIVE, BACKLOG and ACCESS_LOG. In
+production the database schema is created once here, before the workers
+start, and uvloop/httptools are used when they are installed. With more
+than one worker the percentile index and the columnar snapshot are off
+unless PERCENTILE_INDEX and COLUMNAR_SNAPSHOT say otherwise (see README).
 """
-import uvicorn
+import argparse
+import importlib.util
 import os
 
+import uvicorn
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Expense Tracker server")
+    parser.add_argument("--prod", action="store_true", default=os.getenv("RUN_MODE", "dev") == "prod",
+                        help="Production mode (default from RUN_MODE=prod)")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8999")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+                        help="Worker processes in production mode (default: CPU count)")
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE", "30")),
+                        help="Seconds an idle keep-alive connection stays open")
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("BACKLOG", "2048")),
+                        help="Pending connections the listening socket queues")
+    parser.add_argument("--access-log", action="store_true", default=os.getenv("ACCESS_LOG", "0") == "1",
+                        help="Log every request in production mode")
+    args = parser.parse_args()
+
+    if not args.prod:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, reload=True)
+        return
+
+    if args.workers > 1:
+        # Each worker would keep its own index and snapshot and rebuild them
+        # from the whole table after every write made by another worker
+        os.environ.setdefault("PERCENTILE_INDEX", "off")
+        os.environ.setdefault("COLUMNAR_SNAPSHOT", "0")
+
+    # Create the schema, aggregates and session secret once; workers skip it
+    from app.database import init_db
+    from app.sessions import load_session_secret
+    init_db()
+    load_session_secret()
+    os.environ["EXPENSE_DB_INITIALIZED"] = "1"
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop" if _installed("uvloop") else "asyncio",
+        http="httptools" if _installed("httptools") else "h11",
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        access_log=args.access_log,
+        log_level="warning" if not args.access_log else "info"
+    )
+
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", "8999"))
-    uvicorn.run("app.main:app", host="127.0.0.1", port=port, reload=True)
+    main()
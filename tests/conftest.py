@@ -0,0 +1,41 @@
+"""
+Shared fixtures: the app served in-process against a throwaway database
+
+The app reads its configuration from the environment when it is imported,
+so the environment is set here before anything from app is imported.
+"""
+import os
+import shutil
+import tempfile
+
+DATA_DIR = tempfile.mkdtemp(prefix="expense-tracker-tests-")
+os.environ.update({
+    "DB_DIR": DATA_DIR,
+    "DATABASE_URL": f"sqlite:///{os.path.join(DATA_DIR, 'expenses.db')}",
+    "SESSION_SECRET": "tests",
+    "PERCENTILE_INDEX": "exact",
+    "COLUMNAR_SNAPSHOT": "1",
+    "GROUP_COMMIT": "0",
+})
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("EXPENSE_DB_INITIALIZED", None)
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+from app.main import app
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app, base_url="http://testserver/api/expenses") as client:
+        yield client
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+@pytest.fixture
+def db(client):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,95 @@
+"""
+Recompute what the app derives from the expenses table, straight from SQL
+
+assert_consistent() checks every derived structure against it: the
+aggregates and rollups, the search index, the percentile index, the
+columnar snapshot and the change feed.
+"""
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from app import aggregates, columnar, percentiles, search
+from app.models import Expense
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QS = [10, 50, 90, 99]
+
+def run_in_other_process(code: str):
+    """Run Python code in a separate interpreter on the same database, like another worker"""
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=os.environ, check=True)
+
+def create_expense(client, amount, category="Food", date="2024-03-01T12:00:00", **fields) -> dict:
+    response = client.post("/", json={"amount": amount, "category": category, "date": date, **fields})
+    assert response.status_code == 201, response.text
+    return response.json()
+
+def sql_amounts(db, *criteria) -> np.ndarray:
+    return np.sort(np.array(db.scalars(select(Expense.amount).where(*criteria)).all(), dtype=np.float64))
+
+def assert_summary_matches(summary: dict, amounts: np.ndarray):
+    assert summary["total_count"] == len(amounts)
+    if len(amounts) == 0:
+        return
+    assert summary["total_expenses"] == pytest.approx(amounts.sum())
+    assert summary["median_expense"] == pytest.approx(np.median(amounts))
+    assert summary["min_expense"] == pytest.approx(amounts.min())
+    assert summary["max_expense"] == pytest.approx(amounts.max())
+
+def assert_percentiles_match(client, db, category=None):
+    params = {"q": QS, **({"category": category} if category is not None else {})}
+    got = client.get("/stats/percentiles", params=params).json()["percentiles"]
+    criteria = [Expense.category == category] if category is not None else []
+    amounts = sql_amounts(db, *criteria)
+    want = np.percentile(amounts, QS) if len(amounts) else [0.0] * len(QS)
+    assert [got[f"p{q}"] for q in QS] == pytest.approx(list(want))
+
+def replay_change_feed(client, since: int = 0, limit: int = 10000) -> dict:
+    """Expenses by id changed after since, as the change feed leaves them"""
+    expenses = {}
+    while True:
+        feed = client.get("/changes", params={"since": since, "limit": limit}).json()
+        for entry in feed["changes"]:
+            if entry["op"] == "delete":
+                expenses.pop(entry["id"], None)
+            else:
+                expenses[entry["id"]] = entry["expense"]
+        since = feed["seq"]
+        if not feed["more"]:
+            return expenses
+
+def assert_consistent(client, db):
+    """Every structure derived from the expenses table agrees with a recompute from SQL"""
+    db.rollback()
+    assert aggregates.verify(db) == []
+    assert search.verify(db) == []
+    # The integrity check is an INSERT; release the write lock it took
+    db.rollback()
+
+    amounts = sql_amounts(db)
+    categories = sorted(set(db.scalars(select(Expense.category))))
+    assert_summary_matches(client.get("/stats/summary").json(), amounts)
+    for category in [None, *categories]:
+        assert_percentiles_match(client, db, category)
+    assert percentiles.index.ready
+
+    assert columnar.snapshot.ensure(db)
+    assert np.sort(columnar.snapshot.columns().amounts) == pytest.approx(amounts)
+    dates = sorted(db.scalars(select(Expense.date)))
+    if len(set(dates)) > 1:
+        start, end = dates[len(dates) // 4], dates[-1]
+        for selected in (None, categories[:1]):
+            params = {"start": start.isoformat(), "end": end.isoformat(), **({"category": selected} if selected else {})}
+            criteria = [Expense.date >= start, Expense.date < end]
+            if selected:
+                criteria.append(Expense.category.in_(selected))
+            assert_summary_matches(client.get("/stats/summary", params=params).json(), sql_amounts(db, *criteria))
+
+    rows = {expense_id: amount for expense_id, amount in db.execute(select(Expense.id, Expense.amount))}
+    assert {expense_id: entry["amount"] for expense_id, entry in replay_change_feed(client).items()} == rows
+    db.rollback()
@@ -0,0 +1,22 @@
+"""
+Running aggregates and rollups stay in step with single-expense writes
+"""
+from tests.helpers import assert_consistent, create_expense
+
+def test_create_update_delete(client, db):
+    created = [
+        create_expense(client, amount, category, f"2024-03-{day:02d}T09:30:00", description=f"lunch {amount}")
+        for day, (amount, category) in enumerate([(12.5, "Food"), (40, "Travel"), (7.25, "Food"), (99, "Bills"), (15, "Travel")], 1)
+    ]
+    assert_consistent(client, db)
+
+    first, second, third, fourth, _ = created
+    assert client.put(f"/{first['id']}", json={"amount": 55.5}).status_code == 200
+    assert client.put(f"/{second['id']}", json={"category": "Food"}).status_code == 200
+    assert client.put(f"/{third['id']}", json={"date": "2023-12-31T23:59:59"}).status_code == 200
+    assert client.put(f"/{fourth['id']}", json={"description": "electricity"}).status_code == 200
+    assert_consistent(client, db)
+
+    assert client.delete(f"/{first['id']}").status_code == 204
+    assert client.delete(f"/{fourth['id']}").status_code == 204
+    assert_consistent(client, db)
@@ -0,0 +1,72 @@
+"""
+Weekly budget: the current week and the history, from the rollups
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tests.helpers import ROOT, create_expense
+
+@pytest.mark.parametrize("limit", ["0", "-5", "nan"])
+def test_default_limit_must_be_positive(limit):
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.routers.budget"],
+        cwd=ROOT, env={**os.environ, "BUDGET_WEEKLY_LIMIT": limit}, capture_output=True, text=True
+    )
+    assert result.returncode != 0
+    assert "BUDGET_WEEKLY_LIMIT must be greater than 0" in result.stderr
+
+BUDGET = "http://testserver/api/budget"
+
+@pytest.fixture
+def budget(client):
+    assert client.put(f"{BUDGET}/", json={"weekly_limit": 70}).json() == {"weekly_limit": 70}
+    # Far enough ahead to be the newest weeks and months of the shared database
+    spend = [("2030-12-31T09:00:00", 20), ("2031-01-01T09:00:00", 30), ("2031-01-05T23:30:00", 10),
+             ("2031-01-06T00:30:00", 50), ("2031-02-03T09:00:00", 100)]
+    expenses = [create_expense(client, amount, "Budgeted", date) for date, amount in spend]
+    yield expenses
+    for expense in expenses:
+        client.delete(f"/{expense['id']}")
+
+def test_limit_is_saved_and_validated(client):
+    assert client.put(f"{BUDGET}/", json={"weekly_limit": 0}).status_code == 422
+    assert client.put(f"{BUDGET}/", json={"weekly_limit": 55.5}).status_code == 200
+    assert client.get(f"{BUDGET}/").json() == {"weekly_limit": 55.5}
+
+def test_week_spanning_new_year(client, budget):
+    week = client.get(f"{BUDGET}/current", params={"on": "2031-01-01"}).json()
+    assert (week["week_start"], week["week_end"]) == ("2030-12-30", "2031-01-05")
+    assert (week["iso_year"], week["iso_week"]) == (2031, 1)
+    assert (week["spent"], week["count"], week["remaining"]) == (60, 3, 10)
+    assert week["percent_used"] == pytest.approx(60 / 70 * 100)
+    assert [(day["day"], day["total"]) for day in week["days"]] == [
+        ("2030-12-31", 20), ("2031-01-01", 30), ("2031-01-05", 10)
+    ]
+    assert client.get(f"{BUDGET}/current", params={"on": "2030-12-30"}).json() == week
+
+def test_week_follows_updates_and_deletes(client, budget):
+    sunday = budget[2]
+    assert client.put(f"/{sunday['id']}", json={"date": "2031-01-06T08:00:00"}).status_code == 200
+    assert client.delete(f"/{budget[0]['id']}").status_code == 204
+    first = client.get(f"{BUDGET}/current", params={"on": "2031-01-01"}).json()
+    second = client.get(f"{BUDGET}/current", params={"on": "2031-01-06"}).json()
+    assert (first["spent"], first["count"]) == (30, 1)
+    assert (second["spent"], second["count"]) == (60, 2)
+
+def test_history_by_week_and_month(client, budget):
+    weeks = client.get(f"{BUDGET}/history", params={"limit": 3}).json()
+    assert [(week["period_start"], week["spent"], week["over_budget"]) for week in weeks] == [
+        ("2031-02-03", 100, True), ("2031-01-06", 50, False), ("2030-12-30", 60, False)
+    ]
+    assert weeks[0]["remaining"] == -30
+
+    months = client.get(f"{BUDGET}/history", params={"period": "month", "limit": 2}).json()
+    assert [(month["period_start"], month["period_end"], month["spent"]) for month in months] == [
+        ("2031-02-01", "2031-02-28", 100), ("2031-01-01", "2031-01-31", 90)
+    ]
+    # A month's budget is the weekly limit prorated over its days
+    assert [month["limit"] for month in months] == [pytest.approx(70 * 28 / 7), pytest.approx(70 * 31 / 7)]
+    assert client.get(f"{BUDGET}/history", params={"period": "year"}).status_code == 422
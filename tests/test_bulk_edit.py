@@ -0,0 +1,29 @@
+"""
+Set-based bulk inserts, updates and deletes keep derived data consistent
+"""
+from sqlalchemy import select
+
+from app.models import Expense
+
+from tests.helpers import assert_consistent
+
+def test_bulk_insert_update_delete(client, db):
+    rows = [
+        {"amount": round(1 + (i * 7919) % 500 / 3, 2), "category": ("Food", "Travel", "Fun")[i % 3],
+         "date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T08:00:00"}
+        for i in range(600)
+    ]
+    result = client.post("/bulk", json=rows).json()
+    assert result["inserted"] == 600
+    assert_consistent(client, db)
+
+    selection = {"categories": ["Fun"], "start": "2024-06-01T00:00:00", "end": "2024-09-01T00:00:00"}
+    dry_run = client.patch("/bulk", params={"dry_run": True}, json={**selection, "set": {"category": "Leisure"}}).json()
+    updated = client.patch("/bulk", json={**selection, "set": {"category": "Leisure", "amount": 3.5}}).json()
+    assert updated["matched"] == dry_run["matched"] > 0
+    assert_consistent(client, db)
+
+    ids = list(db.scalars(select(Expense.id).where(Expense.category == "Travel").limit(50)))
+    deleted = client.request("DELETE", "/bulk", json={"ids": ids}).json()
+    assert deleted["changed"] == len(ids)
+    assert_consistent(client, db)
@@ -0,0 +1,65 @@
+"""
+Data-version ETags, 304 answers and the in-process response cache
+"""
+import pytest
+
+from app.caching import CACHE_CONTROL, ResponseCache
+
+from tests.helpers import create_expense
+
+def test_summary_revalidates_until_a_write(client):
+    first = client.get("/stats/summary")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == CACHE_CONTROL
+
+    again = client.get("/stats/summary", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+
+    create_expense(client, 12.5, "Revalidated")
+    changed = client.get("/stats/summary", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["total_count"] == first.json()["total_count"] + 1
+
+@pytest.mark.parametrize("header", ['W/{etag}', '"other", {etag}', "*"])
+def test_if_none_match_forms(client, header):
+    etag = client.get("/categories").headers["ETag"]
+    assert client.get("/categories", headers={"If-None-Match": header.format(etag=etag)}).status_code == 304
+
+def test_etag_depends_on_the_parameters(client):
+    tags = {
+        client.get("/", params=params).headers["ETag"]
+        for params in ({}, {"limit": 5}, {"category": "Revalidated"}, {"limit": 5, "category": "Revalidated"})
+    }
+    assert len(tags) == 4
+    assert client.get("/", headers={"If-None-Match": client.get("/", params={"limit": 5}).headers["ETag"]}).status_code == 200
+
+def test_cached_page_keeps_its_cursor_and_sees_writes(client):
+    for day in range(1, 4):
+        create_expense(client, day, "Cached pages", f"2024-07-{day:02d}T12:00:00")
+    first = client.get("/", params={"category": "Cached pages", "limit": 2})
+    cached = client.get("/", params={"category": "Cached pages", "limit": 2})
+    assert cached.content == first.content
+    assert cached.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+    revalidated = client.get("/", params={"category": "Cached pages", "limit": 2},
+                             headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+
+    create_expense(client, 4, "Cached pages", "2024-07-04T12:00:00")
+    assert [expense["amount"] for expense in client.get("/", params={"category": "Cached pages", "limit": 2}).json()] == [4, 3]
+
+def test_response_cache_bounds():
+    cache = ResponseCache(max_entries=2, max_body_bytes=10, max_total_bytes=15)
+    cache.store('"a"', b"12345678")
+    cache.store('"too big"', b"12345678901")
+    assert list(cache._entries) == ['"a"']
+    cache.store('"b"', b"12345678")
+    # Over the total bytes: the least recently used entry goes
+    assert list(cache._entries) == ['"b"']
+    cache.store('"c"', b"1")
+    cache.store('"d"', b"2")
+    assert list(cache._entries) == ['"c"', '"d"']
+    assert cache._bytes == 2
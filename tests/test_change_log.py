@@ -0,0 +1,66 @@
+"""
+Pages of the change feed add up to the writes they cover
+"""
+import pytest
+from sqlalchemy import select
+
+from app.models import Expense
+
+from tests.helpers import assert_consistent, create_expense, replay_change_feed
+
+def apply_pages(client, since: int, limit: int, totals: dict) -> int:
+    """Patch count and total like the dashboard does, page by page; returns the pages read"""
+    pages = 0
+    while True:
+        feed = client.get("/changes", params={"since": since, "limit": limit}).json()
+        pages += 1
+        for change in feed["changes"]:
+            for state, sign in ((change["previous"], -1), (change["expense"], 1)):
+                if state is not None:
+                    totals["count"] += sign
+                    totals["total"] += sign * state["amount"]
+        assert feed["seq"] > since or not feed["more"]
+        since = feed["seq"]
+        if not feed["more"]:
+            return pages
+
+def test_pages_split_between_changes_of_one_expense(client, db):
+    kept = create_expense(client, 10, "Paged")
+    since = client.get("/changes").json()["seq"]
+    summary = client.get("/stats/summary").json()
+    totals = {"count": summary["total_count"], "total": summary["total_expenses"]}
+
+    # kept and added change on both sides of every small page boundary
+    added = create_expense(client, 3, "Paged")
+    for amount in (20, 30, 40):
+        assert client.put(f"/{kept['id']}", json={"amount": amount}).status_code == 200
+        create_expense(client, amount / 10, "Paged")
+        assert client.put(f"/{added['id']}", json={"amount": amount + 1}).status_code == 200
+    dropped = create_expense(client, 99, "Paged")
+    client.put(f"/{dropped['id']}", json={"amount": 98})
+    assert client.delete(f"/{dropped['id']}").status_code == 204
+    assert client.delete(f"/{added['id']}").status_code == 204
+
+    summary = client.get("/stats/summary").json()
+    for limit in (1, 2, 3, 5, 1000):
+        paged = dict(totals)
+        apply_pages(client, since, limit, paged)
+        assert paged["count"] == summary["total_count"]
+        assert paged["total"] == pytest.approx(summary["total_expenses"])
+
+        db.rollback()
+        rows = {expense_id: amount for expense_id, amount in db.execute(
+            select(Expense.id, Expense.amount).where(Expense.category == "Paged")
+        )}
+        replayed = replay_change_feed(client, since, limit)
+        assert {expense_id: entry["amount"] for expense_id, entry in replayed.items() if entry} == {
+            expense_id: amount for expense_id, amount in rows.items() if expense_id in replayed
+        }
+        assert added["id"] not in replayed and dropped["id"] not in replayed
+    assert_consistent(client, db)
+
+def test_pages_follow_the_limit(client, db):
+    since = client.get("/changes").json()["seq"]
+    rows = [{"amount": i + 1, "category": "Paged bulk"} for i in range(25)]
+    assert client.post("/bulk", json=rows).json()["inserted"] == 25
+    assert apply_pages(client, since, 10, {"count": 0, "total": 0.0}) == 3
@@ -0,0 +1,25 @@
+"""
+The columnar snapshot answers filtered analytics like SQL does
+"""
+from app import columnar, statistics
+
+from tests.helpers import assert_consistent, create_expense
+
+def test_offset_dates_are_stored_as_utc(client, db):
+    expense = create_expense(client, 17, "Offsets", "2030-01-01T00:30:00+02:00")
+    assert expense["date"] == "2029-12-31T22:30:00"
+    updated = client.put(f"/{expense['id']}", json={"date": "2030-01-02T00:00:00-05:00"}).json()
+    assert updated["date"] == "2030-01-02T05:00:00"
+
+    # The snapshot and SQL agree for naive and offset bounds, mixed too
+    assert columnar.snapshot.ensure(db)
+    for params in (
+        {"start": "2030-01-02T00:00:00"},
+        {"start": "2030-01-02T06:00:00+01:00"},
+        {"start": "2030-01-02T05:00:00Z", "end": "2030-01-03T00:00:00"},
+    ):
+        summary = client.get("/stats/summary", params={**params, "category": "Offsets"}).json()
+        assert summary["total_count"] == 1
+    assert statistics.filtered_summary(db, categories=["Offsets"])["count"] == 1
+    assert client.get("/stats/summary", params={"start": "2030-01-02T05:00:01Z", "category": "Offsets"}).json()["total_count"] == 0
+    assert_consistent(client, db)
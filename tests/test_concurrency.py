@@ -0,0 +1,67 @@
+"""
+The event loop keeps answering while exports are built
+"""
+import threading
+import time
+
+import pytest
+
+# Slowest /health response tolerated while an export runs
+HEALTH_BUDGET_SECONDS = 1.0
+
+@pytest.fixture(scope="module")
+def seeded(client):
+    rows = [
+        {"amount": round(1 + (i * 7919) % 10_000 / 7, 2), "category": f"Category {i % 25}",
+         "date": f"20{20 + i % 5}-{i % 12 + 1:02d}-{i % 28 + 1:02d}T12:00:00", "description": f"expense {i}"}
+        for i in range(30_000)
+    ]
+    for start in range(0, len(rows), 10_000):
+        assert client.post("/bulk", json=rows[start:start + 10_000]).json()["inserted"] == 10_000
+
+def poll_health(client, running: threading.Event) -> list:
+    """Seconds each /health request took while running was set"""
+    latencies = []
+    while running.is_set():
+        started = time.perf_counter()
+        response = client.get("http://testserver/health")
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        time.sleep(0.01)
+    return latencies
+
+def test_health_responds_during_excel_download(client, seeded):
+    running = threading.Event()
+    running.set()
+    responses = []
+
+    def download():
+        try:
+            responses.append(client.get("/export/excel"))
+        finally:
+            running.clear()
+
+    exporter = threading.Thread(target=download)
+    exporter.start()
+    latencies = poll_health(client, running)
+    exporter.join()
+
+    assert responses[0].status_code == 200
+    assert len(latencies) >= 3, "the export finished before /health was polled"
+    assert max(latencies) < HEALTH_BUDGET_SECONDS
+
+def test_health_responds_during_export_job(client, seeded):
+    # A write first, so the job is built rather than served from the cache
+    assert client.post("/", json={"amount": 123.45, "category": "Jobs"}).status_code == 201
+    job = client.post("/exports").json()
+    assert job["status"] != "done"
+
+    latencies = []
+    while job["status"] not in ("done", "failed"):
+        started = time.perf_counter()
+        assert client.get("http://testserver/health").status_code == 200
+        latencies.append(time.perf_counter() - started)
+        job = client.get(f"/exports/{job['job_id']}").json()
+        time.sleep(0.01)
+    assert job["status"] == "done", job["error"]
+    assert max(latencies) < HEALTH_BUDGET_SECONDS
@@ -0,0 +1,27 @@
+"""
+SQLite connection profile and background maintenance
+"""
+import asyncio
+
+from app import database
+
+def test_maintenance_loop_survives_a_failed_run(monkeypatch, caplog):
+    calls = []
+
+    def maintain_sqlite():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(database, "SQLITE_MAINTENANCE_INTERVAL", 0.01)
+    monkeypatch.setattr(database, "maintain_sqlite", maintain_sqlite)
+
+    async def scenario():
+        loop = asyncio.create_task(database.sqlite_maintenance_loop())
+        while len(calls) < 3 and not loop.done():
+            await asyncio.sleep(0.01)
+        loop.cancel()
+
+    asyncio.run(scenario())
+    assert len(calls) >= 3
+    assert "SQLite maintenance failed" in caplog.text
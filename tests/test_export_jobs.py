@@ -0,0 +1,116 @@
+"""
+Background export jobs build workbooks of the data they were started at
+"""
+import io
+import os
+import time
+
+import openpyxl
+import pytest
+from sqlalchemy import event
+
+from app import export_jobs, percentiles
+from app.bulk_import import bulk_insert
+from app.database import SessionLocal, engine
+from app.excel_export import export_expenses_to_excel
+from app.models import DataVersion
+
+from tests.helpers import create_expense
+
+def wait_for_export(client, job: dict) -> dict:
+    while job["status"] not in ("done", "failed"):
+        time.sleep(0.05)
+        job = client.get(f"/exports/{job['job_id']}").json()
+    assert job["status"] == "done", job["error"]
+    return job
+
+def workbook_statistics(workbook) -> dict:
+    return {row[0]: row[1] for row in workbook["Statistics"].iter_rows(min_row=2, values_only=True)}
+
+def export_statistics(client, job: dict) -> dict:
+    body = client.get(f"/exports/{job['job_id']}/download").content
+    return workbook_statistics(openpyxl.load_workbook(io.BytesIO(body), read_only=True))
+
+def test_export_statistics_match_the_summary(client):
+    # Pool workers compute statistics from the database, not from a
+    # percentile index of their own that no commit ever reaches
+    for amount in (5, 15, 25, 35):
+        create_expense(client, amount, "Exports")
+    statistics = export_statistics(client, wait_for_export(client, client.post("/exports").json()))
+    summary = client.get("/stats/summary").json()
+    assert statistics["Total Count"] == summary["total_count"]
+    assert statistics["Median Expense"] == pytest.approx(summary["median_expense"])
+
+    # Moving the cheaper half of the amounts moves the median
+    before = summary["median_expense"]
+    assert client.patch("/bulk", json={"max_amount": before, "set": {"amount": 10_000}}).json()["changed"] > 0
+    statistics = export_statistics(client, wait_for_export(client, client.post("/exports").json()))
+    assert statistics["Median Expense"] != pytest.approx(before)
+    assert statistics["Median Expense"] == pytest.approx(client.get("/stats/summary").json()["median_expense"])
+
+def data_version(db) -> int:
+    db.rollback()
+    return db.get(DataVersion, 1).version
+
+def test_export_is_labelled_with_the_version_it_read(client, db):
+    create_expense(client, 12, "Exports")
+    job = wait_for_export(client, client.post("/exports").json())
+    assert job["version"] == data_version(db)
+    assert export_statistics(client, job)["Data Version"] == job["version"]
+
+def test_build_reads_statistics_and_rows_from_one_snapshot(client, db, monkeypatch):
+    # As in a pool worker, statistics come from the database
+    monkeypatch.setattr(percentiles, "index", None)
+    create_expense(client, 7, "Snapshot")
+    raced = []
+
+    def commit_before_rows(conn, cursor, statement, parameters, context, executemany):
+        if raced or "ORDER BY expenses.date DESC" not in statement:
+            return
+        raced.append(True)
+        writer = SessionLocal()
+        try:
+            assert bulk_insert(writer, [(1, {"amount": 7777, "category": "Snapshot"})])["inserted"] == 1
+        finally:
+            writer.close()
+
+    job_id = export_jobs.job_id_for(data_version(db), format="xlsx", test="snapshot")
+    os.makedirs(export_jobs.EXPORT_CACHE_DIR, exist_ok=True)
+    event.listen(engine, "before_cursor_execute", commit_before_rows)
+    try:
+        _, version = export_jobs.build_export(job_id, "xlsx")
+    finally:
+        event.remove(engine, "before_cursor_execute", commit_before_rows)
+    assert raced
+    assert version == data_version(db) - 1
+
+    workbook = openpyxl.load_workbook(export_jobs.file_path(job_id), read_only=True)
+    statistics = workbook_statistics(workbook)
+    amounts = [row[4] for row in workbook["Expenses"].iter_rows(min_row=2, values_only=True)]
+    assert statistics["Total Count"] == len(amounts)
+    assert statistics["Total Expenses"] == pytest.approx(sum(amounts))
+    assert 7777 not in amounts
+    assert statistics["Data Version"] == version
+
+def test_a_job_claimed_by_another_process_is_not_built_again(client, db):
+    create_expense(client, 9, "Claimed")
+    job_id = export_jobs.job_id_for(data_version(db), format="xlsx")
+    os.makedirs(export_jobs.EXPORT_CACHE_DIR, exist_ok=True)
+    claim = f"{export_jobs.file_path(job_id)}.partial"
+    open(claim, "x").close()
+
+    job = client.post("/exports").json()
+    assert job["job_id"] == job_id
+    time.sleep(1)
+    assert client.get(f"/exports/{job_id}").json()["status"] == "running"
+    assert not os.path.exists(export_jobs.file_path(job_id))
+
+    # The other process finishes: its file replaces the partial one
+    scratch = SessionLocal()
+    try:
+        export_expenses_to_excel(scratch, claim)
+    finally:
+        scratch.close()
+    os.replace(claim, export_jobs.file_path(job_id))
+    job = wait_for_export(client, job)
+    assert "Data Version" not in export_statistics(client, job)
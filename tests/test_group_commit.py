@@ -0,0 +1,84 @@
+"""
+Group commit: queued writes share one transaction, failures stay with their caller
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app import crud, group_commit
+from app.database import AsyncSessionLocal
+from app.models import Expense
+from app.schemas import ExpenseCreate, ExpenseUpdate
+
+from tests.helpers import assert_consistent, create_expense
+
+@pytest.fixture
+def writer(monkeypatch):
+    """A group writer with a window long enough to batch everything submitted at once"""
+    writer = group_commit.GroupCommitWriter(window_ms=100, max_batch=128)
+    writer.batches = []
+    commit = writer._commit
+
+    async def counted(batch):
+        writer.batches.append(len(batch))
+        await commit(batch)
+
+    monkeypatch.setattr(writer, "_commit", counted)
+    monkeypatch.setattr(group_commit, "writer", writer)
+    return writer
+
+def run_writes(writer, *writes):
+    """Start writer, run every (operation, *args) through run_write at once, stop it; results or exceptions"""
+    async def scenario():
+        writer.start()
+        try:
+            async with AsyncSessionLocal() as db:
+                return await asyncio.gather(
+                    *(group_commit.run_write(db, operation, *args) for operation, *args in writes),
+                    return_exceptions=True
+                )
+        finally:
+            await writer.stop()
+    return asyncio.run(scenario())
+
+def test_burst_commits_once(client, db, writer):
+    created = run_writes(writer, *((crud.create_expense, ExpenseCreate(amount=1 + i, category="Grouped", date=f"2024-06-{i + 1:02d}T12:00:00")) for i in range(20)))
+    assert writer.batches == [20]
+    assert sorted(expense.amount for expense in created) == [1 + i for i in range(20)]
+    assert sorted(db.scalars(select(Expense.amount).where(Expense.category == "Grouped"))) == [1 + i for i in range(20)]
+    assert_consistent(client, db)
+
+def test_failed_write_is_reported_alone(client, db, writer):
+    kept = create_expense(client, 7, "Grouped failures")
+    outcomes = run_writes(
+        writer,
+        (crud.create_expense, ExpenseCreate(amount=1, category="Grouped failures", date="2024-06-01T12:00:00")),
+        (crud.update_expense, 10 ** 9, ExpenseUpdate(amount=2)),
+        (crud.update_expense, kept["id"], ExpenseUpdate(amount=8)),
+        (crud.delete_expense, 10 ** 9),
+    )
+    assert writer.batches == [4]
+    assert isinstance(outcomes[0], Expense)
+    assert isinstance(outcomes[1], HTTPException) and outcomes[1].status_code == 404
+    assert outcomes[2].amount == 8
+    assert isinstance(outcomes[3], HTTPException) and outcomes[3].status_code == 404
+    assert sorted(db.scalars(select(Expense.amount).where(Expense.category == "Grouped failures"))) == [1, 8]
+    assert_consistent(client, db)
+
+def test_stop_commits_what_is_queued(db, writer):
+    async def scenario():
+        writer.start()
+        async with AsyncSessionLocal() as session:
+            pending = [
+                asyncio.create_task(group_commit.run_write(session, crud.create_expense, ExpenseCreate(amount=3, category="Grouped stop", date="2024-06-01T12:00:00")))
+                for _ in range(5)
+            ]
+            await asyncio.sleep(0)
+            await writer.stop()
+            return await asyncio.gather(*pending)
+
+    assert len(asyncio.run(scenario())) == 5
+    assert not writer.running
+    assert len(db.scalars(select(Expense.id).where(Expense.category == "Grouped stop")).all()) == 5
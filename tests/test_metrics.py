@@ -0,0 +1,78 @@
+"""
+Request metrics are labelled by route template and served in the Prometheus text format
+"""
+import os
+import re
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import metrics
+
+from tests.helpers import create_expense
+
+def sample(text: str, name: str, **labels) -> float:
+    """Value of the series name whose labels include labels (0 when there is none)"""
+    wanted = {f'{key}="{value}"' for key, value in labels.items()}
+    for line in text.splitlines():
+        match = re.fullmatch(rf"{name}\{{(.*)\}} (\S+)", line)
+        if match and wanted <= set(match.group(1).split(",")):
+            return float(match.group(2))
+    return 0
+
+def scrape(client) -> str:
+    response = client.get("http://testserver/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    return response.text
+
+def test_requests_are_labelled_by_route_template(client):
+    ids = [create_expense(client, 3, "Metered")["id"] for _ in range(2)]
+    route = "/api/expenses/{expense_id}"
+    before = scrape(client)
+    for expense_id in ids:
+        assert client.get(f"/{expense_id}").status_code == 200
+    assert client.get("/999999999").status_code == 404
+    after = scrape(client)
+
+    count = lambda text, status: sample(text, "expense_http_requests_total", method="GET", route=route, status=status)
+    assert count(after, "200") - count(before, "200") == 2
+    assert count(after, "404") - count(before, "404") == 1
+    assert not {f"/api/expenses/{expense_id}" for expense_id in ids} & set(re.findall(r'route="([^"]*)"', after))
+    assert sample(after, "expense_http_request_duration_seconds_count", method="GET", route=route, worker=os.getpid()) >= 3
+    assert sample(after, "expense_db_queries_per_request_count", route=route) >= 3
+
+def test_unmatched_paths_share_one_label(client):
+    before = scrape(client)
+    for path in ("/no/such/page", "/another/missing/path"):
+        assert client.get(f"http://testserver{path}").status_code == 404
+    after = scrape(client)
+    labels = {"method": "GET", "route": metrics.UNMATCHED, "status": "404"}
+    assert sample(after, "expense_http_requests_total", **labels) - sample(before, "expense_http_requests_total", **labels) == 2
+    assert "/no/such/page" not in after
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("test_seconds", "Test", (0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe((("route", 'a"b\\c'),), value)
+    lines = histogram.render((("worker", "1"),))
+    assert lines[2:] == [
+        'test_seconds_bucket{route="a\\"b\\\\c",worker="1",le="0.1"} 1',
+        'test_seconds_bucket{route="a\\"b\\\\c",worker="1",le="1"} 3',
+        'test_seconds_bucket{route="a\\"b\\\\c",worker="1",le="+Inf"} 4',
+        'test_seconds_sum{route="a\\"b\\\\c",worker="1"} 6.05',
+        'test_seconds_count{route="a\\"b\\\\c",worker="1"} 4',
+    ]
+
+def test_server_timing_header():
+    async def item(request):
+        with metrics.phase("lookup"):
+            return PlainTextResponse(request.path_params["item_id"])
+
+    app = metrics.MetricsMiddleware(Starlette(routes=[Route("/items/{item_id}", item)]), server_timing=True)
+    response = TestClient(app).get("/items/7")
+    assert response.text == "7"
+    names = re.findall(r'(?:^|, )(\w+);', response.headers["server-timing"])
+    assert names == ["db", "lookup", "total"]
+    assert 'desc="0 queries, 0 rows"' in response.headers["server-timing"]
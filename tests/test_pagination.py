@@ -0,0 +1,61 @@
+"""
+Keyset cursors over the expense list
+"""
+import base64
+
+import pytest
+
+from tests.helpers import create_expense
+
+def encode(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def list_pages(client, category: str, limit: int) -> list:
+    """Every page of category, following X-Next-Cursor from the first"""
+    pages, cursor = [], None
+    while True:
+        response = client.get("/", params={"category": category, "limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append([expense["id"] for expense in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+def test_cursor_pages_cover_every_expense_once(client):
+    # Two expenses per date, so pages also break between rows of equal date
+    ids = [create_expense(client, 5 + i, "Cursor pages", f"2024-02-{i // 2 + 1:02d}T09:00:00")["id"] for i in range(7)]
+    expected = sorted(ids, key=lambda expense_id: (ids.index(expense_id) // 2, expense_id), reverse=True)
+
+    pages = list_pages(client, "Cursor pages", 3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [expense_id for page in pages for expense_id in page] == expected
+    assert list_pages(client, "Cursor pages", 100) == [expected]
+
+def test_cursor_matches_offset_paging(client):
+    for i in range(5):
+        create_expense(client, 1 + i, "Cursor offsets", f"2024-03-{i + 1:02d}T09:00:00")
+    first = client.get("/", params={"category": "Cursor offsets", "limit": 2})
+    second = client.get("/", params={"category": "Cursor offsets", "limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert second.json() == client.get("/", params={"category": "Cursor offsets", "limit": 2, "skip": 2}).json()
+
+
+def test_cursor_with_an_offset_is_read_as_utc(client):
+    for hour in (10, 12, 14):
+        create_expense(client, 1, "Cursor with offset", f"2024-04-01T{hour}:00:00")
+    # 14:00+02:00 is 12:00 UTC: the page starts after the 12:00 expense
+    cursor = encode("2024-04-01T14:00:00+02:00|0")
+    page = client.get("/", params={"category": "Cursor with offset", "cursor": cursor}).json()
+    assert [expense["date"] for expense in page] == ["2024-04-01T10:00:00"]
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    encode("2024-01-01T00:00:00"),
+    encode("yesterday|5"),
+    encode("2024-01-01T00:00:00|five"),
+    encode("2024-01-01T00:00:00|5|6"),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_bad_cursor_is_rejected(client, cursor):
+    response = client.get("/", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
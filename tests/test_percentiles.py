@@ -0,0 +1,64 @@
+"""
+The percentile index follows writes from this process and from others
+"""
+import numpy as np
+import pytest
+from sqlalchemy import event
+
+from app import percentiles
+from app.bulk_import import bulk_insert
+from app.database import SessionLocal, engine
+
+from tests.helpers import assert_consistent, assert_percentiles_match, create_expense, run_in_other_process, sql_amounts
+
+def set_amount_in_other_process(expense_id: int, amount: float):
+    run_in_other_process(
+        "from app import bulk_edit; from app.database import SessionLocal; from app.schemas import BulkExpenseUpdate; "
+        f"bulk_edit.update_expenses(SessionLocal(), BulkExpenseUpdate(ids=[{expense_id}], set={{'amount': {amount}}}))"
+    )
+
+def test_write_from_another_process_reaches_percentiles(client, db):
+    # Build the index in this process, then change an amount elsewhere: the
+    # count stays the same, so only the data version reveals the change
+    expense = create_expense(client, 20, "Remote")
+    for amount in (10, 30):
+        create_expense(client, amount, "Remote")
+    assert_percentiles_match(client, db, "Remote")
+    assert percentiles.index.ready
+
+    set_amount_in_other_process(expense["id"], 500)
+    db.rollback()
+    assert client.get("/stats/summary").json()["median_expense"] == pytest.approx(np.median(sql_amounts(db)))
+    assert_percentiles_match(client, db, "Remote")
+    assert_percentiles_match(client, db)
+
+    # A write from this process after one from another leaves a version gap
+    set_amount_in_other_process(expense["id"], 5)
+    create_expense(client, 1000, "Remote")
+    assert_consistent(client, db)
+
+def test_percentile_index_build_racing_a_commit(client, db):
+    # Commit a write between the index reading the data version and reading
+    # the amounts: the write must be counted exactly once
+    create_expense(client, 42, "Race")
+    percentiles.index.invalidate()
+    raced = []
+
+    def commit_before_amount_scan(conn, cursor, statement, parameters, context, executemany):
+        if raced or "ORDER BY expenses.category, expenses.amount" not in statement:
+            return
+        raced.append(True)
+        writer = SessionLocal()
+        try:
+            rows = [(1, {"amount": 4242, "category": "Race", "date": "2024-05-05T10:00:00"})]
+            assert bulk_insert(writer, rows)["inserted"] == 1
+        finally:
+            writer.close()
+
+    event.listen(engine, "before_cursor_execute", commit_before_amount_scan)
+    try:
+        assert_percentiles_match(client, db, "Race")
+    finally:
+        event.remove(engine, "before_cursor_execute", commit_before_amount_scan)
+    assert raced
+    assert_consistent(client, db)
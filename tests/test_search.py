@@ -0,0 +1,93 @@
+"""
+Full-text search: query parsing, ranking, filters and paging
+"""
+import pytest
+
+from app.search import parse_query
+
+from tests.helpers import create_expense
+
+@pytest.mark.parametrize("query, match", [
+    ("coffee", '"coffee"'),
+    ("cof*", '"cof"*'),
+    ('"flat white"', '"flat white"'),
+    ('"flat wh"*', '"flat wh"*'),
+    # Operators and column filters are searched for, not interpreted
+    ("tea AND NOT milk", '"tea" "AND" "NOT" "milk"'),
+    ("category:food", '"category:food"'),
+    ('say "hi', '"say" "hi"'),
+    ("x - y", '"x" "y"'),
+])
+def test_parse_query(query, match):
+    assert parse_query(query) == match
+
+@pytest.mark.parametrize("query", ["***", '""', "- -", "   "])
+def test_query_without_words_is_rejected(client, query):
+    with pytest.raises(ValueError):
+        parse_query(query)
+    response = client.get("/search", params={"q": query})
+    assert response.status_code == 400
+
+def search(client, q: str, **params) -> list:
+    response = client.get("/search", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_description_matches_rank_above_category_matches(client):
+    in_category = create_expense(client, 4, "Zebrafinch", description="weekly groceries")
+    in_description = create_expense(client, 9, "Pets", description="zebrafinch seed mix")
+    hits = search(client, "zebrafinch")
+    assert [hit["id"] for hit in hits] == [in_description["id"], in_category["id"]]
+    assert hits[0]["score"] > hits[1]["score"]
+
+    assert [hit["id"] for hit in search(client, "zebrafinch seed")] == [in_description["id"]]
+    assert len(search(client, "zebrafin*")) == 2
+    assert search(client, "zebrafinch OR groceries") == []
+
+def test_diacritics_and_case_are_ignored(client):
+    expense = create_expense(client, 3.2, "Cafés", description="Crème brûlée at the Quokkacafé")
+    for query in ("creme brulee", "CRÈME", "quokkacafe", "quokka*"):
+        assert [hit["id"] for hit in search(client, query)] == [expense["id"]], query
+
+def test_filters_by_category_and_date(client):
+    ids = {
+        (category, month): create_expense(client, 1, category, f"2024-{month:02d}-10T12:00:00", description="wombatfood")["id"]
+        for category in ("Wombat A", "Wombat B") for month in (1, 2, 3)
+    }
+    hits = search(client, "wombatfood", category=["Wombat A"], start="2024-02-01T00:00:00", end="2024-03-10T12:00:00")
+    assert [hit["id"] for hit in hits] == [ids[("Wombat A", 2)]]
+    hits = search(client, "wombatfood", category=["Wombat A", "Wombat B"], order="date")
+    newest_first = sorted(ids.items(), key=lambda item: (item[0][1], item[1]), reverse=True)
+    assert [hit["id"] for hit in hits] == [expense_id for _, expense_id in newest_first]
+
+def test_index_follows_updates_and_deletes(client):
+    expense = create_expense(client, 2, "Indexed", description="platypus ticket")
+    assert client.put(f"/{expense['id']}", json={"description": "echidna ticket"}).status_code == 200
+    assert search(client, "platypus") == []
+    assert [hit["id"] for hit in search(client, "echidna")] == [expense["id"]]
+    assert client.delete(f"/{expense['id']}").status_code == 204
+    assert search(client, "echidna") == []
+
+@pytest.mark.parametrize("params", [{}, {"order": "date"}, {"category": "Numbat"}])
+def test_pages_cover_every_hit_once(client, params):
+    if not search(client, "numbatsnack"):
+        for i in range(7):
+            # Repeats of the word spread the scores; equal ones are broken by id
+            create_expense(client, 1 + i, "Numbat", f"2024-05-{i + 1:02d}T12:00:00",
+                           description=" ".join(["numbatsnack"] * (i % 3 + 1)))
+    everything = [hit["id"] for hit in search(client, "numbatsnack", limit=100, **params)]
+    assert len(everything) == 7
+
+    pages, cursor = [], None
+    while True:
+        response = client.get("/search", params={"q": "numbatsnack", "limit": 3, **params, **({"cursor": cursor} if cursor else {})})
+        pages.append([hit["id"] for hit in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [expense_id for page in pages for expense_id in page] == everything
+
+def test_bad_search_cursor_is_rejected(client):
+    response = client.get("/search", params={"q": "numbatsnack", "cursor": "not a cursor!"})
+    assert response.status_code == 400
@@ -0,0 +1,101 @@
+"""
+Login sessions: expiry, logout and the background sweep
+"""
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import sessions
+
+def test_sweep_loop_survives_a_failed_sweep(monkeypatch, caplog):
+    calls = []
+
+    async def sweep():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return 0
+
+    monkeypatch.setattr(sessions, "SESSION_SWEEP_INTERVAL", 0.01)
+    monkeypatch.setattr(sessions.manager, "sweep", sweep)
+
+    async def scenario():
+        loop = asyncio.create_task(sessions.session_sweep_loop())
+        while len(calls) < 3 and not loop.done():
+            await asyncio.sleep(0.01)
+        loop.cancel()
+
+    asyncio.run(scenario())
+    assert len(calls) >= 3
+    assert "Sweeping expired sessions failed" in caplog.text
+
+ROOT_URL = "http://testserver"
+
+def session_token(client) -> str:
+    """The login token inside the signed session cookie (base64 JSON before the signature)"""
+    payload = client.cookies["session"].split(".")[0]
+    return json.loads(base64.b64decode(payload + "=" * (-len(payload) % 4)))["expense_session"]
+
+def test_login_and_logout(client):
+    response = client.post(f"{ROOT_URL}/login", data={"username": "user", "password": "password123"}, follow_redirects=False)
+    assert (response.status_code, response.headers["location"]) == (302, "/")
+    token = session_token(client)
+    try:
+        assert asyncio.run(sessions.manager.get(token)) == "user"
+        response = client.get(f"{ROOT_URL}/logout", follow_redirects=False)
+        assert (response.status_code, response.headers["location"]) == (302, "/login")
+        assert asyncio.run(sessions.manager.get(token)) is None
+    finally:
+        client.cookies.clear()
+
+def test_wrong_password_is_refused(client):
+    response = client.post(f"{ROOT_URL}/login", data={"username": "user", "password": "wrong"}, follow_redirects=False)
+    assert response.status_code == 401
+    assert "session" not in client.cookies
+
+@pytest.mark.parametrize("store", [sessions.SQLiteSessionStore, sessions.MemorySessionStore])
+def test_session_expires_after_ttl(client, store):
+    manager = sessions.SessionManager(store(), ttl=0.3, cache_size=16, cache_seconds=60)
+
+    async def scenario():
+        token = await manager.create("user")
+        alive = await manager.get(token)
+        await asyncio.sleep(0.4)
+        # Still cached, but past its expiry
+        return alive, await manager.get(token), await manager.sweep()
+
+    alive, expired, swept = asyncio.run(scenario())
+    assert (alive, expired) == ("user", None)
+    assert swept >= 1
+
+def test_sweep_deletes_only_expired_rows(client):
+    store = sessions.SQLiteSessionStore()
+    now = datetime.utcnow()
+
+    async def scenario():
+        await store.add("expired", "user", now - timedelta(seconds=1))
+        await store.add("live", "user", now + timedelta(hours=1))
+        swept = await store.sweep(now)
+        return swept, await store.get("expired"), await store.get("live")
+
+    swept, expired, live = asyncio.run(scenario())
+    assert swept >= 1
+    assert expired is None
+    assert live[0] == "user"
+
+def test_logout_elsewhere_reaches_this_process_after_cache_seconds(client):
+    store = sessions.SQLiteSessionStore()
+    manager = sessions.SessionManager(store, ttl=3600, cache_size=16, cache_seconds=0.2)
+
+    async def scenario():
+        token = await manager.create("user")
+        # Another worker ends the session in the shared table
+        await store.remove(sessions._hash(token))
+        cached = await manager.get(token)
+        await asyncio.sleep(0.3)
+        return cached, await manager.get(token)
+
+    assert asyncio.run(scenario()) == ("user", None)
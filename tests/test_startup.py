@@ -0,0 +1,13 @@
+"""
+Importing the app stays within the startup budget and leaves heavy modules for later
+"""
+from benchmarks import bench_startup
+
+def test_import_within_budget():
+    result = bench_startup.measure(runs=5)
+    assert result["eagerly_loaded"] == [], "numpy, xlsxwriter and openpyxl must load lazily"
+    if not result["passed"]:
+        # A busy moment slows a whole set of runs; a real regression fails both
+        result = bench_startup.measure(runs=5)
+    assert result["import_ms_median"] <= bench_startup.IMPORT_BUDGET_MS, result
+    assert result["rss_mb_max"] <= bench_startup.RSS_BUDGET_MB, result
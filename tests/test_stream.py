@@ -0,0 +1,54 @@
+"""
+Streaming a date range as NDJSON or CSV
+"""
+import csv
+import io
+import json
+
+import pytest
+
+@pytest.mark.parametrize("end", ["2024-01-01T00:00:00", "2023-12-31T00:00:00"])
+def test_end_not_after_start_is_rejected(client, end):
+    response = client.get("/stream", params={"start": "2024-01-01T00:00:00", "end": end})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "end must be after start"
+
+@pytest.fixture(scope="module")
+def streamed(client):
+    rows = [{"amount": 1 + i, "category": "Streamed", "description": f"row {i}, quoted \"{i}\"",
+             "date": f"2024-08-{i % 28 + 1:02d}T{i % 24:02d}:00:00"} for i in range(60)]
+    assert client.post("/bulk", json=rows).json()["inserted"] == 60
+    return client.get("/", params={"category": "Streamed", "limit": 1000}).json()
+
+def test_ndjson_stream_is_oldest_first(client, streamed):
+    response = client.get("/stream", params={"category": "Streamed"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == sorted(streamed, key=lambda expense: (expense["date"], expense["id"]))
+
+def test_range_is_start_inclusive_end_exclusive(client, streamed):
+    params = {"category": "Streamed", "start": "2024-08-05T00:00:00", "end": "2024-08-10T00:00:00"}
+    lines = [json.loads(line) for line in client.get("/stream", params=params).text.splitlines()]
+    expected = [expense for expense in streamed if "2024-08-05T00:00:00" <= expense["date"] < "2024-08-10T00:00:00"]
+    assert sorted(line["id"] for line in lines) == sorted(expense["id"] for expense in expected)
+
+def test_csv_stream_matches_ndjson(client, streamed):
+    response = client.get("/stream", params={"category": "Streamed", "format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    ndjson = [json.loads(line) for line in client.get("/stream", params={"category": "Streamed"}).text.splitlines()]
+    assert [(int(row["id"]), float(row["amount"]), row["description"], row["date"]) for row in rows] == [
+        (line["id"], line["amount"], line["description"], line["date"]) for line in ndjson
+    ]
+
+def test_stream_spans_several_chunks(client, streamed, monkeypatch):
+    from app.routers import expenses
+    monkeypatch.setattr(expenses, "STREAM_CHUNK_SIZE", 7)
+    lines = client.get("/stream", params={"category": "Streamed"}).text.splitlines()
+    assert len(lines) == len(streamed)
+
+def test_empty_range_streams_only_the_csv_header(client):
+    response = client.get("/stream", params={"category": "Not streamed", "format": "csv"})
+    assert response.text.splitlines() == ["id,amount,category,description,date,created_at"]
+    assert client.get("/stream", params={"category": "Not streamed"}).text == ""
@@ -0,0 +1,68 @@
+"""
+Concurrent writes to one expense are each applied once
+"""
+import asyncio
+import threading
+
+from app import group_commit
+from tests.helpers import assert_consistent, create_expense
+
+def concurrently(count: int, request) -> list:
+    """Status codes of count calls of request(i), released together"""
+    barrier = threading.Barrier(count)
+    statuses = [None] * count
+
+    def run(i):
+        barrier.wait()
+        statuses[i] = request(i).status_code
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+def test_concurrent_deletes_of_one_expense(client, db):
+    for _ in range(3):
+        expense = create_expense(client, 11, "Contended")
+        statuses = concurrently(5, lambda i: client.delete(f"/{expense['id']}"))
+        assert sorted(statuses) == [204, 404, 404, 404, 404]
+    assert_consistent(client, db)
+
+def test_concurrent_updates_of_one_expense(client, db):
+    expense = create_expense(client, 11, "Contended")
+    statuses = concurrently(
+        5, lambda i: client.put(f"/{expense['id']}", json={"amount": 100 + i, "category": f"Contended {i}"})
+    )
+    assert statuses == [200] * 5
+    assert_consistent(client, db)
+
+def test_update_racing_a_delete(client, db):
+    expense = create_expense(client, 11, "Contended")
+    statuses = concurrently(
+        6, lambda i: client.put(f"/{expense['id']}", json={"amount": 50 + i}) if i % 2 else client.delete(f"/{expense['id']}")
+    )
+    assert statuses.count(204) == 1
+    assert set(statuses) <= {200, 204, 404}
+    assert_consistent(client, db)
+
+def test_bulk_writes_queue_behind_other_writes():
+    async def scenario():
+        order = []
+        async with group_commit.write_lock():
+            bulk = asyncio.create_task(group_commit.run_write_in_executor(lambda db: order.append("bulk")))
+            await asyncio.sleep(0.05)
+            order.append("single")
+        await bulk
+        return order
+
+    assert asyncio.run(scenario()) == ["single", "bulk"]
+
+def test_concurrent_bulk_and_single_writes(client, db):
+    rows = [{"amount": 1 + i, "category": "Queued", "date": f"2024-05-{i % 28 + 1:02d}T12:00:00"} for i in range(50)]
+    statuses = concurrently(
+        8, lambda i: client.post("/bulk", json=rows) if i % 2 else client.post("/", json=rows[i])
+    )
+    assert statuses == [201, 200] * 4
+    assert_consistent(client, db)